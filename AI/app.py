@@ -1,24 +1,62 @@
 
+import os
+import time
+IMPORT_STARTED = time.perf_counter()
+
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import numpy as np
-import pandas as pd
 from datetime import datetime
-import pickle
 from description_analyzer import analyzer
+from keyword_matcher import KeywordMatcher
+from model_store import ModelStore
+from rules import RULES, RuleEngine
+from decision_log import decision_log
+from metrics import metrics
+from features import MAX_TIME_MS, MIN_TIME_MS, local_time_features, valid_timestamps
+from limits import limiter
+from velocity import VELOCITY_FEATURES, velocity_store
+from batcher import batcher
+from decision_cache import decision_cache
+from feedback import feedback_store
+from deadline import DEGRADED_REASONS, deadline_policy
+from registry import ModelRegistry
+from columnar import COLUMNAR_CONTENT_TYPE, REQUIRED_COLUMNS, decode_columns, encode_columns, response_columns
 
 app = Flask(__name__)
 CORS(app)
+app.wsgi_app = limiter.wsgi(app.wsgi_app)  # MAX_CONCURRENT_REQUESTS per worker, off by default
+
+# Load original ML model: a versioned, memory-mapped artifact written by train.py,
+# swapped for a newer version in the background when models/CURRENT changes.
+# Scoring uses the exact lookup table compiled by train.py when the artifact has
+# one, else the flattened forest; both are pandas-free.
+# MODEL_LOAD=background (default) loads it in a thread so the import returns
+# at once; until /ready says so, /predict scores with the rules alone.
+# MODEL_LOAD=sync loads it during the import.
+model_store = ModelStore.from_env()
+if os.environ.get('MODEL_LOAD', 'background') == 'sync':
+    print("Loading fraud detection model...")
+    if model_store.initial_load():
+        print(f"✅ Model loaded successfully! (version {model_store.version})")
+    else:
+        print(f"⚠️ Error loading model: {model_store.load_error}")
+else:
+    model_store.load_in_background()
+
+# Per-region / per-segment models, selected per request and loaded on demand,
+# with model_store as the shared fallback (MODEL_REGISTRY_DIR, off by default)
+model_registry = ModelRegistry.from_env(model_store)
+
+# Cold-start timings, from the first line of this module (reported by /ready and /metrics)
+startup = {'import_s': None, 'first_prediction_s': None}
 
-# Load original ML model
-print("Loading fraud detection model...")
-try:
-    with open('model.pkl', 'rb') as f:
-        model_data = pickle.load(f)
-    print("✅ Model loaded successfully!")
-except Exception as e:
-    print(f"⚠️ Error loading model: {e}")
-    model_data = None
+def first_prediction():
+    if startup['first_prediction_s'] is None:
+        startup['first_prediction_s'] = round(time.perf_counter() - IMPORT_STARTED, 4)
+
+def startup_stats():
+    return {**startup, 'model_load_s': model_store.stats()['load_s']}
 
 # ============================================
 # THRESHOLDS AND RULES CONFIGURATION
@@ -32,6 +70,10 @@ THRESHOLDS = {
     'MEDIUM_AMOUNT': 25000,         # > ₹25,000 = needs scrutiny
     'LOW_AMOUNT': 10000,            # < ₹10,000 = generally safe
     
+    # Amount against the user's own history (sketches.py)
+    'USER_AMOUNT_PERCENTILE': 0.99,   # above 99% of their past amounts = unusual for them
+    'USER_AMOUNT_MIN_HISTORY': 20,    # past transactions needed before that counts
+    
     # Time thresholds (hour in 24h format)
     'LATE_NIGHT_START': 0,           # 12:00 AM
     'LATE_NIGHT_END': 5,             # 5:00 AM
@@ -84,89 +126,259 @@ SAFE_KEYWORDS = {
 # Emergency services (these can be trusted even at night)
 EMERGENCY_SERVICES = ['hospital', 'ambulance', 'police', 'fire', 'emergency']
 
+# Rule table compiled once against THRESHOLDS
+rule_engine = RuleEngine(RULES, THRESHOLDS)
+
+# Velocity features that change with every transaction: its location's always,
+# its user's when it has a user_id (without one they are the no-history values)
+LOCATION_VELOCITY = frozenset(name for name in VELOCITY_FEATURES if name.startswith('location_'))
+USER_VELOCITY = frozenset(VELOCITY_FEATURES) - LOCATION_VELOCITY
+
+def decision_key(description, amount, location, hour, day_of_week, user_id, fast_model, model_tag=None):
+    """Everything a /predict decision depends on, as a decision_cache key
+
+    None if the decision reads velocity features this transaction changes
+    (a model trained with them, a rule on the user's amount history): a
+    repeated transaction would never get the same key, so it is not
+    cached. Otherwise the key is the request's inputs, plus the registry
+    model's (name, version) if one scored it.
+    """
+    used = rule_engine.fields.union(getattr(fast_model, 'feature_names', ()))
+    if not used.isdisjoint(LOCATION_VELOCITY) or (user_id is not None and not used.isdisjoint(USER_VELOCITY)):
+        return None
+    key = (description, amount, location, hour, day_of_week)
+    return key if model_tag is None else (*key, model_tag)
+
+# One automaton over our keyword lists and the analyzer's, so each description is scanned once
+keyword_matcher = KeywordMatcher({
+    'suspicious': SUSPICIOUS_KEYWORDS,
+    'safe': SAFE_KEYWORDS,
+    'emergency': EMERGENCY_SERVICES,
+    **analyzer.keyword_groups
+})
+
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({
         'status': 'healthy',
         'service': 'FraudGuard AI Service',
         'thresholds': THRESHOLDS,
+        'model': model_store.stats(),
+        'model_registry': model_registry.stats(),
+        'velocity': velocity_store.stats(),
+        'decision_log': decision_log.stats(),
         'timestamp': datetime.now().isoformat()
     })
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness, unlike /health (the process is up): 503 until the first model load finished
+
+    If that load failed the service still answers, with the rules alone, as it always has.
+    """
+    if not model_store.loaded.is_set():
+        status, code = 'loading', 503
+    else:
+        status, code = ('ready' if model_store.ready else 'rules_only'), 200
+    return jsonify({
+        'status': status,
+        'model_version': model_store.version,
+        'error': model_store.load_error,
+        'startup': startup_stats()
+    }), code
+
+@app.route('/rules/stats', methods=['GET'])
+def rules_stats():
+    return jsonify({'rules': rule_engine.stats()})
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return jsonify({
+        **metrics.snapshot(),
+        'concurrency': limiter.stats(),
+        'micro_batch': batcher.stats(),
+        'decision_cache': decision_cache.stats(),
+        'decision_log': decision_log.stats(),
+        'feedback': feedback_store.stats(),
+        'deadline': deadline_policy.stats(),
+        'model_registry': model_registry.stats(),
+        'startup': startup_stats()
+    })
+
+@app.route('/feedback', methods=['POST'])
+def feedback():
+    """Confirmed labels for past transactions: one object, a JSON list or {'feedback': [...]}
+
+    Each carries the /predict fields plus `fraud` (true or false); online.py learns from them.
+    """
+    try:
+        data = request.get_json()
+        items = data.get('feedback', [data]) if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            metrics.error('validation')
+            return jsonify({'error': 'Expected a transaction or a list of transactions'}), 400
+        try:
+            result = feedback_store.record(items)
+        except ValueError as e:
+            metrics.error('validation')
+            return jsonify({'error': str(e)}), 400
+        metrics.incr('feedback_labels', result['accepted'])
+        return jsonify(result)
+
+    except Exception as e:
+        metrics.error('feedback')
+        decision_log.log('ERROR', {'stage': 'feedback', 'error': str(e)})
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/predict', methods=['POST'])
 def predict():
+    timer = metrics.timer()
+    deadline = deadline_policy.start(request.headers.get(deadline_policy.header))
+    model_name = request.headers.get(model_registry.header)
     try:
         data = request.get_json()
-        
+    except Exception as e:
+        metrics.error('predict')
+        decision_log.log('ERROR', {'stage': 'predict', 'error': str(e)})
+        return jsonify({'error': str(e)}), 500
+
+    response, status = score_transaction(data, timer, deadline, model_name)
+    result = jsonify(response)
+    if status != 200:
+        return result, status
+    timer.lap('serialize')
+    timer.finish()
+    metrics.request('predict')
+    first_prediction()
+    return result
+
+def score_transaction(data, timer, deadline=None, model_name=None):
+    """Score one decoded /predict payload, returns (response body, HTTP status)
+
+    The model is the registry's pick for model_name (the X-Model header)
+    or the location, the main model otherwise (registry.py).
+
+    With a deadline (deadline.py), the description analysis and the model
+    are skipped when they would not fit in the time left, and the rules
+    decide alone; so they do, too, without a model. Either way the
+    response says `degraded: true`.
+    """
+    expected = batcher.arrive()  # on its way to the model, until it gets there or gives up
+    try:
         # Validate input
         required_fields = ['amount', 'location', 'time']
         for field in required_fields:
             if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
+                metrics.error('validation')
+                return {'error': f'Missing required field: {field}'}, 400
+        if not isinstance(data['location'], str):
+            metrics.error('validation')
+            return {'error': 'location must be a string'}, 400
         
         # Extract features
         amount = float(data['amount'])
         location = data['location']
         timestamp = float(data['time'])
         description = data.get('description', '').strip()
+        if not MIN_TIME_MS <= timestamp <= MAX_TIME_MS:
+            metrics.error('validation')
+            return {'error': 'time out of range'}, 400
         
         # Convert time to features
         dt = datetime.fromtimestamp(timestamp / 1000)
         hour = dt.hour
         day_of_week = dt.weekday()
         is_weekend = 1 if day_of_week >= 5 else 0
+        deadline_policy.inject('parse')
+        timer.lap('parse')
+        
+        # Recent activity of this user and location, then record this transaction
+        velocity = velocity_store.observe(data.get('user_id'), location, amount, timestamp)
+        feedback_store.remember(data.get('user_id'), timestamp, velocity)  # for a label posted to /feedback later
+        deadline_policy.inject('velocity')
+        timer.lap('velocity')
         
-        print(f"\n{'='*60}")
-        print(f"🔍 ANALYZING TRANSACTION")
-        print(f"{'='*60}")
-        print(f"💰 Amount: ₹{amount:,.2f}")
-        print(f"📍 Location: {location}")
-        print(f"⏰ Time: {hour:02d}:00 ({'LATE NIGHT' if hour < 5 or hour > 23 else 'DAYTIME'})")
-        print(f"📝 Description: '{description if description else 'NO DESCRIPTION'}'")
+        # A transaction seen before gets the decision it got then
+        # One model version for the whole request, even across a reload
+        fast_model, model_tag = model_registry.select(model_name, location)
+        cache_key = None
+        if decision_cache.enabled:
+            # Registry models are told apart by their tag in the key; only the main model empties the cache
+            generation = fast_model if model_tag is None else model_store.model
+            cache_key = decision_key(description, amount, location, hour, day_of_week, data.get('user_id'),
+                                     fast_model, model_tag)
+            if cache_key is None:
+                decision_cache.bypass()
+                cached = None
+            else:
+                cached = decision_cache.get(cache_key, generation, THRESHOLDS)
+            timer.lap('cache')
+            if cached is not None:
+                response, record = cached
+                decision = 'FRAUD' if response['fraud'] else 'SAFE'
+                if decision_log.sampled(decision):
+                    decision_log.log(decision, record)
+                return response, 200
+        
+        # Scan the description once for every keyword list
+        hits = keyword_matcher.scan(description)
         
-        # Get description analysis
-        desc_result = analyzer.predict(description, amount, hour)
+        # Get description analysis, unless it would not fit in the budget
+        degraded = None  # why the rules decide without the model, if they do
+        desc_result = {}
+        if deadline_policy.allows(deadline, 'description'):
+            started = time.perf_counter()
+            deadline_policy.inject('description')
+            desc_result = analyzer.predict(description, amount, hour, hits)
+            deadline_policy.observe('description', time.perf_counter() - started)
+            timer.lap('description')
+        else:
+            degraded = 'deadline'
+            timer.skip()
         
         # Get original ML prediction
         original_fraud = False
         original_confidence = 0.3
         
-        if model_data and 'location_encoder' in model_data:
+        if fast_model is None:
+            degraded = degraded or 'no_model'
+        elif degraded or not deadline_policy.allows(deadline, 'model'):
+            degraded = 'deadline'
+        else:
             try:
-                model = model_data['model']
-                scaler = model_data['scaler']
-                location_encoder = model_data['location_encoder']
-                feature_names = model_data['feature_names']
+                started = time.perf_counter()
+                deadline_policy.inject('model')
                 
                 # Encode location
-                try:
-                    location_code = location_encoder.transform([location])[0]
-                except:
-                    location_code = len(location_encoder.classes_) // 2
-                
-                # Create feature vector
-                features = pd.DataFrame([{
-                    'amount': amount,
-                    'location_code': location_code,
-                    'hour': hour,
-                    'day_of_week': day_of_week,
-                    'is_weekend': is_weekend
-                }])
-                
-                features = features[feature_names]
-                features_scaled = scaler.transform(features)
+                location_code = fast_model.lookup_location(location)
+                if location_code is None:
+                    location_code = fast_model.unknown_location_code
+                    metrics.incr('unknown_location_fallbacks')
+                timer.lap('location_encoding')
                 
-                # Predict
-                prediction = model.predict(features_scaled)[0]
-                probabilities = model.predict_proba(features_scaled)[0]
+                # Scale and predict, in one batch with concurrent requests
+                expected = False
+                probabilities = batcher.predict_proba_one(fast_model, amount, location_code, hour,
+                                                          day_of_week, is_weekend, velocity, timer=timer)
+                prediction = fast_model.classes[np.argmax(probabilities)]
+                timer.lap('predict_proba')
                 
                 original_fraud = bool(prediction)
                 original_confidence = float(probabilities[1]) if prediction == 1 else float(probabilities[0])
-                
-                print(f"🤖 ML Model: {'🚨 FRAUD' if original_fraud else '✅ SAFE'} ({original_confidence:.1%})")
+                deadline_policy.observe('model', time.perf_counter() - started)
                 
             except Exception as e:
-                print(f"⚠️ ML model error: {e}")
+                metrics.error('ml_model')
+                decision_log.log('ERROR', {'stage': 'ml_model', 'error': str(e)})
+                timer.skip()
+                degraded = 'model_error'
+        if degraded is not None:
+            deadline_policy.degraded(degraded)
+            if degraded != 'no_model':
+                cache_key = None  # a skipped or failed model is not a decision worth repeating
+        if expected:  # no model, or it failed before scoring: don't keep a batch waiting
+            expected = False
+            batcher.cancel()
         
         # ============================================
         # ENHANCED FRAUD DETECTION LOGIC
@@ -177,153 +389,58 @@ def predict():
         is_fraud = original_fraud
         
         # Check if description has suspicious keywords
-        suspicious_count = 0
-        for keyword in SUSPICIOUS_KEYWORDS:
-            if keyword in description.lower():
-                suspicious_count += 1
-                reasons.append(f"⚠️ Suspicious keyword: '{keyword}'")
+        suspicious_keywords = hits.keywords('suspicious')
+        suspicious_count = len(suspicious_keywords)
+        for keyword in suspicious_keywords:
+            reasons.append(f"⚠️ Suspicious keyword: '{keyword}'")
         
         # Check if description has safe keywords
-        safe_category = None
-        for category, keywords in SAFE_KEYWORDS.items():
-            if any(kw in description.lower() for kw in keywords):
-                safe_category = category
-                reasons.append(f"✅ Recognized as: {category}")
-                break
+        safe_category = hits.category('safe')
+        if safe_category:
+            reasons.append(f"✅ Recognized as: {safe_category}")
         
         # Check if it's an emergency service
-        is_emergency = any(emergency in description.lower() for emergency in EMERGENCY_SERVICES)
+        is_emergency = hits.any('emergency')
         if is_emergency:
             reasons.append(f"🏥 Emergency service detected")
         
         # ============================================
-        # RULE 1: EXTREME AMOUNT (> ₹2,00,000)
-        # ============================================
-        if amount > THRESHOLDS['EXTREME_AMOUNT']:
-            is_fraud = True
-            fraud_score = max(fraud_score, THRESHOLDS['FRAUD_CONFIDENCE_HIGH'])
-            reasons.append(f"🚨 EXTREME AMOUNT: ₹{amount:,.2f} (> ₹2,00,000)")
-            print(f"🚨 RULE 1 TRIGGERED: Extreme amount")
-        
-        # ============================================
-        # RULE 2: VERY HIGH AMOUNT (> ₹1,00,000) + LATE NIGHT
-        # ============================================
-        elif amount > THRESHOLDS['VERY_HIGH_AMOUNT'] and (hour < THRESHOLDS['LATE_NIGHT_END'] or hour > THRESHOLDS['EVENING_START']):
-            is_fraud = True
-            fraud_score = max(fraud_score, THRESHOLDS['FRAUD_CONFIDENCE_MEDIUM'])
-            reasons.append(f"🚨 Very high amount (₹{amount:,.2f}) during late night")
-            print(f"🚨 RULE 2 TRIGGERED: High amount + late night")
-        
-        # ============================================
-        # RULE 3: HIGH AMOUNT (> ₹50,000) + SUSPICIOUS KEYWORDS
-        # ============================================
-        elif amount > THRESHOLDS['HIGH_AMOUNT'] and suspicious_count > 0:
-            is_fraud = True
-            fraud_score = max(fraud_score, THRESHOLDS['FRAUD_CONFIDENCE_MEDIUM'])
-            reasons.append(f"🚨 High amount + {suspicious_count} suspicious keyword(s)")
-            print(f"🚨 RULE 3 TRIGGERED: High amount + suspicious keywords")
-        
-        # ============================================
-        # RULE 4: HIGH AMOUNT (> ₹50,000) + NO DESCRIPTION
-        # ============================================
-        elif amount > THRESHOLDS['HIGH_AMOUNT'] and not description:
-            is_fraud = True
-            fraud_score = max(fraud_score, THRESHOLDS['FRAUD_CONFIDENCE_LOW'])
-            reasons.append(f"⚠️ High amount with no description")
-            print(f"⚠️ RULE 4 TRIGGERED: High amount + no description")
-        
-        # ============================================
-        # RULE 5: MEDIUM AMOUNT (> ₹25,000) + LATE NIGHT + SUSPICIOUS
-        # ============================================
-        elif amount > THRESHOLDS['MEDIUM_AMOUNT'] and (hour < THRESHOLDS['LATE_NIGHT_END'] or hour > THRESHOLDS['EVENING_START']) and suspicious_count > 0:
-            is_fraud = True
-            fraud_score = max(fraud_score, THRESHOLDS['FRAUD_CONFIDENCE_LOW'])
-            reasons.append(f"⚠️ Medium amount + late night + suspicious keywords")
-            print(f"⚠️ RULE 5 TRIGGERED: Medium amount + late night + suspicious")
-        
-        # ============================================
-        # RULE 6: HEALTHCARE OVERRIDE (with limits)
-        # ============================================
-        if safe_category == 'healthcare' or is_emergency:
-            # Check if it's genuine healthcare with reasonable amount
-            if amount <= THRESHOLDS['HEALTHCARE_MAX_SAFE']:
-                # Genuine healthcare - SAFE
-                is_fraud = False
-                fraud_score = min(fraud_score, 0.1)
-                reasons.append(f"✅ Genuine healthcare expense (₹{amount:,.2f})")
-                print(f"✅ RULE 6: Healthcare override - SAFE")
-            else:
-                # Healthcare claim but amount too high - still FRAUD
-                is_fraud = True
-                fraud_score = max(fraud_score, 0.7)
-                reasons.append(f"🚨 Healthcare claim but amount too high: ₹{amount:,.2f}")
-                print(f"🚨 RULE 6: Healthcare claim but amount exceeds limit")
-        
-        # ============================================
-        # RULE 7: TRANSPORT OVERRIDE (Uber/Ola safe at any time)
-        # ============================================
-        elif safe_category == 'transport':
-            if amount <= THRESHOLDS['TRANSPORT_MAX_SAFE']:
-                # Normal transport - SAFE
-                is_fraud = False
-                fraud_score = min(fraud_score, 0.1)
-                reasons.append(f"✅ Transport expense (cab/uber)")
-                print(f"✅ RULE 7: Transport override - SAFE")
-            else:
-                # Transport but amount too high - suspicious
-                reasons.append(f"⚠️ Transport expense with unusually high amount")
-                print(f"⚠️ RULE 7: Transport but amount high - keeping ML prediction")
-        
-        # ============================================
-        # RULE 8: FOOD DELIVERY OVERRIDE
-        # ============================================
-        elif safe_category == 'food':
-            if amount <= THRESHOLDS['FOOD_MAX_SAFE']:
-                is_fraud = False
-                fraud_score = min(fraud_score, 0.1)
-                reasons.append(f"✅ Food delivery expense")
-                print(f"✅ RULE 8: Food override - SAFE")
-        
-        # ============================================
-        # RULE 9: BILLS OVERRIDE
-        # ============================================
-        elif safe_category == 'bills':
-            if amount <= THRESHOLDS['BILLS_MAX_SAFE']:
-                is_fraud = False
-                fraud_score = min(fraud_score, 0.15)
-                reasons.append(f"✅ Bill payment")
-                print(f"✅ RULE 9: Bills override - SAFE")
-        
-        # ============================================
-        # RULE 10: SUSPICIOUS KEYWORDS (even with safe categories)
+        # RULES 1-10 AND FINAL SAFETY CHECKS (see rules.py)
         # ============================================
-        if suspicious_count >= 2:
-            is_fraud = True
-            fraud_score = max(fraud_score, 0.8)
-            reasons.append(f"🚨 Multiple suspicious keywords detected")
-            print(f"🚨 RULE 10: Multiple suspicious keywords - FORCING FRAUD")
-        
-        # ============================================
-        # FINAL SAFETY CHECKS
-        # ============================================
-        
-        # Cap confidence between 0 and 1
-        fraud_score = max(0, min(1, fraud_score))
-        
-        # Very small amounts (< ₹1000) are almost never fraud
-        if amount < 1000 and not is_fraud:
-            fraud_score = min(fraud_score, 0.1)
+        tx = {
+            'amount': amount,
+            'hour': hour,
+            'has_description': bool(description),
+            'suspicious_count': suspicious_count,
+            'safe_category': safe_category,
+            'is_emergency': is_emergency,
+            'is_fraud': is_fraud,
+            'fraud_score': fraud_score,
+            **velocity
+        }
+        fired = rule_engine.evaluate(tx, reasons)
+        is_fraud, fraud_score = tx['is_fraud'], tx['fraud_score']
+        deadline_policy.inject('rules')
+        timer.lap('rules')
         
-        # Log final decision
-        print(f"\n{'='*60}")
-        print(f"📊 FINAL DECISION")
-        print(f"{'='*60}")
-        print(f"Result: {'🚨 FRAUD' if is_fraud else '✅ SAFE'}")
-        print(f"Confidence: {fraud_score:.1%}")
-        print(f"Reasons:")
-        for reason in reasons[-3:]:  # Show last 3 reasons
-            print(f"  • {reason}")
-        print(f"{'='*60}\n")
+        # Log final decision (sampled, written off the request path)
+        decision = 'FRAUD' if is_fraud else 'SAFE'
+        sampled = decision_log.sampled(decision)
+        if sampled or cache_key is not None:
+            record = {
+                'amount': amount,
+                'location': location,
+                'hour': hour,
+                'description': description,
+                'confidence': round(fraud_score, 3),
+                'ml': {'fraud': original_fraud, 'confidence': round(original_confidence, 3)},
+                'rules': [rule.name for rule in fired],
+                'reasons': reasons
+            }
+            if degraded:
+                record['degraded'] = degraded
+        if sampled:
+            decision_log.log(decision, record)
         
         # Prepare response
         response = {
@@ -337,15 +454,332 @@ def predict():
             'original_prediction': {
                 'fraud': original_fraud,
                 'confidence': round(original_confidence, 3)
-            }
+            },
+            'degraded': degraded is not None
         }
+        if cache_key is not None:
+            decision_cache.put(cache_key, generation, THRESHOLDS, (response, record))
+        deadline_policy.finish(deadline)
         
-        return jsonify(response)
+        return response, 200
         
     except Exception as e:
-        print(f"❌ Error: {e}")
+        metrics.error('predict')
+        decision_log.log('ERROR', {'stage': 'predict', 'error': str(e)})
+        return {'error': str(e)}, 500
+    finally:
+        if expected:
+            batcher.cancel()
+
+# ============================================
+# BATCH SCORING
+# ============================================
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """Score many transactions at once. Accepts a JSON list or {'transactions': [...]},
+    or packed columns (see columnar.py), answered in the same format"""
+    timer = metrics.timer()
+    deadline = deadline_policy.start(request.headers.get(deadline_policy.header))
+    model_name = request.headers.get(model_registry.header)
+    if request.mimetype == COLUMNAR_CONTENT_TYPE:
+        return predict_columns(timer, deadline, model_name)
+    try:
+        data = request.get_json()
+        transactions = data.get('transactions') if isinstance(data, dict) else data
+        if not isinstance(transactions, list):
+            metrics.error('validation')
+            return jsonify({'error': 'Expected a list of transactions'}), 400
+
+        # Validate input
+        required_fields = ['amount', 'location', 'time']
+        for i, item in enumerate(transactions):
+            for field in required_fields:
+                if field not in item:
+                    metrics.error('validation')
+                    return jsonify({'error': f'Missing required field: {field}', 'index': i}), 400
+            if not isinstance(item['location'], str):
+                metrics.error('validation')
+                return jsonify({'error': 'location must be a string', 'index': i}), 400
+        invalid = np.flatnonzero(~valid_timestamps([float(item['time']) for item in transactions]))
+        if len(invalid):
+            metrics.error('validation')
+            return jsonify({'error': 'time out of range', 'index': int(invalid[0])}), 400
+        timer.lap('batch.parse')
+
+        results = score_batch(transactions, timer, deadline, model_name)
+
+        result = jsonify({'count': len(results), 'results': results})
+        timer.lap('batch.serialize')
+        timer.finish('batch.total')
+        metrics.request('predict_batch', len(results))
+        first_prediction()
+        return result
+
+    except Exception as e:
+        metrics.error('predict_batch')
+        decision_log.log('ERROR', {'stage': 'predict_batch', 'error': str(e)})
         return jsonify({'error': str(e)}), 500
 
+def predict_columns(timer, deadline=None, model_name=None):
+    """/predict/batch for a packed columnar body: no per-row parsing or dicts on the way in or out"""
+    try:
+        try:
+            n, columns = decode_columns(request.get_data())
+            for name in REQUIRED_COLUMNS:
+                if name not in columns:
+                    raise ValueError(f'Missing required column: {name}')
+            for name in ('location', 'description', 'user_id'):
+                if not isinstance(columns.get(name, []), list):
+                    raise ValueError(f'Column {name} must be utf8')
+            amount = np.asarray(columns['amount'], dtype=np.float64)
+            timestamp = np.asarray(columns['time'], dtype=np.float64)
+            invalid = np.flatnonzero(~valid_timestamps(timestamp))
+            if len(invalid):
+                raise ValueError(f'time out of range (row {invalid[0]})')
+        except (ValueError, TypeError, KeyError) as e:
+            metrics.error('validation')
+            return jsonify({'error': f'Bad columnar body: {e}'}), 400
+        timer.lap('batch.parse')
+
+        if n:
+            descriptions = [d.strip() for d in columns['description']] if 'description' in columns else [''] * n
+            user_ids = [u or None for u in columns['user_id']] if 'user_id' in columns else [None] * n
+            body = encode_columns(response_columns(score_columns(
+                amount, timestamp, columns['location'], descriptions, user_ids, timer, deadline, model_name)))
+        else:
+            body = encode_columns({})
+        timer.lap('batch.serialize')
+        timer.finish('batch.total')
+        metrics.request('predict_batch', n)
+        first_prediction()
+        return app.response_class(body, mimetype=COLUMNAR_CONTENT_TYPE)
+
+    except Exception as e:
+        metrics.error('predict_batch')
+        decision_log.log('ERROR', {'stage': 'predict_batch', 'error': str(e)})
+        return jsonify({'error': str(e)}), 500
+
+def score_batch(transactions, timer=None, deadline=None, model_name=None, velocity=None):
+    """Vectorized equivalent of calling /predict once per transaction
+
+    velocity: the transactions' velocity features, if they were computed
+    elsewhere (score.py); otherwise they are observed here.
+    """
+    if not transactions:
+        return []
+    timer = timer or metrics.timer()
+    columns = score_columns(
+        np.array([float(t['amount']) for t in transactions], dtype=np.float64),
+        np.array([float(t['time']) for t in transactions], dtype=np.float64),
+        [t['location'] for t in transactions],
+        [t.get('description', '').strip() for t in transactions],
+        [t.get('user_id') for t in transactions],
+        timer,
+        deadline,
+        model_name,
+        velocity
+    )
+
+    # Prepare responses, same shape as /predict
+    is_fraud, fraud_score = columns['fraud'], columns['confidence']
+    original_fraud, original_confidence = columns['original_fraud'], columns['original_confidence']
+    reasons, features, safe_category = columns['reasons'], columns['features'], columns['category']
+    degraded = columns['degraded']
+    return [{
+        'fraud': bool(is_fraud[i]),
+        'confidence': round(float(fraud_score[i]), 3),
+        'description_analysis': {
+            'reasons': reasons[i],
+            'features': features[i],
+            'category': safe_category[i]
+        },
+        'original_prediction': {
+            'fraud': bool(original_fraud[i]),
+            'confidence': round(float(original_confidence[i]), 3)
+        },
+        'degraded': bool(degraded[i])
+    } for i in range(len(transactions))]
+
+def observe_velocity(user_ids, locations, amounts, times):
+    """Velocity features of transactions, as arrays, recording them in order in velocity_store"""
+    observed = [velocity_store.observe(user_id, loc, a, t) for user_id, loc, a, t in zip(user_ids, locations, amounts, times)]
+    return {name: np.array([v[name] for v in observed]) for name in VELOCITY_FEATURES}
+
+def score_columns(amount, timestamp, locations, descriptions, user_ids, timer=None, deadline=None, model_name=None,
+                  velocity=None):
+    """score_batch on columns: float64 arrays of amounts and times, lists of the rest
+
+    Descriptions are already stripped. Returns decision columns: 'fraud',
+    'confidence', 'original_fraud', 'original_confidence', 'degraded'
+    (arrays), 'reasons', 'features' and 'category' (one entry per
+    transaction). The deadline applies to the batch as a whole, like
+    score_transaction's to one transaction; model_name picks one registry
+    model for all of them, else each is routed by its location. velocity
+    as for score_batch.
+    """
+    n = len(amount)
+    timer = timer or metrics.timer()
+
+    # Extract features
+    amounts = amount.tolist()
+    times = timestamp.tolist()
+    hour, day_of_week = local_time_features(timestamp)
+    is_weekend = (day_of_week >= 5).astype(np.int64)
+    deadline_policy.inject('batch.parse')
+    timer.lap('batch.features')
+
+    # Scan each description once for every keyword list, then get description analysis if it fits the budget
+    hits = [keyword_matcher.scan(d) for d in descriptions]
+    degraded = None
+    desc_results = [{}] * n
+    if deadline_policy.allows(deadline, 'batch.description', n):
+        started = time.perf_counter()
+        deadline_policy.inject('batch.description')
+        desc_results = [analyzer.predict(d, a, int(h), k) for d, a, h, k in zip(descriptions, amounts, hour, hits)]
+        deadline_policy.observe('batch.description', time.perf_counter() - started, n)
+        timer.lap('batch.description')
+    else:
+        degraded = 'deadline'
+        timer.skip()
+
+    # Velocity features, recording the transactions in the order they were sent
+    if velocity is None:
+        velocity = observe_velocity(user_ids, locations, amounts, times)
+    deadline_policy.inject('batch.velocity')
+    timer.lap('batch.velocity')
+
+    # Get original ML prediction: one pass over the feature matrix of each model's rows
+    original_fraud = np.zeros(n, dtype=bool)
+    original_confidence = np.full(n, 0.3)
+
+    groups = []
+    if degraded is None and not deadline_policy.allows(deadline, 'batch.model', n):
+        degraded = 'deadline'
+    if degraded is None:
+        groups = model_registry.partition(model_name, locations)
+    degraded = np.full(n, degraded, dtype=object)  # per transaction from here on
+    for fast_model, rows in groups:
+        part = slice(None) if rows is None else rows
+        if fast_model is None:
+            degraded[part] = 'no_model'
+            continue
+        rejected = fast_model.rejects(amount)
+        if rejected[part].any():
+            # An amount the model rejects fails it for its own row only, as on /predict: score the others
+            rows = np.arange(n)[part]
+            bad, rows = rows[rejected[rows]], rows[~rejected[rows]]
+            metrics.error('ml_model')
+            decision_log.log('ERROR', {'stage': 'ml_model', 'error': 'Input X contains NaN or infinity.',
+                                       'rows': bad.tolist()})
+            degraded[bad] = 'model_error'
+            if not len(rows):
+                continue
+            part = rows
+        try:
+            started = time.perf_counter()
+            deadline_policy.inject('batch.model')
+
+            # Encode location, rare and unseen locations share the index's unknown id
+            codes = [fast_model.lookup_location(loc) for loc in (locations if rows is None else map(locations.__getitem__, rows))]
+            unknown = codes.count(None)
+            if unknown:
+                metrics.incr('unknown_location_fallbacks', unknown)
+                codes = [fast_model.unknown_location_code if c is None else c for c in codes]
+            location_code = np.array(codes, dtype=np.intp)
+            timer.lap('batch.location_encoding')
+
+            # Predict
+            probabilities = fast_model.predict_proba(amount[part], location_code, hour[part], day_of_week[part],
+                                                     is_weekend[part], {name: values[part] for name, values in velocity.items()})
+            prediction = fast_model.classes.take(np.argmax(probabilities, axis=1))
+
+            original_fraud[part] = prediction == 1
+            original_confidence[part] = np.where(prediction == 1, probabilities[:, 1], probabilities[:, 0])
+            deadline_policy.observe('batch.model', time.perf_counter() - started, len(codes))
+            timer.lap('batch.predict_proba')
+
+        except Exception as e:
+            metrics.error('ml_model')
+            decision_log.log('ERROR', {'stage': 'ml_model', 'error': str(e)})
+            timer.skip()
+            degraded[part] = 'model_error'
+    for reason in DEGRADED_REASONS:
+        count = int((degraded == reason).sum())
+        if count:
+            deadline_policy.degraded(reason, count)
+
+    # ============================================
+    # ENHANCED FRAUD DETECTION LOGIC (vectorized)
+    # ============================================
+
+    reasons = [[] for _ in range(n)]
+    fraud_score = original_confidence.copy()
+    is_fraud = original_fraud.copy()
+
+    # Check if description has suspicious keywords
+    suspicious_count = np.array([k.count('suspicious') for k in hits], dtype=np.int64)
+    for i in np.flatnonzero(suspicious_count):
+        for keyword in hits[i].keywords('suspicious'):
+            reasons[i].append(f"⚠️ Suspicious keyword: '{keyword}'")
+
+    # Check if description has safe keywords (first matching category wins)
+    safe_category = np.array([k.category('safe') for k in hits], dtype=object)
+    for i, category in enumerate(safe_category):
+        if category:
+            reasons[i].append(f"✅ Recognized as: {category}")
+
+    # Check if it's an emergency service
+    is_emergency = np.array([k.any('emergency') for k in hits], dtype=bool)
+    for i in np.flatnonzero(is_emergency):
+        reasons[i].append(f"🏥 Emergency service detected")
+
+    # RULES 1-10 and final safety checks, evaluated over the whole batch
+    arrays = rule_engine.evaluate_batch({
+        'amount': amount,
+        'hour': hour,
+        'has_description': np.array([bool(d) for d in descriptions]),
+        'suspicious_count': suspicious_count,
+        'safe_category': safe_category,
+        'is_emergency': is_emergency,
+        'is_fraud': is_fraud,
+        'fraud_score': fraud_score,
+        **velocity
+    }, reasons)
+    is_fraud, fraud_score = arrays['is_fraud'], arrays['fraud_score']
+    deadline_policy.inject('batch.rules')
+    timer.lap('batch.rules')
+
+    # Log decisions (sampled, written off the request path)
+    for i in range(n):
+        decision = 'FRAUD' if is_fraud[i] else 'SAFE'
+        if decision_log.sampled(decision):
+            decision_log.log(decision, {
+                'amount': amounts[i],
+                'location': locations[i],
+                'hour': int(hour[i]),
+                'description': descriptions[i],
+                'confidence': round(float(fraud_score[i]), 3),
+                'ml': {'fraud': bool(original_fraud[i]), 'confidence': round(float(original_confidence[i]), 3)},
+                'reasons': reasons[i],
+                'batch': True,
+                **({'degraded': degraded[i]} if degraded[i] else {})
+            })
+    deadline_policy.finish(deadline)
+
+    return {
+        'fraud': is_fraud,
+        'confidence': fraud_score,
+        'original_fraud': original_fraud,
+        'original_confidence': original_confidence,
+        'degraded': degraded.astype(bool),
+        'reasons': reasons,
+        'features': [result.get('features', {}) for result in desc_results],
+        'category': safe_category
+    }
+
+startup['import_s'] = round(time.perf_counter() - IMPORT_STARTED, 4)
+
 if __name__ == '__main__':
     print("\n🚀 FraudGuard AI Service Starting...")
     print(f"📊 Active Thresholds:")
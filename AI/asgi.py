@@ -0,0 +1,108 @@
+"""ASGI variant of the service: /predict natively, every other route through Flask
+
+    uvicorn asgi:application --port 5001 --workers 4
+    python serve.py --asgi
+
+The request body is read asynchronously, so a slow client holds a cheap
+coroutine instead of a worker thread. Scoring runs inline on the event
+loop: it is CPU-bound and well under a millisecond, so handing it to a
+thread pool would cost more than it saves. Responses are byte-for-byte
+what Flask's jsonify produces.
+"""
+import json
+
+from a2wsgi import WSGIMiddleware
+
+from app import app, first_prediction, model_registry, score_transaction
+from deadline import deadline_policy
+from decision_log import decision_log
+from limits import limiter
+from metrics import metrics
+
+flask_app = WSGIMiddleware(app)
+
+def _dumps(body):
+    # Same output as Flask's default JSON provider outside debug mode
+    return (json.dumps(body, sort_keys=True, separators=(',', ':')) + '\n').encode()
+
+async def _send(send, status, headers, body):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode(), value.encode()) for name, value in headers]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+def _header(scope, name):
+    name = name.lower().encode()
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+async def _read_body(receive):
+    """Whole request body, or None if the client went away"""
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+async def predict(scope, receive, send):
+    body = await _read_body(receive)
+    if body is None:
+        return
+
+    # Limit only once the body is in: waiting on the client does not take a slot
+    limited = limiter.applies(scope['path'])
+    if limited and not limiter.acquire():
+        await _send(send, *limiter.busy_response())
+        return
+    try:
+        timer = metrics.timer()
+        deadline = deadline_policy.start(_header(scope, deadline_policy.header))
+        model_name = _header(scope, model_registry.header)
+        try:
+            data = json.loads(body)
+        except Exception as e:
+            metrics.error('predict')
+            decision_log.log('ERROR', {'stage': 'predict', 'error': str(e)})
+            response, status = {'error': str(e)}, 500
+        else:
+            response, status = score_transaction(data, timer, deadline, model_name)
+
+        payload = _dumps(response)
+        if status == 200:
+            timer.lap('serialize')
+            timer.finish()
+            metrics.request('predict')
+            first_prediction()
+    finally:
+        if limited:
+            limiter.release()
+
+    await _send(send, status, [('Content-Type', 'application/json'),
+                               ('Content-Length', str(len(payload))),
+                               ('Access-Control-Allow-Origin', '*')], payload)
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            # Graceful shutdown: write out whatever decisions are still queued
+            decision_log.flush()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/predict' and scope['method'] == 'POST':
+        await predict(scope, receive, send)
+    else:
+        await flask_app(scope, receive, send)
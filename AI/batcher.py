@@ -0,0 +1,194 @@
+"""Micro-batching of concurrent single-transaction model calls
+
+Under load, several /predict requests of one worker reach the model at
+nearly the same time. Walking the flattened forest for one row costs
+almost as much as for a few dozen (the per-call work is the same numpy
+calls), so instead of each request calling predict_proba_one on its own,
+the first one to arrive opens a batch and waits up to `window_ms` for the
+others, or until `max_batch` rows are in. It then scores all of them in
+one predict_proba call and hands every caller its own row.
+
+Given the request's StageTimer, a row scored on its own records the
+`scaling` and `predict_proba` stages apart, as /predict always did; a
+batched row records its time until the batch closed as `batch_wait`,
+and the batch's scaling and inference are left to the caller's
+`predict_proba` lap.
+
+There is no collector thread: the request that opens a batch does the
+scoring, the ones that join it sleep until their row is ready. The
+opener only waits while other requests are known to be on their way to
+the model (`arrive()` / `cancel()` track them), so a lone request under
+low traffic never waits and goes straight to the model, as does every
+request when batching is off (MICRO_BATCH=0). Models that gain nothing
+from batching (the lookup table answers a single row faster) are never
+batched.
+"""
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from metrics import metrics
+
+class _Slot:
+    """One caller's row in a batch"""
+
+    __slots__ = ('args', 'arrived', 'closed', 'result', 'error', 'done')
+
+    def __init__(self, args):
+        self.args = args
+        self.arrived = time.perf_counter()
+        self.closed = None   # when the batch stopped waiting and went to the model
+        self.result = None
+        self.error = None
+        self.done = False
+
+
+class MicroBatcher:
+    """Coalesces concurrent predict_proba_one calls into predict_proba batches"""
+
+    def __init__(self, window_ms=2.0, max_batch=32, enabled=True):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.enabled = enabled and max_batch > 1
+        self.pending = 0             # requests on their way to the model
+        self.counts = {'batches': 0, 'batched_rows': 0, 'direct': 0, 'fallbacks': 0}
+        self.fill = [0] * (max_batch + 1)  # batches by number of rows
+        self._cond = threading.Condition()
+        self._batch = None           # slots of the batch being filled
+        self._model = None           # the model that batch is for
+
+    @classmethod
+    def from_env(cls):
+        """Configure from MICRO_BATCH (0 to bypass), MICRO_BATCH_WINDOW_MS and MICRO_BATCH_MAX"""
+        return cls(
+            window_ms=float(os.environ.get('MICRO_BATCH_WINDOW_MS', 2.0)),
+            max_batch=int(os.environ.get('MICRO_BATCH_MAX', 32)),
+            enabled=os.environ.get('MICRO_BATCH', '1') != '0'
+        )
+
+    def arrive(self):
+        """A request started scoring and will call predict_proba_one or cancel(); False when off"""
+        if not self.enabled:
+            return False
+        with self._cond:
+            self.pending += 1
+        return True
+
+    def cancel(self):
+        """An arrived request will not reach the model after all"""
+        with self._cond:
+            self.pending -= 1
+            self._cond.notify_all()
+
+    def predict_proba_one(self, model, amount, location_code, hour, day_of_week, is_weekend, velocity=None,
+                          arrived=True, timer=None):
+        """Class probabilities of one transaction, scored together with concurrent ones
+
+        Pass arrived=False for a request that did not call arrive(), and
+        the request's StageTimer to have the stages recorded.
+        """
+        args = (amount, location_code, hour, day_of_week, is_weekend, velocity)
+        if not self.enabled:
+            return self._direct(model, args, timer)
+
+        # A row that would fail the whole batch, or a model batching doesn't help, goes alone
+        alone = not getattr(model, 'coalesce', False) or not math.isfinite(amount)
+        slot = _Slot(args)
+        with self._cond:
+            if arrived:
+                self.pending -= 1
+                if alone and not self.pending:
+                    self._cond.notify_all()  # an open batch need not wait for this one
+            batch = self._batch
+            if alone:
+                batch = None
+            elif batch is not None and self._model is model and len(batch) < self.max_batch:
+                # Join the open batch and sleep until its opener has scored it
+                batch.append(slot)
+                self._cond.notify_all()
+                while not slot.done:
+                    self._cond.wait()
+                if timer is not None:
+                    timer.lap('batch_wait', slot.closed)
+                if slot.error is not None:
+                    raise slot.error
+                return slot.result
+            elif batch is not None or not self.pending:
+                # Nobody to wait for, or the open batch is full or for another model
+                batch = None
+            else:
+                batch = self._batch = [slot]
+                self._model = model
+                deadline = slot.arrived + self.window
+                while len(batch) < self.max_batch and self.pending:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                self._batch = self._model = None
+
+        if batch is None:
+            return self._direct(model, args, timer)
+
+        # Score outside the lock, so the next batch can fill in the meantime
+        closed = time.perf_counter()
+        for member in batch:
+            member.closed = closed
+        if timer is not None:
+            timer.lap('batch_wait', closed)
+        self._score(model, batch)
+        with self._cond:
+            for member in batch:
+                member.done = True
+            self._cond.notify_all()
+        self.counts['batches'] += 1
+        self.counts['batched_rows'] += len(batch)
+        self.fill[len(batch)] += 1
+        for member in batch:
+            metrics.observe('micro_batch.wait', closed - member.arrived)
+        if slot.error is not None:
+            raise slot.error
+        return slot.result
+
+    def _direct(self, model, args, timer):
+        """Score one row on its own"""
+        self.counts['direct'] += 1
+        if timer is None:
+            return model.predict_proba_one(*args)
+        row = model.scale_one(*args)
+        timer.lap('scaling')
+        return model.predict_proba_scaled(row)
+
+    def _score(self, model, batch):
+        columns = [np.array(column) for column in zip(*(member.args[:5] for member in batch))]
+        velocity = batch[0].args[5]
+        if velocity is not None:
+            velocity = {name: np.array([member.args[5][name] for member in batch]) for name in velocity}
+        try:
+            for member, row in zip(batch, model.predict_proba(*columns, velocity)):
+                member.result = row
+        except Exception:
+            # One bad row must not fail the others: score them one by one
+            self.counts['fallbacks'] += 1
+            for member in batch:
+                try:
+                    member.result = model.predict_proba_one(*member.args)
+                except Exception as e:
+                    member.error = e
+
+    def stats(self):
+        batches = self.counts['batches']
+        return {
+            'enabled': self.enabled,
+            'window_ms': self.window * 1000,
+            'max_batch': self.max_batch,
+            **self.counts,
+            'mean_fill': round(self.counts['batched_rows'] / batches, 2) if batches else 0.0,
+            'fill': {size: n for size, n in enumerate(self.fill) if n}
+        }
+
+# Create global instance
+batcher = MicroBatcher.from_env()
@@ -0,0 +1,445 @@
+"""Benchmark suite for the scoring pipeline, layer by layer
+
+    python bench.py                                   # synthetic corpus of 5000 transactions
+    python bench.py --size 50000 --output before.json
+    python bench.py --replay transactions.jsonl --output after.json --compare before.json
+
+Every layer of /predict is timed on its own, over the same corpus:
+
+    description.extract_features   DescriptionFraudAnalyzer.extract_features
+    description.predict            DescriptionFraudAnalyzer.predict
+    keywords.scan                  one pass of the shared keyword automaton
+    velocity.observe               velocity feature store read + update (amount sketch included)
+    sketches.observe               the per-user amount sketch alone
+    ml.features                    location encoding + scaling into a model row
+    ml.predict_proba               the forest (or its lookup table) on that row
+    rules                          RULES 1-10 and the final checks
+    flask./predict                 the whole request through Flask's test client
+    score_batch                    the vectorized batch path, per chunk of --batch-size
+
+--cold-start N starts N fresh interpreters and times, from `import app`:
+
+    startup.import                 until the import returns (model still loading)
+    startup.ready                  until the model is loaded and warmed (/ready)
+    startup.first_prediction       until the first /predict response
+
+--deadline MS runs /predict with a budget of MS milliseconds (deadline.py)
+and --delay milliseconds injected into each pipeline stage in turn, then
+into none, and reports the latency tail and the share of degraded
+(rules-only) answers:
+
+    deadline.<stage>               delay injected into that stage
+    deadline.none                  no delay: what the budget costs in accuracy
+
+The corpus is either replayed from a JSONL/CSV file of /predict payloads
+(the format score.py reads) or generated from the keyword lists, so it
+exercises THRESHOLDS and the rules the way real traffic would.
+
+Each layer reports throughput, mean/p50/p99 latency, and memory allocated
+per call. Allocation is measured with tracemalloc in a separate pass over
+--alloc-sample calls, because tracing slows every call down: peak bytes
+allocated while the call ran, and bytes still held after it returned.
+Results go to --output as JSON. --compare prints the change against an
+earlier run and exits with status 1 when any layer's p50 or p99 latency
+got worse by more than --tolerance.
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+# Keep the decision log out of the measurements (and off the terminal)
+os.environ.setdefault('DECISION_LOG_FILE', os.devnull)
+# Layers run over the same corpus repeatedly: cached decisions would hide the work measured
+os.environ.setdefault('DECISION_CACHE_SIZE', '0')
+# Measure a loaded model, not the rules-only answers given while it loads
+os.environ.setdefault('MODEL_LOAD', 'sync')
+
+with contextlib.redirect_stdout(sys.stderr):
+    import app
+    from app import (EMERGENCY_SERVICES, SAFE_KEYWORDS, SUSPICIOUS_KEYWORDS, THRESHOLDS,
+                     keyword_matcher, model_store, rule_engine, score_batch)
+    from deadline import STAGES, deadline_policy
+    from description_analyzer import analyzer
+    from features import local_time_features
+    from score import read_chunks, detect_format
+    from sketches import AmountSketches
+    from velocity import VELOCITY_FEATURES, VelocityStore, replay
+
+FILLER_WORDS = ['payment', 'to', 'for', 'order', 'monthly', 'ref', 'txn', 'online', 'shop', 'services']
+
+# ============================================
+# CORPUS
+# ============================================
+
+def synthetic_corpus(size, seed=0):
+    """/predict payloads mixing safe, suspicious, emergency and plain descriptions"""
+    rng = np.random.default_rng(seed)
+    safe = [word for words in SAFE_KEYWORDS.values() for word in words]
+    pools = [safe, SUSPICIOUS_KEYWORDS, EMERGENCY_SERVICES, FILLER_WORDS]
+    model = model_store.model
+    locations = (model.locations.names[:1000].tolist() if model is not None else ['NY']) + ['Mumbai', 'Delhi']
+    now = time.time() * 1000
+
+    corpus = []
+    for _ in range(size):
+        words = []
+        for _ in range(rng.integers(0, 5)):
+            pool = pools[rng.choice(len(pools), p=[0.45, 0.2, 0.05, 0.3])]
+            words.append(pool[rng.integers(len(pool))])
+        amount = float(rng.exponential(500) if rng.random() < 0.7 else rng.exponential(60000))
+        corpus.append({
+            'amount': round(amount, 2),
+            'location': locations[rng.integers(len(locations))],
+            'time': float(now - rng.uniform(0, 30 * 86400 * 1000)),
+            'description': ' '.join(words),
+            'user_id': f'user{rng.integers(max(1, size // 20))}'
+        })
+    return corpus
+
+def replayed_corpus(path, size=None):
+    """/predict payloads from a JSONL or CSV file, invalid rows skipped"""
+    corpus = []
+    for chunk in read_chunks(path, detect_format(path, 'jsonl'), 1000):
+        for _, row in chunk:
+            try:
+                corpus.append({
+                    'amount': float(row['amount']),
+                    'location': row['location'],
+                    'time': float(row['time']),
+                    'description': row.get('description') or '',
+                    'user_id': row.get('user_id') or None
+                })
+            except (KeyError, TypeError, ValueError):
+                continue
+            if size and len(corpus) >= size:
+                return corpus
+    return corpus
+
+# ============================================
+# LAYERS
+# ============================================
+
+def prepare(corpus):
+    """Per-transaction inputs of every layer, computed once up front"""
+    amounts = [t['amount'] for t in corpus]
+    descriptions = [t['description'].strip() for t in corpus]
+    hours, days = local_time_features([t['time'] for t in corpus])
+    hours, days = hours.tolist(), days.tolist()
+    velocity = replay([t['user_id'] for t in corpus], [t['location'] for t in corpus],
+                      amounts, [t['time'] for t in corpus])
+    velocity = [{name: float(velocity[name][i]) for name in VELOCITY_FEATURES} for i in range(len(corpus))]
+    return amounts, descriptions, hours, days, velocity
+
+def build_layers(corpus, batch_size):
+    """name -> (function, make_args, transactions per call); make_args builds fresh arguments"""
+    amounts, descriptions, hours, days, velocity = prepare(corpus)
+    fast_model = model_store.model
+    n = len(corpus)
+
+    layers = {
+        'description.extract_features': (analyzer.extract_features, lambda: [(d,) for d in descriptions], 1),
+        'description.predict': (analyzer.predict, lambda: list(zip(descriptions, amounts, hours)), 1),
+        'keywords.scan': (keyword_matcher.scan, lambda: [(d,) for d in descriptions], 1),
+    }
+
+    store = VelocityStore()
+    layers['velocity.observe'] = (store.observe, lambda: [
+        (t['user_id'], t['location'], t['amount'], t['time']) for t in corpus], 1)
+    layers['sketches.observe'] = (AmountSketches().observe, lambda: [(t['user_id'], t['amount']) for t in corpus], 1)
+
+    if fast_model is not None:
+        def ml_features(amount, location, hour, day_of_week, velocity):
+            code = fast_model.location_code(location)
+            return fast_model.scale_one(amount, code, hour, day_of_week, 1 if day_of_week >= 5 else 0, velocity)
+
+        ml_args = lambda: [(amounts[i], corpus[i]['location'], hours[i], days[i], velocity[i]) for i in range(n)]
+        rows = []
+        for args in ml_args():
+            row = ml_features(*args)
+            rows.append((row.copy() if isinstance(row, np.ndarray) else row,))
+        layers['ml.features'] = (ml_features, ml_args, 1)
+        layers['ml.predict_proba'] = (fast_model.predict_proba_scaled, lambda: rows, 1)
+        scores = [fast_model.predict_proba_scaled(*row) for row in rows]
+    else:
+        scores = [np.array([0.7, 0.3])] * n
+
+    hits = [keyword_matcher.scan(d) for d in descriptions]
+    def rule_args():
+        args = []
+        for i in range(n):
+            fraud = bool(scores[i][1] > scores[i][0])
+            args.append(({
+                'amount': amounts[i],
+                'hour': hours[i],
+                'has_description': bool(descriptions[i]),
+                'suspicious_count': hits[i].count('suspicious'),
+                'safe_category': hits[i].category('safe'),
+                'is_emergency': hits[i].any('emergency'),
+                'is_fraud': fraud,
+                'fraud_score': float(scores[i][1] if fraud else scores[i][0]),
+                **velocity[i]
+            }, []))
+        return args
+    layers['rules'] = (rule_engine.evaluate, rule_args, 1)
+
+    client = app.app.test_client()
+    layers['flask./predict'] = (lambda payload: client.post('/predict', json=payload),
+                                lambda: [(t,) for t in corpus], 1)
+
+    batches = lambda: [(corpus[i:i + batch_size],) for i in range(0, n, batch_size)]
+    layers['score_batch'] = (score_batch, batches, batch_size)
+    return layers
+
+# ============================================
+# MEASUREMENT
+# ============================================
+
+def measure(fn, make_args, per_call, warmup=200, alloc_sample=1000):
+    args_list = make_args()
+    for args in args_list[:warmup]:
+        fn(*args)
+
+    # Timing pass
+    args_list = make_args()
+    times = np.empty(len(args_list), dtype=np.int64)
+    clock = time.perf_counter_ns
+    start = clock()
+    for i, args in enumerate(args_list):
+        t0 = clock()
+        fn(*args)
+        times[i] = clock() - t0
+    elapsed = (clock() - start) / 1e9
+
+    # Allocation pass, on a sample
+    peaks, retained = [], []
+    tracemalloc.start()
+    try:
+        for args in make_args()[:alloc_sample]:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            fn(*args)
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(current - before)
+    finally:
+        tracemalloc.stop()
+
+    items = len(args_list) * per_call
+    return {
+        'calls': len(args_list),
+        'transactions_per_call': per_call,
+        'throughput_per_s': round(items / elapsed, 1),
+        'mean_us': round(float(times.mean()) / 1e3, 2),
+        'p50_us': round(float(np.percentile(times, 50)) / 1e3, 2),
+        'p99_us': round(float(np.percentile(times, 99)) / 1e3, 2),
+        'alloc_peak_bytes': int(np.mean(peaks)) if peaks else 0,
+        'alloc_retained_bytes': int(np.mean(retained)) if retained else 0
+    }
+
+COLD_START_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.model_store.wait()
+ready = time.perf_counter()
+app.app.test_client().post('/predict', json=json.loads(sys.argv[1]))
+done = time.perf_counter()
+print(json.dumps([imported - start, ready - start, done - start]))
+"""
+
+def cold_start(payload, runs):
+    """Import, readiness and first-prediction times of `runs` fresh processes"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = {**os.environ, 'MODEL_LOAD': 'background',
+           'PYTHONPATH': os.pathsep.join(filter(None, [here, os.environ.get('PYTHONPATH')]))}
+    times = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', COLD_START_SCRIPT, json.dumps(payload)], env=env,
+                             capture_output=True, text=True, check=True).stdout.strip().splitlines()[-1]
+        times.append(json.loads(out))
+    times = np.array(times) * 1e6
+    results = {}
+    for i, name in enumerate(('startup.import', 'startup.ready', 'startup.first_prediction')):
+        column = times[:, i]
+        results[name] = {
+            'calls': runs,
+            'transactions_per_call': 1,
+            'throughput_per_s': round(1e6 / float(column.mean()), 1),
+            'mean_us': round(float(column.mean()), 2),
+            'p50_us': round(float(np.percentile(column, 50)), 2),
+            'p99_us': round(float(np.percentile(column, 99)), 2),
+            'alloc_peak_bytes': 0,
+            'alloc_retained_bytes': 0
+        }
+    return results
+
+def deadline_harness(corpus, budget_ms, delay_ms):
+    """/predict under a budget with delay_ms injected into each stage in turn; results per stage"""
+    client = app.app.test_client()
+    headers = {deadline_policy.header: str(budget_ms)}
+    clock = time.perf_counter_ns
+    delays, results = deadline_policy.delays, {}
+    try:
+        for stage in (*STAGES, None):
+            deadline_policy.delays = {stage: delay_ms / 1000} if stage else {}
+            deadline_policy.estimates.clear()
+            degraded = deadline_policy.counts['degraded']
+            times = np.empty(len(corpus), dtype=np.int64)
+            start = clock()
+            for i, payload in enumerate(corpus):
+                t0 = clock()
+                client.post('/predict', json=payload, headers=headers)
+                times[i] = clock() - t0
+            elapsed = (clock() - start) / 1e9
+            results[f"deadline.{stage or 'none'}"] = {
+                'calls': len(corpus),
+                'transactions_per_call': 1,
+                'throughput_per_s': round(len(corpus) / elapsed, 1),
+                'mean_us': round(float(times.mean()) / 1e3, 2),
+                'p50_us': round(float(np.percentile(times, 50)) / 1e3, 2),
+                'p99_us': round(float(np.percentile(times, 99)) / 1e3, 2),
+                'p999_us': round(float(np.percentile(times, 99.9)) / 1e3, 2),
+                'max_us': round(float(times.max()) / 1e3, 2),
+                'degraded_share': round((deadline_policy.counts['degraded'] - degraded) / len(corpus), 4),
+                'alloc_peak_bytes': 0,
+                'alloc_retained_bytes': 0
+            }
+    finally:
+        deadline_policy.delays = delays
+    return results
+
+def run_metadata(corpus_source, size, seed):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'git_commit': commit or None,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'model_version': model_store.version,
+        'model_kind': type(model_store.model).__name__ if model_store.model is not None else None,
+        'thresholds_hash': hashlib.sha1(json.dumps(THRESHOLDS, sort_keys=True).encode()).hexdigest()[:12],
+        'corpus': {'source': corpus_source, 'size': size, 'seed': seed}
+    }
+
+# ============================================
+# REPORTING
+# ============================================
+
+def print_results(results):
+    print(f"{'layer':32s}{'tx/s':>12s}{'p50 µs':>10s}{'p99 µs':>10s}{'alloc B':>10s}")
+    for name, r in results.items():
+        print(f"{name:32s}{r['throughput_per_s']:12,.0f}{r['p50_us']:10.1f}{r['p99_us']:10.1f}{r['alloc_peak_bytes']:10,d}")
+
+def print_deadline_results(results, budget_ms, delay_ms):
+    print(f"\nBudget {budget_ms:g} ms, {delay_ms:g} ms injected per stage")
+    print(f"{'stage delayed':32s}{'p50 ms':>10s}{'p99 ms':>10s}{'p99.9 ms':>10s}{'max ms':>10s}{'degraded':>10s}")
+    for name, r in results.items():
+        print(f"{name:32s}{r['p50_us'] / 1e3:10.2f}{r['p99_us'] / 1e3:10.2f}{r['p999_us'] / 1e3:10.2f}"
+              f"{r['max_us'] / 1e3:10.2f}{r['degraded_share']:10.1%}")
+
+def compare(results, baseline, tolerance):
+    """Print changes against a baseline run; returns the layers that regressed"""
+    regressions = []
+    print(f"\n{'layer':32s}{'p50':>10s}{'p99':>10s}{'tx/s':>10s}{'alloc':>10s}")
+    for name, r in results.items():
+        old = baseline['results'].get(name)
+        if old is None:
+            print(f"{name:32s}{'(new)':>10s}")
+            continue
+        change = {key: (r[key] - old[key]) / old[key] if old[key] else 0.0
+                  for key in ('p50_us', 'p99_us', 'throughput_per_s', 'alloc_peak_bytes')}
+        worse = change['p50_us'] > tolerance or change['p99_us'] > tolerance
+        if worse:
+            regressions.append(name)
+        print(f"{name:32s}{change['p50_us']:+10.1%}{change['p99_us']:+10.1%}"
+              f"{change['throughput_per_s']:+10.1%}{change['alloc_peak_bytes']:+10.1%}{'  ⚠️' if worse else ''}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark each layer of the scoring pipeline')
+    parser.add_argument('--replay', help='JSONL/CSV file of /predict payloads to replay (default: synthetic)')
+    parser.add_argument('--size', type=int, default=5000, help='transactions in the corpus (default 5000)')
+    parser.add_argument('--seed', type=int, default=0, help='synthetic corpus seed (default 0)')
+    parser.add_argument('--layers', help='comma-separated layer names to run (default: all)')
+    parser.add_argument('--batch-size', type=int, default=256, help='transactions per score_batch call (default 256)')
+    parser.add_argument('--alloc-sample', type=int, default=1000, help='calls traced for allocations (default 1000)')
+    parser.add_argument('--cold-start', type=int, default=0, metavar='N',
+                        help='also time import and first prediction in N fresh processes (default 0)')
+    parser.add_argument('--deadline', type=float, default=0, metavar='MS',
+                        help='also run /predict under this budget with delays injected stage by stage (default 0: off)')
+    parser.add_argument('--delay', type=float, default=20, metavar='MS',
+                        help='delay injected into each stage with --deadline (default 20)')
+    parser.add_argument('--deadline-requests', type=int, default=500,
+                        help='/predict calls per delayed stage with --deadline (default 500)')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='earlier results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help='latency increase counted as a regression (default 0.10 = 10%%)')
+    args = parser.parse_args(argv)
+
+    if args.replay:
+        corpus = replayed_corpus(args.replay, args.size)
+        source = os.path.abspath(args.replay)
+    else:
+        corpus = synthetic_corpus(args.size, args.seed)
+        source = 'synthetic'
+    if not corpus:
+        sys.exit("No valid transactions in the corpus")
+
+    layers = build_layers(corpus, args.batch_size)
+    selected = args.layers.split(',') if args.layers else list(layers)
+    unknown = [name for name in selected if name not in layers]
+    if unknown:
+        sys.exit(f"Unknown layers: {', '.join(unknown)} (choose from {', '.join(layers)})")
+
+    print(f"Benchmarking {len(corpus)} transactions ({source}), model {model_store.version}\n", file=sys.stderr)
+    results = {}
+    for name in selected:
+        fn, make_args, per_call = layers[name]
+        with contextlib.redirect_stdout(sys.stderr):
+            results[name] = measure(fn, make_args, per_call, alloc_sample=args.alloc_sample)
+    if args.cold_start:
+        results.update(cold_start(corpus[0], args.cold_start))
+    print_results(results)
+    if args.deadline:
+        with contextlib.redirect_stdout(sys.stderr):
+            deadlines = deadline_harness(corpus[:args.deadline_requests], args.deadline, args.delay)
+        print_deadline_results(deadlines, args.deadline, args.delay)
+        results.update(deadlines)
+
+    report = {'meta': run_metadata(source, len(corpus), None if args.replay else args.seed), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✅ Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for key in ('thresholds_hash', 'model_version', 'corpus'):
+            if baseline['meta'].get(key) != report['meta'][key]:
+                print(f"ℹ️ {key} differs from the baseline run: {baseline['meta'].get(key)} -> {report['meta'][key]}")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n⚠️ Slower than the baseline by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
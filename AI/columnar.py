@@ -0,0 +1,185 @@
+"""Packed columnar bodies for /predict/batch (Content-Type: application/x-fraudguard-columns)
+
+Parsing a large JSON batch means a float parse and a dict per transaction
+before any scoring starts. In this format every numeric column is one
+contiguous little-endian array, read with np.frombuffer straight out of
+the request body (no copy, no per-row parsing), and strings are an
+offsets array plus one UTF-8 buffer, the way Arrow lays them out.
+
+Layout (all integers little-endian):
+
+    magic       4 bytes    b'FGC1'
+    length      uint32     byte length of the header
+    header      JSON       {"rows": n, "columns": {name: column, ...}}
+    padding                zero bytes up to the next multiple of 8
+    buffers                the column data; offsets below are relative to here
+
+    numeric column: {"dtype": "<f8", "offset": o}
+        n values of that NumPy dtype ('<f8', '<f4', '<i8', '<i4', '|u1', ...)
+    string column:  {"dtype": "utf8", "offset": o, "data_offset": d, "data_length": m}
+        n + 1 '<i8' byte offsets into the m bytes of UTF-8 at d; row i is
+        data[offsets[i]:offsets[i + 1]], and an empty string stands for null
+
+Request columns are the /predict fields: amount and time (numeric, time
+in epoch milliseconds), location, and optionally description and user_id
+(strings). The response uses the same layout, with one row per
+transaction, in order:
+
+    fraud, original_fraud, degraded         |u1 (0 or 1)
+    confidence, original_confidence         <f8, rounded to 3 places like the JSON response
+    category                                utf8, the safe category ('' for none)
+    reasons                                 utf8, the reasons joined with newlines
+    features.<name>                         <i8, description features; features.category is utf8
+
+    python columnar.py encode transactions.jsonl batch.fgc
+    python columnar.py decode scored.fgc scored.jsonl
+"""
+import json
+import struct
+import sys
+
+import numpy as np
+
+MAGIC = b'FGC1'
+COLUMNAR_CONTENT_TYPE = 'application/x-fraudguard-columns'
+REQUIRED_COLUMNS = ['amount', 'location', 'time']
+
+def _pad(size):
+    return -size % 8
+
+def _size(spec, key, name=None):
+    """A non-negative integer field of the header (a count, offset or length)"""
+    value = spec[key]
+    if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+        raise ValueError(f'Bad {key}' + (f' for column {name}' if name else '') + f': {value!r}')
+    return value
+
+def decode_columns(body):
+    """(rows, {name: ndarray or list of str}) from a packed body; numeric columns are views of it
+
+    Anything malformed (header, column specs, offsets past the end of the
+    body) raises ValueError, so callers reject the body as bad input.
+    """
+    view = memoryview(body)
+    if len(view) < 8 or bytes(view[:4]) != MAGIC:
+        raise ValueError('Not a FGC1 body')
+    (header_length,) = struct.unpack_from('<I', view, 4)
+    if 8 + header_length > len(view):
+        raise ValueError('Truncated FGC1 header')
+    try:
+        header = json.loads(bytes(view[8:8 + header_length]))
+        rows = _size(header, 'rows')
+        specs = header['columns']
+        if not isinstance(specs, dict):
+            raise ValueError(f'Bad columns: {specs!r}')
+        base = 8 + header_length + _pad(8 + header_length)
+
+        columns = {}
+        for name, spec in specs.items():
+            if spec['dtype'] == 'utf8':
+                start = base + _size(spec, 'offset', name)
+                data_start = base + _size(spec, 'data_offset', name)
+                data_end = data_start + _size(spec, 'data_length', name)
+                if start + 8 * (rows + 1) > len(view) or data_end > len(view):
+                    raise ValueError(f'Column {name} runs past the end of the body')
+                offsets = np.frombuffer(view, '<i8', rows + 1, start)
+                data = bytes(view[data_start:data_end])
+                if offsets[0] != 0 or offsets[-1] != len(data) or (rows and np.diff(offsets).min() < 0):
+                    raise ValueError(f'Bad string offsets in column {name}')
+                bounds = offsets.tolist()
+                text = data.decode('utf-8')
+                if len(text) == len(data):  # ASCII: byte offsets are character offsets
+                    columns[name] = [text[bounds[i]:bounds[i + 1]] for i in range(rows)]
+                else:
+                    columns[name] = [data[bounds[i]:bounds[i + 1]].decode('utf-8') for i in range(rows)]
+            else:
+                dtype = np.dtype(spec['dtype'])
+                if dtype.kind not in 'fiub':
+                    raise ValueError(f'Unsupported dtype for column {name}: {spec["dtype"]}')
+                start = base + _size(spec, 'offset', name)
+                if start + dtype.itemsize * rows > len(view):
+                    raise ValueError(f'Column {name} runs past the end of the body')
+                columns[name] = np.frombuffer(view, dtype, rows, start)
+    except (KeyError, TypeError, AttributeError, IndexError) as e:
+        raise ValueError(f'Bad FGC1 header: {e!r}') from e
+    return rows, columns
+
+def encode_columns(columns):
+    """Packed body from {name: ndarray, or list of str (None counts as '')}; all columns the same length"""
+    rows = None
+    specs, buffers, size = {}, [], 0
+
+    def add(data):
+        nonlocal size
+        offset = size
+        buffers.append(data)
+        buffers.append(b'\0' * _pad(len(data)))
+        size += len(data) + _pad(len(data))
+        return offset
+
+    for name, values in columns.items():
+        if rows is None:
+            rows = len(values)
+        elif len(values) != rows:
+            raise ValueError(f'Column {name} has {len(values)} rows, expected {rows}')
+        if isinstance(values, np.ndarray) and values.dtype != object:
+            array = np.ascontiguousarray(values, values.dtype.newbyteorder('<'))
+            specs[name] = {'dtype': array.dtype.str, 'offset': add(array.tobytes())}
+        else:
+            encoded = [(value or '').encode('utf-8') for value in values]
+            offsets = np.zeros(len(encoded) + 1, dtype='<i8')
+            np.cumsum([len(value) for value in encoded], out=offsets[1:])
+            data = b''.join(encoded)
+            specs[name] = {'dtype': 'utf8', 'offset': add(offsets.tobytes()),
+                           'data_offset': add(data), 'data_length': len(data)}
+
+    header = json.dumps({'rows': rows or 0, 'columns': specs}).encode()
+    prefix = MAGIC + struct.pack('<I', len(header)) + header
+    return b''.join([prefix, b'\0' * _pad(len(prefix)), *buffers])
+
+def response_columns(decisions):
+    """score_columns() output as response columns (rounded with round(), exactly like the JSON response)"""
+    features = decisions['features']
+    names = list(features[0]) if features else []
+    columns = {
+        'fraud': np.asarray(decisions['fraud'], dtype=np.uint8),
+        'confidence': np.array([round(float(v), 3) for v in decisions['confidence']]),
+        'original_fraud': np.asarray(decisions['original_fraud'], dtype=np.uint8),
+        'original_confidence': np.array([round(float(v), 3) for v in decisions['original_confidence']]),
+        'degraded': np.asarray(decisions['degraded'], dtype=np.uint8),
+        'category': list(decisions['category']),
+        'reasons': ['\n'.join(reasons) for reasons in decisions['reasons']]
+    }
+    for name in names:
+        values = [f[name] for f in features]
+        columns[f'features.{name}'] = values if name == 'category' else np.array(values, dtype=np.int64)
+    return columns
+
+def _encode_file(source, target):
+    with open(source, encoding='utf-8') as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    columns = {
+        'amount': np.array([float(row['amount']) for row in rows]),
+        'time': np.array([float(row['time']) for row in rows]),
+        'location': [str(row['location']) for row in rows],
+        'description': [row.get('description') or '' for row in rows],
+        'user_id': [None if row.get('user_id') is None else str(row['user_id']) for row in rows]
+    }
+    with open(target, 'wb') as f:
+        f.write(encode_columns(columns))
+    print(f"✅ Wrote {len(rows)} transactions to {target}")
+
+def _decode_file(source, target):
+    with open(source, 'rb') as f:
+        rows, columns = decode_columns(f.read())
+    with open(target, 'w', encoding='utf-8') as f:
+        for i in range(rows):
+            row = {name: values[i].item() if isinstance(values, np.ndarray) else values[i]
+                   for name, values in columns.items()}
+            f.write(json.dumps(row, ensure_ascii=False) + '\n')
+    print(f"✅ Wrote {rows} rows to {target}")
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] not in ('encode', 'decode'):
+        sys.exit("usage: python columnar.py encode in.jsonl out.fgc | decode in.fgc out.jsonl")
+    (_encode_file if sys.argv[1] == 'encode' else _decode_file)(sys.argv[2], sys.argv[3])
@@ -0,0 +1,54 @@
+"""Setup shared by the tests that import app: python -m pytest
+
+app reads its configuration from the environment once, when it is
+imported, so it is set here, before any test module imports it: a small
+forest without velocity features (it compiles to a lookup table), loaded
+during the import and never hot reloaded, no decision log output, no
+budget and no injected delays. Tests that need a forest trained with
+velocity features swap one in with the `velocity_model` fixture.
+"""
+import contextlib
+import io
+import os
+import tempfile
+
+import pytest
+
+import train
+
+ARTIFACTS = tempfile.mkdtemp(prefix='fraudguard-tests-')
+MODELS_DIR = os.path.join(ARTIFACTS, 'models')
+
+with contextlib.redirect_stdout(io.StringIO()):
+    train.main(['--samples', '2000', '--trees', '5', '--no-velocity', '--models-dir', MODELS_DIR])
+
+os.environ.update({
+    'MODEL_DIR': MODELS_DIR,
+    'MODEL_LOAD': 'sync',
+    'MODEL_RELOAD_INTERVAL': '0',
+    'DECISION_LOG_FILE': os.devnull,
+    'FEEDBACK_FILE': os.path.join(ARTIFACTS, 'feedback.jsonl')
+})
+for name in ('DECISION_CACHE_SIZE', 'MICRO_BATCH', 'MODEL_REGISTRY_DIR', 'SCORING_BUDGET_MS', 'SCORING_DELAY_MS',
+             'VELOCITY_SNAPSHOT', 'AMOUNT_SKETCH_SNAPSHOT'):
+    os.environ.pop(name, None)
+
+
+@pytest.fixture(scope='session')
+def velocity_artifact():
+    """A small forest trained with the velocity features, served by FastForest"""
+    from model_store import Artifact, current_version
+
+    root = os.path.join(ARTIFACTS, 'velocity-models')
+    with contextlib.redirect_stdout(io.StringIO()):
+        train.main(['--samples', '3000', '--trees', '5', '--models-dir', root])
+    return Artifact(os.path.join(root, current_version(root)))
+
+
+@pytest.fixture
+def velocity_model(velocity_artifact, monkeypatch):
+    """app serving the velocity forest for the duration of one test"""
+    import app
+
+    monkeypatch.setattr(app.model_store, 'artifact', velocity_artifact)
+    return velocity_artifact.model
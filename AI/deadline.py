@@ -0,0 +1,137 @@
+"""Per-request latency budget for scoring, degrading to the rules alone
+
+A budget (SCORING_BUDGET_MS, or the X-Scoring-Budget-Ms header of the
+request, capped at SCORING_BUDGET_MAX_MS) bounds how long /predict and
+/predict/batch spend before answering. Python cannot interrupt a stage
+that is already running, so the optional stages are skipped up front
+instead: before the description analysis and before the model, the
+policy compares the time left with what that stage has recently cost
+(per transaction, a peak that decays by `decay` with every observation,
+so one slow call is remembered for a while and a tail is not averaged
+away; batches keep their own, as 'batch.model' etc.). If it would not
+fit, the stage is skipped and the response is the THRESHOLDS rule
+decision over the keyword scan, marked `degraded: true`. A skip decays
+the estimate as well, so a stage that got slow is tried again every so
+often and is used again once it is back to normal.
+
+The same flag, with its own counter, marks a response scored without
+the model because none is loaded yet or it raised, which used to be
+indistinguishable from a model answer of 0.3.
+
+SCORING_DELAY_MS injects artificial delays into the pipeline stages, to
+see the degradation work: 'model=20,description=5' sleeps 20 ms in the
+model stage and 5 ms in the description stage of every request. See
+bench.py --deadline. Never set it in production.
+"""
+import os
+import time
+
+# Stages of the pipeline, in order; delays can be injected into each of them.
+# description and model are skipped when they would overrun the budget.
+STAGES = ('parse', 'velocity', 'description', 'model', 'rules')
+
+DEGRADED_REASONS = ('deadline', 'no_model', 'model_error')
+
+def parse_delays(spec):
+    """{'model': 0.02, ...} (seconds) from 'model=20,description=5' (milliseconds)"""
+    delays = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        stage, _, ms = item.partition('=')
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage for an injected delay: {stage} (choose from {', '.join(STAGES)})")
+        delays[stage] = float(ms) / 1000
+    return delays
+
+
+class Deadline:
+    """When one request has to be answered by"""
+
+    __slots__ = ('budget', 'expires')
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.expires = time.perf_counter() + budget
+
+    def remaining(self):
+        return self.expires - time.perf_counter()
+
+
+class DeadlinePolicy:
+    """Budgets, stage cost estimates and degradation counters of one worker process"""
+
+    header = 'X-Scoring-Budget-Ms'
+
+    def __init__(self, budget_ms=0, max_budget_ms=10000, delays=None, decay=0.99):
+        self.budget = budget_ms / 1000
+        self.max_budget = max_budget_ms / 1000
+        self.delays = delays or {}
+        self.decay = decay
+        self.estimates = {}  # stage -> seconds per transaction
+        self.counts = {'with_budget': 0, 'bad_headers': 0, 'overruns': 0, 'degraded': 0,
+                       **{f'degraded.{reason}': 0 for reason in DEGRADED_REASONS}}
+
+    @classmethod
+    def from_env(cls):
+        """Configure from SCORING_BUDGET_MS (0: no budget unless the request sets one),
+        SCORING_BUDGET_MAX_MS and SCORING_DELAY_MS (injected delays, for testing)"""
+        return cls(
+            budget_ms=float(os.environ.get('SCORING_BUDGET_MS', 0)),
+            max_budget_ms=float(os.environ.get('SCORING_BUDGET_MAX_MS', 10000)),
+            delays=parse_delays(os.environ.get('SCORING_DELAY_MS'))
+        )
+
+    def start(self, header_value=None):
+        """Deadline of a request that starts now, None if it has no budget"""
+        budget = self.budget
+        if header_value:
+            try:
+                budget = min(float(header_value) / 1000, self.max_budget)
+            except ValueError:
+                self.counts['bad_headers'] += 1
+        if budget <= 0:
+            return None
+        self.counts['with_budget'] += 1
+        return Deadline(budget)
+
+    def allows(self, deadline, stage, n=1):
+        """Whether `stage` for n transactions is expected to finish within the deadline"""
+        estimate = self.estimates.get(stage, 0.0)
+        if deadline is None or deadline.remaining() > estimate * n:
+            return True
+        self.estimates[stage] = estimate * self.decay
+        key = f'skipped.{stage}'
+        self.counts[key] = self.counts.get(key, 0) + 1
+        return False
+
+    def observe(self, stage, seconds, n=1):
+        """Record what a stage cost for n transactions"""
+        per_transaction = seconds / n
+        estimate = self.estimates.get(stage, 0.0) * self.decay
+        self.estimates[stage] = per_transaction if per_transaction > estimate else estimate
+
+    def inject(self, stage):
+        """Sleep for the delay injected into this stage, if any (SCORING_DELAY_MS); batch.* stages too"""
+        delay = self.delays.get(stage.rpartition('.')[2]) if self.delays else None
+        if delay:
+            time.sleep(delay)
+
+    def degraded(self, reason, n=1):
+        self.counts['degraded'] += n
+        self.counts[f'degraded.{reason}'] += n
+
+    def finish(self, deadline):
+        """Count a request that was answered after its deadline anyway"""
+        if deadline is not None and deadline.remaining() < 0:
+            self.counts['overruns'] += 1
+
+    def stats(self):
+        return {
+            'budget_ms': self.budget * 1000,
+            'max_budget_ms': self.max_budget * 1000,
+            'injected_delays_ms': {stage: delay * 1000 for stage, delay in self.delays.items()},
+            'estimates_us': {stage: round(seconds * 1e6, 1) for stage, seconds in self.estimates.items()},
+            **self.counts
+        }
+
+# Create global instance
+deadline_policy = DeadlinePolicy.from_env()
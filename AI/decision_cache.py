@@ -0,0 +1,144 @@
+"""Cache of full /predict decisions for repeated transactions
+
+Recurring bills, the same cab fare every morning and retries from the
+backend after a timeout send the exact same transaction again and again.
+A decision depends only on the description, amount, location, local hour
+and day of week, so the response built the first time is kept and served
+again. Not when it also reads velocity features that every transaction
+changes (a model trained with velocity features, or a rule reading the
+user's amount history of a request with a user_id): a repeat never has
+the same features, so app.decision_key() gives no key, and the request
+is scored without a lookup and counted as `bypassed`.
+
+Entries live for `ttl` seconds and the least recently used one goes when
+`max_entries` is reached. The cache belongs to one model object and one
+set of THRESHOLDS: when either changes (a hot reload, re-tuned
+thresholds), the first lookup notices and empties it. Memory use is
+estimated in stats() from a sample of entries, off the request path.
+"""
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+
+def _sizeof(value, seen=None):
+    """Approximate deep size of a response, counting shared objects once
+
+    Dict keys are left out: they are the same few literals in every response.
+    """
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_sizeof(v, seen) for v in value.values())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_sizeof(v, seen) for v in value)
+    return size
+
+
+class DecisionCache:
+    """Bounded, thread-safe LRU cache of decisions with a TTL"""
+
+    def __init__(self, max_entries=10000, ttl=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.counts = {'hits': 0, 'misses': 0, 'bypassed': 0, 'expired': 0, 'evicted': 0, 'invalidations': 0}
+        self._entries = OrderedDict()  # key -> (expires, value)
+        self._model = None
+        self._thresholds = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Configure from DECISION_CACHE_SIZE (0 disables) and DECISION_CACHE_TTL (seconds)"""
+        return cls(
+            max_entries=int(os.environ.get('DECISION_CACHE_SIZE', 10000)),
+            ttl=float(os.environ.get('DECISION_CACHE_TTL', 300))
+        )
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def _check_generation(self, model, thresholds):
+        # Called with the lock held
+        if model is not self._model or thresholds != self._thresholds:
+            if self._entries:
+                self.counts['invalidations'] += 1
+            self._entries.clear()
+            self._model = model
+            self._thresholds = dict(thresholds)
+
+    def get(self, key, model, thresholds):
+        """Cached value for key under this model and these thresholds, None on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            self._check_generation(model, thresholds)
+            try:
+                entry = self._entries.get(key)
+            except TypeError:  # unhashable input, e.g. a list as location
+                entry = None
+            if entry is None:
+                self.counts['misses'] += 1
+                return None
+            expires, value = entry
+            if expires <= now:
+                del self._entries[key]
+                self.counts['expired'] += 1
+                self.counts['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counts['hits'] += 1
+            return value
+
+    def bypass(self):
+        """Count a request that could not be cached"""
+        with self._lock:
+            self.counts['bypassed'] += 1
+
+    def put(self, key, model, thresholds, value):
+        """Cache value; ignored if the model or thresholds changed since it was computed"""
+        try:
+            hash(key)
+        except TypeError:
+            return
+        with self._lock:
+            if model is not self._model or thresholds != self._thresholds:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counts['evicted'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def memory_bytes(self, sample=100):
+        """Approximate memory held by the entries, extrapolated from the `sample` most recent"""
+        with self._lock:
+            entries = len(self._entries)
+            recent = list(islice(reversed(self._entries.items()), sample))
+        if not recent:
+            return 0
+        return round(sum(_sizeof(entry) for entry in recent) / len(recent) * entries)
+
+    def stats(self):
+        lookups = self.counts['hits'] + self.counts['misses']
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_s': self.ttl,
+            'hit_rate': round(self.counts['hits'] / lookups, 4) if lookups else 0.0,
+            'memory_bytes': self.memory_bytes(),
+            **self.counts
+        }
+
+# Create global instance
+decision_cache = DecisionCache.from_env()
@@ -0,0 +1,131 @@
+import atexit
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+# Sampling rate per decision: log every FRAUD decision, 1% of SAFE ones
+DEFAULT_SAMPLE_RATES = {
+    'FRAUD': 1.0,
+    'SAFE': 0.01,
+    'ERROR': 1.0
+}
+
+class DecisionLogger:
+    """Non-blocking, sampled decision log
+
+    Request handlers call `log()`, which only decides whether to sample the
+    record and puts it on a bounded in-memory queue. A background thread
+    drains the queue in bulk and writes one line per record (JSON lines, or
+    a short text form). When the queue is full the record is dropped and
+    counted instead of blocking the request. The writer thread is started
+    lazily in each process, so the logger survives forking workers.
+    """
+
+    def __init__(self, path=None, fmt='json', sample_rates=None, queue_size=10000,
+                 batch_size=500, flush_interval=0.5):
+        self.path = path
+        self.fmt = fmt
+        self.sample_rates = dict(DEFAULT_SAMPLE_RATES, **(sample_rates or {}))
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.counts = {'logged': 0, 'written': 0, 'dropped': 0, 'sampled_out': 0}
+        self._pid = None
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    @classmethod
+    def from_env(cls):
+        """Configure from DECISION_LOG_* environment variables"""
+        rates = {}
+        for kind in DEFAULT_SAMPLE_RATES:
+            value = os.environ.get(f'DECISION_LOG_SAMPLE_{kind}')
+            if value is not None:
+                rates[kind] = float(value)
+        return cls(
+            path=os.environ.get('DECISION_LOG_FILE') or None,
+            fmt=os.environ.get('DECISION_LOG_FORMAT', 'json'),
+            sample_rates=rates,
+            queue_size=int(os.environ.get('DECISION_LOG_QUEUE_SIZE', 10000))
+        )
+
+    def _ensure_writer(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.queue_size)
+                self._writer = threading.Thread(target=self._run, name='decision-log', daemon=True)
+                self._writer.start()
+                self._pid = os.getpid()
+
+    def sampled(self, kind):
+        """True if a record of this kind ('FRAUD', 'SAFE', 'ERROR') should be logged"""
+        rate = self.sample_rates.get(kind, 1.0)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        self.counts['sampled_out'] += 1
+        return False
+
+    def log(self, kind, record):
+        """Queue a record without blocking; call `sampled(kind)` first to skip building it"""
+        self._ensure_writer()
+        record = {'ts': time.time(), 'kind': kind, **record}
+        try:
+            self._queue.put_nowait(record)
+            self.counts['logged'] += 1
+        except queue.Full:
+            self.counts['dropped'] += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+            time.sleep(self.flush_interval if len(batch) < self.batch_size else 0)
+
+    def _format(self, record):
+        if self.fmt == 'text':
+            details = ' '.join(f"{k}={v}" for k, v in record.items() if k not in ('ts', 'kind'))
+            return f"{time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record['ts']))} {record['kind']} {details}\n"
+        return json.dumps(record, ensure_ascii=False, default=str) + '\n'
+
+    def _write(self, batch):
+        try:
+            lines = ''.join(self._format(record) for record in batch)
+            if self.path:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(lines)
+            else:
+                sys.stdout.write(lines)
+                sys.stdout.flush()
+            self.counts['written'] += len(batch)
+        except Exception as e:
+            self.counts['dropped'] += len(batch)
+            print(f"⚠️ Decision log write failed: {e}", file=sys.stderr)
+
+    def flush(self):
+        """Wait until everything queued so far has been written"""
+        if self._pid == os.getpid():
+            self._queue.join()
+
+    def stats(self):
+        return {
+            **self.counts,
+            'queued': self._queue.qsize() if self._pid == os.getpid() else 0,
+            'queue_size': self.queue_size,
+            'sample_rates': self.sample_rates
+        }
+
+# Create global instance
+decision_log = DecisionLogger.from_env()
@@ -1,4 +1,5 @@
 import re
+from keyword_matcher import KeywordMatcher
 
 class DescriptionFraudAnalyzer:
     def __init__(self):
@@ -38,9 +39,22 @@ class DescriptionFraudAnalyzer:
             'education': ['school', 'college', 'university', 'tuition', 'fees'],
             'travel': ['petrol', 'fuel', 'toll', 'parking', 'flight', 'hotel']
         }
+        
+        # Keyword lists matched in one pass; callers that scan the text themselves
+        # (see app.py) build one matcher over these groups plus their own lists
+        self.keyword_groups = {
+            'fraud': self.fraud_keywords,
+            'legitimate': self.legitimate_keywords,
+            'merchant': self.merchant_categories
+        }
+        self.matcher = KeywordMatcher(self.keyword_groups)
     
-    def extract_features(self, description):
-        """Extract features from transaction description"""
+    def extract_features(self, description, hits=None):
+        """Extract features from transaction description
+        
+        `hits` is an optional KeywordHits scan of the same description that
+        includes this analyzer's keyword groups, so it is not scanned twice.
+        """
         if not description or not isinstance(description, str):
             return {
                 'desc_length': 0,
@@ -67,26 +81,18 @@ class DescriptionFraudAnalyzer:
             'category': 'unknown'
         }
         
-        # Count keywords
-        for kw in self.fraud_keywords:
-            if kw in description_lower:
-                features['fraud_keyword_count'] += 1
-        
-        for kw in self.legitimate_keywords:
-            if kw in description_lower:
-                features['legit_keyword_count'] += 1
-        
-        # Determine category
-        for category, keywords in self.merchant_categories.items():
-            if any(kw in description_lower for kw in keywords):
-                features['category'] = category
-                break
+        # Count keywords and determine category from a single scan
+        if hits is None:
+            hits = self.matcher.scan(description_lower)
+        features['fraud_keyword_count'] = hits.count('fraud')
+        features['legit_keyword_count'] = hits.count('legitimate')
+        features['category'] = hits.category('merchant') or 'unknown'
         
         return features
     
-    def predict(self, description, amount, hour):
+    def predict(self, description, amount, hour, hits=None):
         """Predict fraud based on description + amount + time"""
-        features = self.extract_features(description)
+        features = self.extract_features(description, hits)
         
         # Base fraud score
         fraud_score = 0.0
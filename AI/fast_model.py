@@ -0,0 +1,308 @@
+import math
+import threading
+import numpy as np
+
+from velocity import VELOCITY_DEFAULTS
+
+# Scaled values from here up round to infinity in float32, which sklearn rejects
+FLOAT32_OVERFLOW = 2.0 ** 128 - 2.0 ** 103
+
+# Discrete features and the size of their domain; their scaled values are precomputed
+DISCRETE_DOMAINS = {
+    'hour': 24,
+    'day_of_week': 7,
+    'is_weekend': 2
+}
+
+class FastForest:
+    """Pandas-free inference path for the RandomForest in model_data
+
+    Produces exactly what `model.predict_proba(scaler.transform(features))`
+    does, without building a DataFrame, without sklearn's input validation
+    and without LabelEncoder.transform:
+
+    * locations are ids from an interned LocationIndex (locations.py), one
+      dict lookup whatever the number of locations
+    * scaled values of the discrete features (location code, hour, day of
+      week, weekend flag) are precomputed lookup arrays; only the amount is
+      scaled per request, with the scaler's own mean and scale
+    * the row is assembled in a preallocated per-thread float32 buffer, the
+      same dtype the trees compare against
+    * all trees are flattened into one set of node arrays and walked
+      together, one level per step
+
+    A NaN input takes the branch sklearn sends missing values down at
+    every split (missing_right); forests flattened before that was saved
+    reject it, like a value that is infinite once scaled to float32, with
+    the ValueError sklearn raises.
+    """
+
+    # A batch of rows costs little more than one, so batcher.py coalesces calls
+    coalesce = True
+
+    def __init__(self, classes, feature_names, locations, scaler_mean, scaler_scale,
+                 feature, threshold, children, leaf_proba, roots, depth, missing_right=None):
+        self.feature_names = list(feature_names)
+        self.classes = classes
+        self.n_trees = len(roots)
+
+        # Location ids from the index; rare and unseen locations share unknown_location_code
+        self.locations = locations
+        self.unknown_location_code = locations.unknown_code
+
+        # Scaling folded into precomputed arrays
+        self.scaler_mean = scaler_mean
+        self.scaler_scale = scaler_scale
+        self._mean = [float(m) for m in scaler_mean]
+        self._scale = [float(s) for s in scaler_scale]
+        domains = {name: np.arange(size, dtype=np.float64) for name, size in DISCRETE_DOMAINS.items()}
+        domains['location_code'] = locations.values  # the encoded value of each location id
+        self._scaled = {}
+        for name, values in domains.items():
+            col = self.feature_names.index(name)
+            self._scaled[name] = ((values - scaler_mean[col]) / scaler_scale[col]).astype(np.float32)
+        self._amount_col = self.feature_names.index('amount')
+        self._columns = {name: self.feature_names.index(name) for name in domains}
+
+        # Any other feature (velocity features, see velocity.py) is scaled per request like the amount;
+        # one the caller leaves out gets its no-history value
+        self._extra_columns = [(name, col, VELOCITY_DEFAULTS.get(name, 0)) for col, name in enumerate(self.feature_names)
+                               if name != 'amount' and name not in domains]
+
+        # All trees flattened into shared node arrays (see from_model_data)
+        self._feature = feature
+        self._threshold = threshold
+        self._children = children  # left, right of each node
+        self._leaf_proba = leaf_proba
+        self._roots = roots
+        self._missing_right = missing_right  # per node: a NaN input goes right
+        self.depth = depth
+
+        self._local = threading.local()
+
+    @classmethod
+    def from_model_data(cls, model_data):
+        """Flatten the fitted model, scaler and location index of a training run"""
+        model = model_data['model']
+        n_classes = len(model.classes_)
+
+        # Flatten every tree into shared node arrays; leaves point to themselves
+        features, thresholds, children, leaf_proba, roots, missing_right = [], [], [], [], [], []
+        offset = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            nodes = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+            left = np.where(is_leaf, nodes, tree.children_left) + offset
+            right = np.where(is_leaf, nodes, tree.children_right) + offset
+
+            # Same per-tree normalization as DecisionTreeClassifier.predict_proba
+            proba = tree.value[:, 0, :n_classes]
+            normalizer = proba.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            children.append(np.column_stack([left, right]))
+            leaf_proba.append(proba / normalizer)
+            missing_right.append(tree.missing_go_to_left == 0)
+            roots.append(offset)
+            offset += tree.node_count
+
+        return cls(
+            classes=model.classes_,
+            feature_names=model_data['feature_names'],
+            locations=model_data['location_index'],
+            scaler_mean=model_data['scaler'].mean_,
+            scaler_scale=model_data['scaler'].scale_,
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds),
+            children=np.concatenate(children).astype(np.intp).ravel(),
+            leaf_proba=np.concatenate(leaf_proba),
+            roots=np.array(roots, dtype=np.intp),
+            missing_right=np.concatenate(missing_right),
+            depth=max(estimator.tree_.max_depth for estimator in model.estimators_)
+        )
+
+    @property
+    def scores_missing(self):
+        """Whether a NaN amount is scored (as sklearn does) rather than rejected"""
+        return self._missing_right is not None
+
+    def arrays(self):
+        """Everything needed to rebuild this forest, as flat arrays (the location index's included)"""
+        arrays = {
+            'classes': self.classes,
+            **self.locations.arrays(),
+            'scaler_mean': self.scaler_mean,
+            'scaler_scale': self.scaler_scale,
+            'feature': self._feature,
+            'threshold': self._threshold,
+            'children': self._children,
+            'leaf_proba': self._leaf_proba,
+            'roots': self._roots
+        }
+        if self._missing_right is not None:
+            arrays['missing_right'] = self._missing_right
+        return arrays
+
+    def lookup_location(self, location):
+        """Id of a location indexed in training, None otherwise"""
+        return self.locations.lookup(location)
+
+    def location_code(self, location):
+        """Id of a location, unknown_location_code if it is rare or was never seen in training"""
+        return self.locations.code(location)
+
+    def _row_buffer(self):
+        row = getattr(self._local, 'row', None)
+        if row is None:
+            row = self._local.row = np.empty(len(self.feature_names), dtype=np.float32)
+        return row
+
+    def scale_one(self, amount, location_code, hour, day_of_week, is_weekend, velocity=None):
+        """Scaled float32 row for one transaction (a per-thread buffer, reused by the next call)
+
+        velocity holds the values of any velocity features the model was
+        trained with; missing ones get their no-history values
+        (VELOCITY_DEFAULTS).
+        """
+        row = self._row_buffer()
+        col = self._amount_col
+        value = (amount - self._mean[col]) / self._scale[col]
+        if not -FLOAT32_OVERFLOW < value < FLOAT32_OVERFLOW:  # NaN too
+            self._reject(value)
+        row[col] = value
+        columns, scaled = self._columns, self._scaled
+        row[columns['location_code']] = scaled['location_code'][location_code]
+        row[columns['hour']] = scaled['hour'][hour]
+        row[columns['day_of_week']] = scaled['day_of_week'][day_of_week]
+        row[columns['is_weekend']] = scaled['is_weekend'][is_weekend]
+        for name, col, default in self._extra_columns:
+            value = ((velocity or {}).get(name, default) - self._mean[col]) / self._scale[col]
+            if not -FLOAT32_OVERFLOW < value < FLOAT32_OVERFLOW:
+                self._reject(value)
+            row[col] = value
+        return row
+
+    def _reject(self, value):
+        """Raise sklearn's ValueError for a scaled value it would not accept"""
+        if value == value or self._missing_right is None:
+            raise ValueError("Input X contains NaN or infinity.")
+
+    def predict_proba_one(self, amount, location_code, hour, day_of_week, is_weekend, velocity=None):
+        """Class probabilities for a single transaction"""
+        return self.predict_proba_scaled(self.scale_one(amount, location_code, hour, day_of_week, is_weekend, velocity))
+
+    def predict_proba_scaled(self, row):
+        """Class probabilities for a row from scale_one"""
+        feature, threshold, children = self._feature, self._threshold, self._children
+        nodes = self._roots
+        if math.isnan(row.dot(row)):  # a NaN in any column; infinities alone would give inf
+            return self._walk(row[np.newaxis])[0]
+        for _ in range(self.depth):
+            go_right = row.take(feature.take(nodes)) > threshold.take(nodes)
+            nodes = children.take(2 * nodes + go_right)
+
+        # Accumulate trees in order, the way RandomForestClassifier does
+        return np.cumsum(self._leaf_proba[nodes], axis=0)[-1] / self.n_trees
+
+    def predict_proba(self, amount, location_code, hour, day_of_week, is_weekend, velocity=None, chunk_size=4096):
+        """Class probabilities for arrays of transactions, shape (n, n_classes)"""
+        n = len(amount)
+        X = np.empty((n, len(self.feature_names)), dtype=np.float32)
+        col = self._amount_col
+        X[:, col] = self._scale_column(np.asarray(amount, dtype=np.float64), col)
+        for name, values in (('location_code', location_code), ('hour', hour),
+                             ('day_of_week', day_of_week), ('is_weekend', is_weekend)):
+            X[:, self._columns[name]] = self._scaled[name][np.asarray(values, dtype=np.intp)]
+        for name, col, default in self._extra_columns:
+            X[:, col] = self._scale_column(np.asarray((velocity or {}).get(name, default), dtype=np.float64), col)
+
+        out = np.empty((n, len(self.classes)))
+        for start in range(0, n, chunk_size):
+            out[start:start + chunk_size] = self._walk(X[start:start + chunk_size])
+        return out
+
+    def rejects(self, amount):
+        """Mask of the amounts predict_proba raises on (velocity features are always accepted)"""
+        col = self._amount_col
+        scaled = (np.asarray(amount, dtype=np.float64) - self._mean[col]) / self._scale[col]
+        rejected = np.abs(scaled) >= FLOAT32_OVERFLOW
+        return rejected | np.isnan(scaled) if self._missing_right is None else rejected
+
+    def _scale_column(self, values, col):
+        """values of column col scaled, rejected where sklearn would reject them"""
+        scaled = (values - self._mean[col]) / self._scale[col]
+        if (np.abs(scaled) >= FLOAT32_OVERFLOW).any() or (self._missing_right is None and np.isnan(scaled).any()):
+            raise ValueError("Input X contains NaN or infinity.")
+        return scaled
+
+    def _walk(self, rows):
+        """Class probabilities of scaled float32 rows, all trees a level at a time"""
+        index = np.arange(len(rows))[:, np.newaxis]
+        nodes = np.broadcast_to(self._roots, (len(rows), self.n_trees))
+        missing = self._missing_right is not None and np.isnan(rows).any()
+        for _ in range(self.depth):
+            values = rows[index, self._feature[nodes]]
+            go_right = values > self._threshold[nodes]
+            if missing:
+                go_right |= np.isnan(values) & self._missing_right[nodes]
+            nodes = self._children[2 * nodes + go_right]
+        return np.cumsum(self._leaf_proba[nodes], axis=1)[:, -1] / self.n_trees
+
+
+if __name__ == '__main__':
+    # Parity check of the memory-mapped forest against sklearn and a microbenchmark: python fast_model.py
+    # (velocity features, if the model has them, are left at their no-history values)
+    import os
+    import time
+    import pandas as pd
+    from model_store import Artifact, current_version
+
+    artifact = Artifact(os.path.join('models', current_version('models')))
+    model_data = artifact.load_estimator()
+    model, scaler = model_data['model'], model_data['scaler']
+    index, feature_names = model_data['location_index'], model_data['feature_names']
+    fast = artifact.forest
+
+    def sklearn_proba(amount, location, hour, day_of_week, is_weekend):
+        features = pd.DataFrame([{
+            'amount': amount,
+            'location_code': index.values[index.code(location)],
+            'hour': hour,
+            'day_of_week': day_of_week,
+            'is_weekend': is_weekend
+        }]).reindex(columns=feature_names).fillna(VELOCITY_DEFAULTS)
+        return model.predict_proba(scaler.transform(features))[0]
+
+    def fast_proba(amount, location, hour, day_of_week, is_weekend):
+        return fast.predict_proba_one(amount, fast.location_code(location), hour, day_of_week, is_weekend)
+
+    rng = np.random.default_rng(0)
+    locations = list(index.names[:50]) + ['Mumbai', 'Delhi', '', ' NY ']
+    samples = []
+    for _ in range(2000):
+        day_of_week = int(rng.integers(7))
+        samples.append((float(rng.choice([rng.exponential(100), rng.exponential(20000)])),
+                        str(rng.choice(locations)), int(rng.integers(24)), day_of_week,
+                        1 if day_of_week >= 5 else 0))
+
+    # n_jobs=1 makes sklearn accumulate trees in order, so results are bit-identical
+    n_jobs, model.n_jobs = model.n_jobs, 1
+    mismatches = sum(not np.array_equal(sklearn_proba(*s), fast_proba(*s)) for s in samples)
+    columns = list(zip(*samples))
+    codes = [fast.location_code(loc) for loc in columns[1]]
+    batch = fast.predict_proba(columns[0], codes, *columns[2:])
+    expected = model.predict_proba(scaler.transform(pd.DataFrame({
+        'amount': columns[0], 'location_code': index.values[codes], 'hour': columns[2],
+        'day_of_week': columns[3], 'is_weekend': columns[4]}).reindex(columns=feature_names).fillna(VELOCITY_DEFAULTS)))
+    print(f"Parity: {mismatches} single-row and {int((batch != expected).any(axis=1).sum())} "
+          f"batch mismatches out of {len(samples)}")
+
+    model.n_jobs = n_jobs
+    for name, fn, count in (('sklearn + pandas', sklearn_proba, 200), ('fast path', fast_proba, 2000)):
+        start = time.perf_counter()
+        for s in samples[:count]:
+            fn(*s)
+        print(f"{name}: {(time.perf_counter() - start) / count * 1e6:.1f} µs per transaction")
@@ -0,0 +1,29 @@
+"""Feature extraction shared by app.py (serving) and train.py (training)"""
+import time
+import numpy as np
+
+# Range of `time` (ms) that datetime.fromtimestamp turns into a local time in any time zone:
+# 0001-01-02 to 9999-12-30, a day inside the range of datetime
+MIN_TIME_MS = -62135510400000
+MAX_TIME_MS = 253402214399000
+
+def valid_timestamps(timestamps):
+    """Mask of the timestamps within MIN_TIME_MS..MAX_TIME_MS (NaN is not)"""
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    return (timestamps >= MIN_TIME_MS) & (timestamps <= MAX_TIME_MS)
+
+def local_time_features(timestamps):
+    """Vectorized datetime.fromtimestamp(ts / 1000) -> (hour, day_of_week) arrays"""
+    # Work in integer microseconds, the resolution datetime rounds to
+    micros = np.round(np.asarray(timestamps, dtype=np.float64) * 1000).astype(np.int64)
+
+    # The local UTC offset can only change on a quarter-hour boundary, so look it
+    # up once per distinct 15-minute bucket instead of once per transaction
+    buckets, inverse = np.unique(micros // 900_000_000, return_inverse=True)
+    offsets = np.array([time.localtime(int(b) * 900).tm_gmtoff for b in buckets], dtype=np.int64)
+    local_micros = micros + offsets[inverse] * 1_000_000
+
+    hours = (local_micros // 3_600_000_000) % 24
+    days = local_micros // 86_400_000_000
+    day_of_week = (days + 3) % 7  # 1970-01-01 was a Thursday
+    return hours, day_of_week
@@ -0,0 +1,132 @@
+"""Confirmed fraud/safe labels for past transactions, for online.py to learn from
+
+The backend posts a transaction to /feedback once its outcome is known
+(a chargeback, or the customer confirming it), with the same fields it
+sent to /predict plus `fraud`. Each label is appended to FEEDBACK_FILE as
+one JSON line, written with a single append so lines from several worker
+processes never interleave.
+
+The model also reads velocity features, which describe the activity
+*before* the transaction and cannot be recomputed later. So every
+/predict remembers the features it was scored with, keyed by user and
+timestamp, in a fixed-size ring of the last `memory` transactions; a
+label for one of them is written with those exact features. Older
+transactions, or ones scored by another worker, are written without
+them (velocity None), unless the payload carries the values itself.
+"""
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from velocity import VELOCITY_DEFAULTS, VELOCITY_FEATURES
+
+REQUIRED_FIELDS = ['amount', 'location', 'time', 'fraud']
+
+class FeedbackStore:
+    """Append-only label file plus the velocity features of recent /predict calls"""
+
+    def __init__(self, path='feedback.jsonl', memory=50000):
+        self.path = path
+        self.memory = memory
+        self.counts = {'received': 0, 'with_velocity': 0, 'rejected': 0, 'remembered': 0}
+        self._slots = {}                   # (user_id, time) -> row of _features
+        self._keys = [None] * memory       # row -> its key, to forget it when the ring wraps
+        self._features = np.zeros((memory, len(VELOCITY_FEATURES)))
+        self._next = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Configure from FEEDBACK_FILE and FEEDBACK_MEMORY (transactions remembered, 0 disables)"""
+        return cls(
+            path=os.environ.get('FEEDBACK_FILE', 'feedback.jsonl'),
+            memory=int(os.environ.get('FEEDBACK_MEMORY', 50000))
+        )
+
+    def remember(self, user_id, timestamp, velocity):
+        """Keep the velocity features a transaction was scored with"""
+        if not self.memory:
+            return
+        key = (user_id, timestamp)
+        try:
+            hash(key)
+        except TypeError:
+            return
+        with self._lock:
+            row = self._next
+            old = self._keys[row]
+            if old is not None and self._slots.get(old) == row:
+                del self._slots[old]
+            self._keys[row] = key
+            self._slots[key] = row
+            self._features[row] = [velocity[name] for name in VELOCITY_FEATURES]
+            self._next = (row + 1) % self.memory
+            self.counts['remembered'] += 1
+
+    def velocity(self, user_id, timestamp):
+        """Remembered features of a transaction, None if it is not in the ring any more"""
+        with self._lock:
+            row = self._slots.get((user_id, timestamp))
+            if row is None:
+                return None
+            return dict(zip(VELOCITY_FEATURES, self._features[row].tolist()))
+
+    def _row(self, item):
+        for field in REQUIRED_FIELDS:
+            if field not in item:
+                raise ValueError(f'Missing required field: {field}')
+        if not isinstance(item['fraud'], bool):
+            raise ValueError("'fraud' must be true or false")
+        if not isinstance(item['location'], str):
+            raise ValueError('location must be a string')
+        user_id = item.get('user_id')
+        timestamp = float(item['time'])
+        velocity = item.get('velocity')
+        if velocity is not None:
+            velocity = {name: float(velocity.get(name, VELOCITY_DEFAULTS[name])) for name in VELOCITY_FEATURES}
+        else:
+            velocity = self.velocity(user_id, timestamp)
+        return {
+            'received': time.time(),
+            'amount': float(item['amount']),
+            'location': item['location'],
+            'time': timestamp,
+            'description': (item.get('description') or '').strip(),
+            'user_id': user_id,
+            'fraud': item['fraud'],
+            'velocity': velocity
+        }
+
+    def record(self, items):
+        """Validate and append labels; raises ValueError (with the index) before writing anything"""
+        rows = []
+        for i, item in enumerate(items):
+            try:
+                rows.append(self._row(item))
+            except (TypeError, ValueError, AttributeError) as e:
+                self.counts['rejected'] += 1
+                raise ValueError(f'{e} (index {i})') from e
+        data = ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows).encode()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+        with_velocity = sum(row['velocity'] is not None for row in rows)
+        self.counts['received'] += len(rows)
+        self.counts['with_velocity'] += with_velocity
+        return {'accepted': len(rows), 'with_velocity': with_velocity}
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'memory': self.memory,
+            'remembered_now': len(self._slots),
+            **self.counts
+        }
+
+# Create global instance
+feedback_store = FeedbackStore.from_env()
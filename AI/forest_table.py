@@ -0,0 +1,274 @@
+import numpy as np
+
+from fast_model import FLOAT32_OVERFLOW
+
+HOURS = 24
+DAYS = 7
+
+# The only features a forest may use to compile into a table
+TABLE_FEATURES = {'amount', 'location_code', 'hour', 'day_of_week', 'is_weekend'}
+
+# Every location id is HOURS * DAYS combinations; past this many the compile gets too big to be worth it
+TABLE_MAX_LOCATIONS = 32
+
+class ForestTable:
+    """Exact lookup table compiled from the trained RandomForest
+
+    Every feature except the amount is discrete, so for each
+    (location id, hour, day_of_week) combination the forest is a step
+    function of the amount. The table holds, per combination, the sorted
+    amount breakpoints (in the scaled float32 space the trees compare in)
+    and the class probabilities of every interval between them. Scoring is
+    an index into the combination plus one bisect, with no tree walking.
+    is_weekend is implied by day_of_week, the same way predict() derives it.
+    Only forests over these base features compile to a table, so velocity
+    arguments are accepted for a uniform interface and ignored. Location
+    ids come from the LocationIndex the table shares with its forest.
+    A NaN amount follows sklearn's missing-value branches, one row of
+    probabilities per combination (missing_proba); tables compiled before
+    that was saved reject it, like an amount that is infinite once scaled
+    to float32.
+    """
+
+    # One row is a single bisect, faster alone than in a batch (batcher.py)
+    coalesce = False
+
+    def __init__(self, classes, locations, amount_mean, amount_scale, breaks, offsets, proba, missing_proba=None):
+        self.classes = classes
+        self.locations = locations
+        self.unknown_location_code = locations.unknown_code
+        self.amount_mean = amount_mean
+        self.amount_scale = amount_scale
+        self.breaks = breaks      # float32, all combinations back to back
+        self.offsets = offsets    # combination c owns breaks[offsets[c]:offsets[c + 1]]
+        self.proba = proba        # combination c owns rows offsets[c] + c ... offsets[c + 1] + c
+        self.missing_proba = missing_proba  # row c: combination c with a NaN amount
+
+    @property
+    def scores_missing(self):
+        """Whether a NaN amount is scored (as sklearn does) rather than rejected"""
+        return self.missing_proba is not None
+
+    @property
+    def nbytes(self):
+        missing = 0 if self.missing_proba is None else self.missing_proba.nbytes
+        return self.breaks.nbytes + self.offsets.nbytes + self.proba.nbytes + missing
+
+    def rejects(self, amount):
+        """Mask of the amounts predict_proba raises on"""
+        scaled = (np.asarray(amount, dtype=np.float64) - self.amount_mean) / self.amount_scale
+        rejected = np.abs(scaled) >= FLOAT32_OVERFLOW
+        return rejected | np.isnan(scaled) if self.missing_proba is None else rejected
+
+    def arrays(self):
+        """The table as flat arrays (the location index is saved with the forest)"""
+        arrays = {
+            'classes': self.classes,
+            'breaks': self.breaks,
+            'offsets': self.offsets,
+            'proba': self.proba
+        }
+        if self.missing_proba is not None:
+            arrays['missing_proba'] = self.missing_proba
+        return arrays
+
+    def lookup_location(self, location):
+        """Id of a location indexed in training, None otherwise"""
+        return self.locations.lookup(location)
+
+    def location_code(self, location):
+        """Id of a location, unknown_location_code if it is rare or was never seen in training"""
+        return self.locations.code(location)
+
+    def _rows(self, scaled, combo):
+        """Row of `proba` for float32 scaled amounts in the given combinations"""
+        rows = np.empty(len(scaled), dtype=np.intp)
+        combos, inverse = np.unique(combo, return_inverse=True)
+        for group, c in enumerate(combos):
+            members = inverse == group
+            lo, hi = self.offsets[c], self.offsets[c + 1]
+            rows[members] = lo + self.breaks[lo:hi].searchsorted(scaled[members], side='left') + c
+        return rows
+
+    def scale_one(self, amount, location_code, hour, day_of_week, is_weekend=None, velocity=None):
+        """(scaled float32 amount, combination index) for one transaction"""
+        scaled = (amount - self.amount_mean) / self.amount_scale
+        if not -FLOAT32_OVERFLOW < scaled < FLOAT32_OVERFLOW and (scaled == scaled or self.missing_proba is None):
+            raise ValueError("Input X contains NaN or infinity.")
+        return np.float32(scaled), (location_code * HOURS + hour) * DAYS + day_of_week
+
+    def predict_proba_one(self, amount, location_code, hour, day_of_week, is_weekend=None, velocity=None):
+        """Class probabilities for a single transaction"""
+        return self.predict_proba_scaled(self.scale_one(amount, location_code, hour, day_of_week))
+
+    def predict_proba_scaled(self, scaled):
+        """Class probabilities for the result of scale_one"""
+        amount, combo = scaled
+        if amount != amount:
+            return self.missing_proba[combo]
+        lo, hi = self.offsets[combo], self.offsets[combo + 1]
+        return self.proba[lo + self.breaks[lo:hi].searchsorted(amount) + combo]
+
+    def predict_proba(self, amount, location_code, hour, day_of_week, is_weekend=None, velocity=None):
+        """Class probabilities for arrays of transactions, shape (n, n_classes)"""
+        if self.rejects(amount).any():
+            raise ValueError("Input X contains NaN or infinity.")
+        amount = np.asarray(amount, dtype=np.float64)
+        missing = np.isnan(amount)
+        scaled = ((amount - self.amount_mean) / self.amount_scale).astype(np.float32)
+        combo = (np.asarray(location_code, dtype=np.intp) * HOURS + np.asarray(hour)) * DAYS + np.asarray(day_of_week)
+        proba = self.proba[self._rows(scaled, combo)]
+        if missing.any():
+            proba[missing] = self.missing_proba[combo[missing]]
+        return proba
+
+
+def _discrete_grid(feature_names, location_values):
+    """Raw feature rows for every (location id, hour, day_of_week) combination, amount left at 0"""
+    location, hour, day = np.meshgrid(np.arange(len(location_values)), np.arange(HOURS), np.arange(DAYS),
+                                      indexing='ij')
+    grid = np.zeros((location.size, len(feature_names)))
+    grid[:, feature_names.index('location_code')] = location_values[location.ravel()]
+    grid[:, feature_names.index('hour')] = hour.ravel()
+    grid[:, feature_names.index('day_of_week')] = day.ravel()
+    grid[:, feature_names.index('is_weekend')] = day.ravel() >= 5
+    return grid
+
+
+def compile_forest_table(model, scaler, locations, feature_names):
+    """Turn a fitted RandomForestClassifier into an exact ForestTable"""
+    feature_names = list(feature_names)
+    if set(feature_names) != TABLE_FEATURES:
+        raise ValueError(f"Only forests over {sorted(TABLE_FEATURES)} compile to a lookup table")
+    if len(locations.values) > TABLE_MAX_LOCATIONS:
+        raise ValueError(f"Only forests over at most {TABLE_MAX_LOCATIONS} locations compile to a lookup table")
+    amount_col = feature_names.index('amount')
+    grid = (_discrete_grid(feature_names, locations.values) - scaler.mean_) / scaler.scale_
+    grid = grid.astype(np.float32)
+    n_combos = len(grid)
+    # Trees compare float32 inputs against float64 thresholds in double precision
+    grid64 = grid.astype(np.float64)
+
+    # For every tree, which nodes each combination can reach; amount splits keep both sides
+    combo_ids, thresholds = [], []
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        reach = np.zeros((tree.node_count, n_combos), dtype=bool)
+        reach[0] = True
+        for node in range(tree.node_count):
+            left, right = tree.children_left[node], tree.children_right[node]
+            if left == -1:
+                continue
+            if tree.feature[node] == amount_col:
+                reach[left] |= reach[node]
+                reach[right] |= reach[node]
+                combos = np.flatnonzero(reach[node])
+                combo_ids.append(combos)
+                thresholds.append(np.full(len(combos), tree.threshold[node]))
+            else:
+                go_left = grid64[:, tree.feature[node]] <= tree.threshold[node]
+                reach[left] |= reach[node] & go_left
+                reach[right] |= reach[node] & ~go_left
+
+    # A float32 amount is <= threshold exactly when it is <= the largest float32 <= threshold
+    combo_ids = np.concatenate(combo_ids)
+    thresholds = np.concatenate(thresholds)
+    breaks = thresholds.astype(np.float32)
+    breaks = np.where(breaks > thresholds, np.nextafter(breaks, np.float32(-np.inf)), breaks)
+    pairs = np.unique(np.rec.fromarrays([combo_ids, breaks]))
+    combo_ids, breaks = pairs.f0, pairs.f1.astype(np.float32)
+    offsets = np.zeros(n_combos + 1, dtype=np.int64)
+    np.cumsum(np.bincount(combo_ids, minlength=n_combos), out=offsets[1:])
+
+    # One representative amount per interval: each breakpoint, plus one above the last
+    last = offsets[1:] - 1
+    above = np.full(n_combos, np.float32(0))
+    has_breaks = offsets[1:] > offsets[:-1]
+    above[has_breaks] = np.nextafter(breaks[last[has_breaks]], np.float32(np.inf))
+    rep_combo = np.concatenate([combo_ids, np.arange(n_combos)])
+    rep_amount = np.concatenate([breaks, above])
+    order = np.lexsort([np.arange(len(rep_combo)), rep_combo])
+    reps = grid[rep_combo[order]]
+    reps[:, amount_col] = rep_amount[order]
+
+    # Every combination with a NaN amount, down sklearn's missing-value branches
+    missing = grid.copy()
+    missing[:, amount_col] = np.nan
+
+    # Trees accumulated in order (n_jobs=1), exactly as predict_proba serves them
+    n_jobs, model.n_jobs = model.n_jobs, 1
+    try:
+        proba = model.predict_proba(reps)
+        missing_proba = model.predict_proba(missing)
+    finally:
+        model.n_jobs = n_jobs
+
+    return ForestTable(
+        classes=model.classes_,
+        locations=locations,
+        amount_mean=float(scaler.mean_[amount_col]),
+        amount_scale=float(scaler.scale_[amount_col]),
+        breaks=breaks,
+        offsets=offsets,
+        proba=proba,
+        missing_proba=missing_proba
+    )
+
+
+def verify_forest_table(table, model, scaler, feature_names, samples_per_combo=20, seed=0):
+    """Enumerate the grid and count rows where the table differs from predict_proba
+
+    Checks both sides of every breakpoint plus random raw amounts per
+    combination (through StandardScaler, as the original predict() did),
+    and a NaN amount per combination if the table scores it, for both the
+    single-row and the array lookup.
+    """
+    import pandas as pd
+
+    feature_names = list(feature_names)
+    amount_col = feature_names.index('amount')
+    raw_grid = _discrete_grid(feature_names, table.locations.values)
+    scaled_grid = ((raw_grid - scaler.mean_) / scaler.scale_).astype(np.float32)
+    combos = np.arange(len(raw_grid))
+    n_jobs, model.n_jobs = model.n_jobs, 1
+    mismatches = 0
+    try:
+        # Both sides of every breakpoint, in scaled space
+        combo_ids = np.repeat(combos, np.diff(table.offsets))
+        for amounts in (table.breaks, np.nextafter(table.breaks, np.float32(np.inf))):
+            rows = scaled_grid[combo_ids]
+            rows[:, amount_col] = amounts
+            expected = model.predict_proba(rows)
+            got = table.proba[table._rows(amounts, combo_ids)]
+            mismatches += int((got != expected).any(axis=1).sum())
+
+        # Random raw amounts through the serving path
+        rng = np.random.default_rng(seed)
+        combo_ids = np.repeat(combos, samples_per_combo)
+        amounts = np.concatenate([rng.exponential(200, len(combo_ids) // 2),
+                                  rng.exponential(50000, len(combo_ids) - len(combo_ids) // 2)])
+        rows = raw_grid[combo_ids]
+        rows[:, amount_col] = amounts
+        expected = model.predict_proba(scaler.transform(pd.DataFrame(rows, columns=feature_names)))
+        location, rest = np.divmod(combo_ids, HOURS * DAYS)
+        hour, day = np.divmod(rest, DAYS)
+        got = table.predict_proba(amounts, location, hour, day)
+        mismatches += int((got != expected).any(axis=1).sum())
+        got = np.array([table.predict_proba_one(*row) for row in zip(amounts, location, hour, day)])
+        mismatches += int((got != expected).any(axis=1).sum())
+
+        # A NaN amount in every combination
+        if table.scores_missing:
+            rows = raw_grid.copy()
+            rows[:, amount_col] = np.nan
+            expected = model.predict_proba(scaler.transform(pd.DataFrame(rows, columns=feature_names)))
+            location, rest = np.divmod(combos, HOURS * DAYS)
+            hour, day = np.divmod(rest, DAYS)
+            amounts = np.full(len(combos), np.nan)
+            got = table.predict_proba(amounts, location, hour, day)
+            mismatches += int((got != expected).any(axis=1).sum())
+            got = np.array([table.predict_proba_one(*row) for row in zip(amounts, location, hour, day)])
+            mismatches += int((got != expected).any(axis=1).sum())
+    finally:
+        model.n_jobs = n_jobs
+    return mismatches
@@ -0,0 +1,90 @@
+from collections import deque
+
+class KeywordHits:
+    """Keywords found in one text, grouped by list and category"""
+
+    def __init__(self, matcher, entry_ids):
+        self._matcher = matcher
+        self._entry_ids = entry_ids  # sorted, so hits come back in declaration order
+
+    def keywords(self, group, category=None):
+        """Matched keywords of a group (optionally one category) in declaration order"""
+        entries = self._matcher._entries
+        return [entries[i][2] for i in self._entry_ids
+                if entries[i][0] == group and (category is None or entries[i][1] == category)]
+
+    def count(self, group):
+        """Number of matched keywords in a group"""
+        entries = self._matcher._entries
+        return sum(1 for i in self._entry_ids if entries[i][0] == group)
+
+    def any(self, group):
+        """True if any keyword of the group was found"""
+        entries = self._matcher._entries
+        return any(entries[i][0] == group for i in self._entry_ids)
+
+    def category(self, group):
+        """First category of the group (in declaration order) with at least one hit"""
+        entries = self._matcher._entries
+        for i in self._entry_ids:
+            if entries[i][0] == group:
+                return entries[i][1]
+        return None
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton that finds every keyword of several lists in one pass
+
+    `groups` maps a group name to either a list of keywords or a dict of
+    category -> list of keywords. Matching is case-insensitive substring
+    matching, the same as `keyword in text.lower()`, but the cost of a scan
+    depends on the length of the text, not on how many keywords there are.
+    """
+
+    def __init__(self, groups):
+        # (group, category, keyword) for every declared keyword, in order
+        self._entries = []
+        for group, keywords in groups.items():
+            categories = keywords.items() if isinstance(keywords, dict) else [(None, keywords)]
+            for category, words in categories:
+                for word in words:
+                    self._entries.append((group, category, word.lower()))
+
+        # Trie of all keywords
+        self._goto = [{}]
+        self._output = [()]
+        for entry_id, (_, _, word) in enumerate(self._entries):
+            state = 0
+            for ch in word:
+                if ch not in self._goto[state]:
+                    self._goto.append({})
+                    self._output.append(())
+                    self._goto[state][ch] = len(self._goto) - 1
+                state = self._goto[state][ch]
+            self._output[state] += (entry_id,)
+
+        # Failure links (breadth first), each state also reports its suffixes' keywords
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, child in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(ch, 0)
+                self._output[child] += self._output[self._fail[child]]
+                queue.append(child)
+
+    def scan(self, text):
+        """Find every keyword in `text` with a single pass"""
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()
+        state = 0
+        for ch in (text or '').lower():
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if output[state]:
+                found.update(output[state])
+        return KeywordHits(self, sorted(found))
@@ -0,0 +1,77 @@
+import json
+import os
+import threading
+
+class ConcurrencyLimiter:
+    """Caps the scoring requests one worker process handles at once
+
+    Requests over the limit are turned away immediately with a 503 and
+    Retry-After instead of queueing behind the ones in flight, so a burst
+    degrades into fast rejections the client (or load balancer) can retry
+    elsewhere rather than into growing latency for everybody. A limit of 0
+    disables it. Only paths starting with one of `paths` are limited, so
+    /health and /metrics keep answering under load.
+    """
+
+    def __init__(self, limit=0, paths=('/predict',), retry_after=1):
+        self.limit = limit
+        self.paths = tuple(paths)
+        self.retry_after = retry_after
+        self.counts = {'admitted': 0, 'rejected': 0}
+        self.in_flight = 0
+        self._slots = threading.BoundedSemaphore(limit) if limit else None
+
+    @classmethod
+    def from_env(cls):
+        """Configure from MAX_CONCURRENT_REQUESTS (per worker process, 0 = unlimited)"""
+        return cls(limit=int(os.environ.get('MAX_CONCURRENT_REQUESTS', 0)))
+
+    def applies(self, path):
+        return self._slots is not None and path.startswith(self.paths)
+
+    def acquire(self):
+        """Take a slot without waiting; False if the worker is at its limit"""
+        if self._slots.acquire(blocking=False):
+            self.counts['admitted'] += 1
+            self.in_flight += 1
+            return True
+        self.counts['rejected'] += 1
+        return False
+
+    def release(self):
+        self.in_flight -= 1
+        self._slots.release()
+
+    def busy_response(self):
+        """(status, headers, body) of the response to a rejected request"""
+        body = json.dumps({'error': 'Server busy, retry later'}).encode()
+        return 503, [('Content-Type', 'application/json'), ('Content-Length', str(len(body))),
+                     ('Retry-After', str(self.retry_after)), ('Access-Control-Allow-Origin', '*')], body
+
+    def wsgi(self, wsgi_app):
+        """Wrap a WSGI app so limited paths go through acquire/release"""
+        def limited(environ, start_response):
+            if not self.applies(environ.get('PATH_INFO', '')):
+                return wsgi_app(environ, start_response)
+            if not self.acquire():
+                status, headers, body = self.busy_response()
+                start_response('503 Service Unavailable', headers)
+                return [body]
+            result = wsgi_app(environ, start_response)
+            try:
+                return list(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+                self.release()
+        return limited
+
+    def stats(self):
+        return {
+            'limit': self.limit,
+            'in_flight': self.in_flight,
+            **self.counts
+        }
+
+# Create global instance
+limiter = ConcurrencyLimiter.from_env()
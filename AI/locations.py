@@ -0,0 +1,135 @@
+"""Interned location index: normalized location -> integer id -> model feature value
+
+Locations are normalized (case and whitespace folded, so 'New  Delhi ' and
+'new delhi' are one location) and interned into a dict from name to id,
+so a lookup is one hash probe however many locations there are. Each id
+carries the value the model sees as its `location_code` feature:
+
+    code        the id itself, like LabelEncoder (the original encoding)
+    frequency   the location's share of the training transactions
+    target      its fraud rate, smoothed towards the overall rate:
+                (fraud + smoothing * prior) / (count + smoothing)
+
+Locations seen fewer than `min_count` times in training are not indexed:
+they share one extra id with every location never seen at all, whose
+value is that of the pooled rare locations (the prior when there were
+none; the middle code for `code`, as the service always did). So a
+location seen a handful of times is not given a rate from a handful of
+labels, and an unseen one gets an informed value instead of some other
+city's code.
+
+The index is built by train.py, saved in the model artifact (names and
+values as arrays) and loaded by the service with the model, so both
+sides encode locations the same way.
+"""
+import sys
+from collections import Counter
+
+import numpy as np
+
+ENCODINGS = ('code', 'frequency', 'target')
+
+def normalize_location(location):
+    return ' '.join(str(location).split()).casefold()
+
+def count_locations(locations, labels=None, counts=None):
+    """Add transactions and fraud labels per normalized location to counts ({name: [n, fraud]})"""
+    counts = {} if counts is None else counts
+    totals = Counter(normalize_location(location) for location in locations)
+    fraud = Counter()
+    if labels is not None:
+        fraud.update(normalize_location(location) for location, label in zip(locations, labels) if label)
+    for name, n in totals.items():
+        entry = counts.setdefault(name, [0, 0])
+        entry[0] += n
+        entry[1] += fraud[name]
+    return counts
+
+
+class LocationIndex:
+    """Normalized location -> id, and id -> feature value (one extra id for rare and unseen locations)"""
+
+    def __init__(self, names, values, unknown_code=None, encoding='code'):
+        self.names = np.asarray(names, dtype=str)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.unknown_code = len(self.names) if unknown_code is None else int(unknown_code)
+        self.encoding = encoding
+        self._index = {sys.intern(str(name)): code for code, name in enumerate(self.names.tolist())}
+
+    @classmethod
+    def from_classes(cls, classes):
+        """The index of a LabelEncoder: code encoding, unseen locations on the middle code"""
+        names = [normalize_location(location) for location in classes]
+        return cls(names, np.arange(len(names)), unknown_code=len(names) // 2)
+
+    @classmethod
+    def from_counts(cls, counts, encoding='target', min_count=1, smoothing=20.0):
+        """Index over {name: [transactions, fraud]}, from count_locations()"""
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown location encoding: {encoding} (choose from {', '.join(ENCODINGS)})")
+        names = sorted(name for name, (n, _) in counts.items() if n >= min_count)
+        n = np.array([counts[name][0] for name in names], dtype=np.float64)
+        fraud = np.array([counts[name][1] for name in names], dtype=np.float64)
+        rare_n = sum(c for c, _ in counts.values()) - n.sum()
+        rare_fraud = sum(f for _, f in counts.values()) - fraud.sum()
+        rare_locations = len(counts) - len(names)
+        total = n.sum() + rare_n
+
+        if encoding == 'code':
+            values = np.append(np.arange(len(names)), len(names) // 2)
+        elif encoding == 'frequency':
+            values = np.append(n / total, rare_n / rare_locations / total if rare_locations else 0.0)
+        else:
+            prior = (fraud.sum() + rare_fraud) / total if total else 0.0
+            values = np.append((fraud + smoothing * prior) / (n + smoothing),
+                               (rare_fraud + smoothing * prior) / (rare_n + smoothing))
+        return cls(names, values, encoding=encoding)
+
+    @classmethod
+    def fit(cls, locations, labels=None, encoding='target', min_count=1, smoothing=20.0):
+        return cls.from_counts(count_locations(locations, labels), encoding, min_count, smoothing)
+
+    def __len__(self):
+        return len(self.names)
+
+    def lookup(self, location):
+        """Id of an indexed location, None otherwise"""
+        try:
+            code = self._index.get(location)  # already normalized
+        except TypeError:
+            code = None
+        if code is None:
+            code = self._index.get(normalize_location(location))
+        return code
+
+    def code(self, location):
+        """Id of a location, the shared rare/unseen id if it is not indexed"""
+        code = self.lookup(location)
+        return self.unknown_code if code is None else code
+
+    def codes(self, locations):
+        """Ids of many locations, as an intp array"""
+        seen = {}
+        codes = np.empty(len(locations), dtype=np.intp)
+        for i, location in enumerate(locations):
+            try:
+                code = seen.get(location)
+                if code is None:
+                    code = seen[location] = self.code(location)
+            except TypeError:
+                code = self.code(location)
+            codes[i] = code
+        return codes
+
+    def encode(self, locations):
+        """The location_code feature of many locations"""
+        return self.values[self.codes(locations)]
+
+    def arrays(self):
+        return {'location_names': self.names, 'location_values': self.values}
+
+    def spec(self):
+        return {'location_encoding': self.encoding, 'unknown_location_code': self.unknown_code}
+
+    def stats(self):
+        return {'locations': len(self), 'encoding': self.encoding, 'unknown_code': self.unknown_code}
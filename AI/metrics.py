@@ -0,0 +1,130 @@
+import math
+import time
+from bisect import bisect_left
+
+# Histogram bucket upper bounds: 1 µs to 100 s, 20 buckets per decade (~12% wide)
+BUCKET_BOUNDS = [10 ** (exp / 20) * 1e-6 for exp in range(0, 8 * 20 + 1)]
+
+class LatencyHistogram:
+    """Fixed log-spaced latency histogram; observing is one bisect and one increment"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (0 < q < 1)"""
+        count = sum(self.counts)
+        if not count:
+            return 0.0
+        rank = math.ceil(q * count)
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(BUCKET_BOUNDS[i], self.max) if i < len(BUCKET_BOUNDS) else self.max
+        return self.max
+
+    def summary(self):
+        count = sum(self.counts)
+        return {
+            'count': count,
+            'mean_ms': round(self.total / count * 1e3, 4) if count else 0.0,
+            'p50_ms': round(self.percentile(0.50) * 1e3, 4),
+            'p95_ms': round(self.percentile(0.95) * 1e3, 4),
+            'p99_ms': round(self.percentile(0.99) * 1e3, 4),
+            'max_ms': round(self.max * 1e3, 4)
+        }
+
+
+class StageTimer:
+    """Times consecutive stages of one request: call lap(stage) as each one ends"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.start = self.last = time.perf_counter()
+
+    def lap(self, stage, now=None):
+        """Record a stage that ended now (or at `now`, a perf_counter() reading)"""
+        now = time.perf_counter() if now is None else now
+        self.metrics.observe(stage, now - self.last)
+        self.last = now
+
+    def skip(self):
+        """Restart the clock without recording, e.g. after a stage that did not run"""
+        self.last = time.perf_counter()
+
+    def finish(self, stage='total'):
+        self.metrics.observe(stage, time.perf_counter() - self.start)
+
+
+class Metrics:
+    """Per-stage latency histograms, request throughput and error counters
+
+    Everything is plain counters updated without locks, cheap enough to keep
+    on in production; under concurrent requests counts are approximate.
+    """
+
+    def __init__(self, window=60):
+        self.started = time.time()
+        self.window = window
+        self.stages = {}
+        self.counters = {}
+        self.errors = {}
+        self._second_counts = [0] * window
+        self._second_stamps = [0] * window
+
+    def timer(self):
+        return StageTimer(self)
+
+    def observe(self, stage, seconds):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = LatencyHistogram()
+        histogram.observe(seconds)
+
+    def incr(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def error(self, stage):
+        self.errors[stage] = self.errors.get(stage, 0) + 1
+
+    def request(self, endpoint, transactions=1):
+        """Count a served request (and the transactions it scored) for throughput"""
+        self.incr(f'requests.{endpoint}')
+        self.incr('transactions', transactions)
+        second = int(time.time())
+        slot = second % self.window
+        if self._second_stamps[slot] != second:
+            self._second_stamps[slot] = second
+            self._second_counts[slot] = 0
+        self._second_counts[slot] += transactions
+
+    def throughput(self):
+        now = int(time.time())
+        recent = sum(count for count, stamp in zip(self._second_counts, self._second_stamps)
+                     if now - self.window < stamp <= now)
+        uptime = max(time.time() - self.started, 1e-9)
+        return {
+            'transactions_per_s': round(self.counters.get('transactions', 0) / uptime, 2),
+            f'transactions_per_s_last_{self.window}s': round(recent / min(self.window, uptime), 2)
+        }
+
+    def snapshot(self):
+        return {
+            'uptime_s': round(time.time() - self.started, 1),
+            'throughput': self.throughput(),
+            'counters': dict(self.counters),
+            'errors': dict(self.errors),
+            'stages': {stage: histogram.summary() for stage, histogram in self.stages.items()}
+        }
+
+# Create global instance
+metrics = Metrics()
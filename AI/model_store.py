@@ -0,0 +1,318 @@
+"""Versioned, memory-mapped model artifacts
+
+    models/
+        CURRENT                  name of the live version
+        20261017-120000/
+            manifest.json        version, feature names, scalar parameters,
+                                 and dtype/shape of every array file
+            forest.*.npy         flattened forest, scaler and location index
+            table.*.npy          compiled lookup table (when train.py built one)
+            estimator.pkl        fitted sklearn objects, for training tools only
+
+The service never unpickles anything: every array is opened with
+np.load(mmap_mode='r'), so loading is a few header reads, and all worker
+processes serving the same version share one copy of it in the page cache.
+Versions are written to a temporary directory and renamed into place, then
+CURRENT is replaced atomically, so a reader never sees a half-written model.
+"""
+import json
+import mmap
+import os
+import pickle
+import shutil
+import sys
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from fast_model import FastForest
+from forest_table import ForestTable
+from locations import LocationIndex
+
+FORMAT_VERSION = 1
+
+def _save_arrays(directory, prefix, arrays):
+    specs = {}
+    for name, array in arrays.items():
+        array = np.asarray(array)
+        if array.dtype == object:
+            array = array.astype(str)  # e.g. location names, so the file can be mapped
+        filename = f'{prefix}.{name}.npy'
+        np.save(os.path.join(directory, filename), array, allow_pickle=False)
+        specs[name] = {'file': filename, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+    return specs
+
+def _load_arrays(directory, specs, mmap_mode):
+    arrays = {}
+    for name, spec in specs.items():
+        array = np.load(os.path.join(directory, spec['file']), mmap_mode=mmap_mode, allow_pickle=False)
+        if array.dtype.str != spec['dtype'] or list(array.shape) != spec['shape']:
+            raise ValueError(f"{spec['file']} does not match the manifest")
+        arrays[name] = np.asarray(array)  # plain ndarray view, still backed by the mapping
+    return arrays
+
+def save_artifact(root, model_data, forest_table=None, metadata=None, keep=5):
+    """Write a new version under root, make it CURRENT and return its name"""
+    os.makedirs(root, exist_ok=True)
+    version = datetime.now().strftime('%Y%m%d-%H%M%S')
+    suffix = 1
+    while os.path.exists(os.path.join(root, version)):
+        version = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{suffix}"
+        suffix += 1
+
+    staging = os.path.join(root, f'.tmp-{version}-{os.getpid()}')
+    os.makedirs(staging)
+    try:
+        forest = FastForest.from_model_data(model_data)
+        manifest = {
+            'format': FORMAT_VERSION,
+            'version': version,
+            'created': datetime.now().isoformat(),
+            'feature_names': list(model_data['feature_names']),
+            'forest': {
+                'depth': int(forest.depth),
+                **forest.locations.spec(),
+                'arrays': _save_arrays(staging, 'forest', forest.arrays())
+            },
+            'estimator': 'estimator.pkl',
+            'metadata': metadata or {}
+        }
+        if forest_table is not None:
+            manifest['table'] = {
+                'unknown_location_code': int(forest_table.unknown_location_code),
+                'amount_mean': forest_table.amount_mean,
+                'amount_scale': forest_table.amount_scale,
+                'arrays': _save_arrays(staging, 'table', forest_table.arrays())
+            }
+
+        with open(os.path.join(staging, 'estimator.pkl'), 'wb') as f:
+            pickle.dump({name: model_data[name] for name in
+                         ('model', 'scaler', 'location_index', 'feature_names')}, f)
+        with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        os.rename(staging, os.path.join(root, version))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    _write_current(root, version)
+    _prune(root, keep)
+    return version
+
+def _write_current(root, version):
+    tmp = os.path.join(root, f'.CURRENT-{os.getpid()}')
+    with open(tmp, 'w') as f:
+        f.write(version + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(root, 'CURRENT'))
+
+def _prune(root, keep):
+    """Delete all but the newest `keep` versions (mapped files stay valid for running readers)"""
+    current = current_version(root)
+    versions = sorted(name for name in os.listdir(root)
+                      if os.path.isfile(os.path.join(root, name, 'manifest.json')))
+    for name in versions[:-keep] if keep else []:
+        if name != current:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+def current_version(root):
+    try:
+        with open(os.path.join(root, 'CURRENT')) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class Artifact:
+    """One loaded model version: the forest, its lookup table if compiled, and the manifest"""
+
+    def __init__(self, path, mmap_mode='r'):
+        self.path = path
+        with open(os.path.join(path, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('format') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported artifact format: {self.manifest.get('format')}")
+        self.version = self.manifest['version']
+        feature_names = self.manifest['feature_names']
+
+        spec = self.manifest['forest']
+        arrays = _load_arrays(path, spec['arrays'], mmap_mode)
+        if 'location_classes' in arrays:
+            # Written before the location index: LabelEncoder classes, unseen locations on the middle code
+            self.locations = LocationIndex.from_classes(arrays.pop('location_classes'))
+        else:
+            self.locations = LocationIndex(arrays.pop('location_names'), arrays.pop('location_values'),
+                                           spec['unknown_location_code'], spec['location_encoding'])
+        self.forest = FastForest(feature_names=feature_names, depth=spec['depth'],
+                                 locations=self.locations, **arrays)
+
+        self.table = None
+        spec = self.manifest.get('table')
+        if spec:
+            arrays = _load_arrays(path, spec['arrays'], mmap_mode)
+            self.table = ForestTable(
+                classes=arrays['classes'],
+                locations=self.locations,
+                amount_mean=spec['amount_mean'],
+                amount_scale=spec['amount_scale'],
+                breaks=arrays['breaks'],
+                offsets=arrays['offsets'],
+                proba=arrays['proba'],
+                missing_proba=arrays.get('missing_proba')
+            )
+
+        # Serving path: the exact lookup table when there is one, else the flattened forest
+        self.model = self.table or self.forest
+
+    @property
+    def nbytes(self):
+        """Bytes of the mapped arrays"""
+        arrays = [*self.forest.arrays().values(), *(self.table.arrays().values() if self.table else ())]
+        return int(sum(array.nbytes for array in arrays))
+
+    def warm(self):
+        """Fault in every page of the mapped arrays and score one row, so the first request doesn't pay for it"""
+        arrays = [*self.forest.arrays().values(), *(self.table.arrays().values() if self.table else ())]
+        for array in arrays:
+            if array.size and array.flags.c_contiguous:
+                int(array.view(np.uint8)[::mmap.PAGESIZE].sum())
+        self.model.predict_proba_one(0.0, self.model.unknown_location_code, 12, 0, 0)
+
+    def load_estimator(self):
+        """The fitted sklearn model, scaler and location index (training tools only, never the service)"""
+        with open(os.path.join(self.path, self.manifest['estimator']), 'rb') as f:
+            estimator = pickle.load(f)
+        estimator.setdefault('location_index', self.locations)  # older versions pickled a LabelEncoder
+        return estimator
+
+
+class ModelStore:
+    """The live model version, swapped in atomically when CURRENT changes
+
+    Request handlers read `model` once and use that object for the whole
+    request; a reload builds the new Artifact off to the side and replaces
+    the reference in one assignment, so in-flight requests finish on the
+    old version and nothing is dropped. The watcher thread is started
+    lazily in each process, like the decision log writer.
+
+    The first load can run in a background thread (load_in_background), so
+    the process starts serving before the model is in; `ready` tells when
+    it is.
+    """
+
+    def __init__(self, root='models', reload_interval=5.0, mmap_mode='r'):
+        self.root = root
+        self.reload_interval = reload_interval
+        self.mmap_mode = mmap_mode
+        self.artifact = None
+        self.loaded_at = None
+        self.counts = {'reloads': 0, 'reload_errors': 0}
+        self.load_seconds = None
+        self.load_error = None
+        self.loaded = threading.Event()  # set once the first load finished, successfully or not
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Configure from MODEL_DIR and MODEL_RELOAD_INTERVAL (0 disables hot reload)"""
+        return cls(
+            root=os.environ.get('MODEL_DIR', 'models'),
+            reload_interval=float(os.environ.get('MODEL_RELOAD_INTERVAL', 5.0))
+        )
+
+    @property
+    def model(self):
+        """Scoring model of the live version, None if nothing is loaded"""
+        if self.reload_interval and self._pid != os.getpid():
+            self._ensure_watcher()
+        artifact = self.artifact
+        return artifact.model if artifact else None
+
+    @property
+    def ready(self):
+        return self.artifact is not None
+
+    @property
+    def version(self):
+        artifact = self.artifact
+        return artifact.version if artifact else None
+
+    def load(self):
+        """Load the CURRENT version if it differs from the live one; True if it was swapped in"""
+        with self._lock:
+            version = current_version(self.root)
+            if version is None:
+                raise FileNotFoundError(f"No model artifact in {self.root}/ (run train.py)")
+            if version == self.version:
+                return False
+            self.artifact = Artifact(os.path.join(self.root, version), self.mmap_mode)
+            self.loaded_at = time.time()
+            self.load_error = None  # a model is in now, whatever the first load ran into
+            return True
+
+    def initial_load(self):
+        """First load, warmed up and timed; failures are recorded in load_error rather than raised"""
+        start = time.perf_counter()
+        try:
+            self.load()
+            self.artifact.warm()
+        except Exception as e:
+            self.load_error = f'{type(e).__name__}: {e}'
+        self.load_seconds = time.perf_counter() - start
+        self.loaded.set()
+        return self.load_error is None
+
+    def load_in_background(self):
+        threading.Thread(target=self.initial_load, name='model-load', daemon=True).start()
+
+    def wait(self, timeout=None):
+        """Block until the first load finished; True if a model is ready"""
+        self.loaded.wait(timeout)
+        return self.ready
+
+    def _ensure_watcher(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                threading.Thread(target=self._watch, name='model-reload', daemon=True).start()
+                self._pid = os.getpid()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.reload_interval)
+            previous = self.version
+            try:
+                if self.load():
+                    self.counts['reloads'] += 1
+                    print(f"🔄 Model reloaded: {previous} -> {self.version}", file=sys.stderr)
+            except Exception as e:
+                self.counts['reload_errors'] += 1
+                print(f"⚠️ Model reload failed, keeping {previous}: {e}", file=sys.stderr)
+
+    def stats(self):
+        return {
+            'version': self.version,
+            'path': self.artifact.path if self.artifact else None,
+            'kind': type(self.artifact.model).__name__ if self.artifact else None,
+            'loaded_at': datetime.fromtimestamp(self.loaded_at).isoformat() if self.loaded_at else None,
+            'reload_interval': self.reload_interval,
+            'load_s': round(self.load_seconds, 4) if self.load_seconds is not None else None,
+            'load_error': self.load_error,
+            **self.counts
+        }
+
+
+if __name__ == '__main__':
+    # Convert a legacy model.pkl into an artifact: python model_store.py model.pkl [models]
+    if len(sys.argv) < 2:
+        sys.exit("usage: python model_store.py model.pkl [models_dir]")
+    with open(sys.argv[1], 'rb') as f:
+        legacy = pickle.load(f)
+    legacy['location_index'] = LocationIndex.from_classes(legacy['location_encoder'].classes_)
+    root = sys.argv[2] if len(sys.argv) > 2 else 'models'
+    version = save_artifact(root, legacy, legacy.get('forest_table'), {'imported_from': sys.argv[1]})
+    print(f"✅ Wrote {root}/{version}")
@@ -0,0 +1,155 @@
+"""Online model updates from the labels posted to /feedback
+
+    python online.py                             # one update from the new rows of feedback.jsonl
+    python online.py --trees 10 --max-trees 200  # grow 10 trees per update, keep the newest 200
+    python online.py --watch 300                 # keep updating every 5 minutes
+
+Instead of retraining on everything, each update grows --trees new trees
+with warm_start on the labels added since the live model was built. The
+existing trees, scaler and location index stay as they are, so what the
+model learned before is kept; past --max-trees the oldest trees are
+dropped, so the forest slowly follows recent fraud patterns. The result
+is published like train.py's output, as a new artifact version made
+CURRENT atomically, and running services swap it in on their next reload.
+
+The byte offset of the feedback consumed is stored in the new version's
+manifest, so the next update starts where the live model left off, and a
+failed update never skips labels. A version written by train.py starts
+from the beginning of the feedback file. Run one learner per models
+directory.
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from features import local_time_features
+from model_store import Artifact, current_version, save_artifact
+from train import build_forest_table, phase
+from velocity import VELOCITY_DEFAULTS, VELOCITY_FEATURES
+
+def read_feedback(path, offset):
+    """Labels appended since offset: (rows, offset after the last complete line, bad lines)"""
+    try:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return [], offset, 0
+    complete = data.rfind(b'\n') + 1  # a line still being written is left for next time
+    rows, bad = [], 0
+    for line in data[:complete].splitlines():
+        try:
+            rows.append(json.loads(line))
+        except ValueError:
+            bad += 1
+    return rows, offset + complete, bad
+
+def feature_frame(rows, feature_names, location_index):
+    """Model features of feedback rows, the way /predict computed them"""
+    hour, day_of_week = local_time_features([row['time'] for row in rows])
+    columns = {
+        'amount': np.array([row['amount'] for row in rows], dtype=np.float64),
+        'location_code': location_index.encode([row['location'] for row in rows]),
+        'hour': hour,
+        'day_of_week': day_of_week,
+        'is_weekend': (day_of_week >= 5).astype(np.int64)
+    }
+    for name in VELOCITY_FEATURES:
+        # Missing features (rows without velocity, or from before a feature existed) as serving has them without history
+        default = VELOCITY_DEFAULTS[name]
+        columns[name] = np.array([(row['velocity'] or {}).get(name, default) for row in rows], dtype=np.float64)
+    return pd.DataFrame({name: columns[name] for name in feature_names})
+
+def update(models_dir, feedback_path, trees=10, max_trees=300, min_rows=50):
+    """Grow the live forest on new feedback and publish it; the new version, or None if nothing to do"""
+    version = current_version(models_dir)
+    if version is None:
+        raise FileNotFoundError(f"No model artifact in {models_dir}/ (run train.py)")
+    artifact = Artifact(os.path.join(models_dir, version))
+    state = artifact.manifest['metadata'].get('online') or {}
+    offset = state.get('feedback_offset', 0) if state.get('feedback_file') == os.path.abspath(feedback_path) else 0
+
+    rows, new_offset, bad = read_feedback(feedback_path, offset)
+    labels = np.array([row['fraud'] for row in rows], dtype=np.int64)
+    if len(rows) < min_rows or len(np.unique(labels)) < 2:
+        print(f"⏳ {len(rows)} new labels since {version} ({int(labels.sum())} fraud): "
+              f"waiting for {min_rows} with both classes")
+        return None
+
+    report = {}
+    estimator = artifact.load_estimator()
+    model, scaler, location_index = estimator['model'], estimator['scaler'], estimator['location_index']
+    feature_names = estimator['feature_names']
+    X = scaler.transform(feature_frame(rows, feature_names, location_index))
+    accuracy_before = float(model.score(X, labels))
+
+    with phase('train', report):
+        print(f"Growing {trees} trees on {len(rows)} new labels ({int(labels.sum())} fraud)...")
+        # Seeded by the offset: once old trees are dropped, the forest's own seed would repeat
+        model.set_params(warm_start=True, n_estimators=len(model.estimators_) + trees,
+                         random_state=new_offset % 2**31)
+        model.fit(X, labels)
+        dropped = max(0, len(model.estimators_) - max_trees)
+        if dropped:
+            model.estimators_ = model.estimators_[dropped:]
+            model.n_estimators = len(model.estimators_)
+    accuracy_after = float(model.score(X, labels))
+    print(f"Accuracy on the new labels: {accuracy_before:.3f} -> {accuracy_after:.3f} "
+          f"({len(model.estimators_)} trees, {dropped} oldest dropped)")
+
+    forest_table = build_forest_table(model, scaler, location_index, feature_names, report)
+    with phase('save', report):
+        new_version = save_artifact(models_dir, {
+            'model': model,
+            'scaler': scaler,
+            'location_index': location_index,
+            'feature_names': feature_names
+        }, forest_table, metadata={
+            **{key: value for key, value in artifact.manifest['metadata'].items() if key not in ('online', 'phases')},
+            'online': {
+                'base_version': version,
+                'feedback_file': os.path.abspath(feedback_path),
+                'feedback_offset': new_offset,
+                'labels': len(rows),
+                'fraud': int(labels.sum()),
+                'without_velocity': sum(row['velocity'] is None for row in rows),
+                'bad_lines': bad,
+                'trees_added': trees,
+                'trees_dropped': dropped,
+                'accuracy_before': accuracy_before,
+                'accuracy_after': accuracy_after
+            },
+            'phases': report
+        })
+    print(f"✅ Published {models_dir}/{new_version} (from {version})")
+    return new_version
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Update the live model from /feedback labels')
+    parser.add_argument('--feedback', default=os.environ.get('FEEDBACK_FILE', 'feedback.jsonl'),
+                        help='label file written by /feedback (default FEEDBACK_FILE or feedback.jsonl)')
+    parser.add_argument('--models-dir', default=os.environ.get('MODEL_DIR', 'models'),
+                        help='artifact directory (default MODEL_DIR or models)')
+    parser.add_argument('--trees', type=int, default=10, help='trees grown per update (default 10)')
+    parser.add_argument('--max-trees', type=int, default=300, help='oldest trees dropped past this (default 300)')
+    parser.add_argument('--min-rows', type=int, default=50, help='new labels needed for an update (default 50)')
+    parser.add_argument('--watch', type=float, default=0, metavar='SECONDS',
+                        help='keep running, checking for new labels this often (default 0: once)')
+    args = parser.parse_args(argv)
+
+    if not args.watch:
+        update(args.models_dir, args.feedback, args.trees, args.max_trees, args.min_rows)
+        return
+    while True:
+        try:
+            update(args.models_dir, args.feedback, args.trees, args.max_trees, args.min_rows)
+        except Exception as e:
+            print(f"⚠️ Online update failed, trying again in {args.watch:g}s: {e}")
+        time.sleep(args.watch)
+
+if __name__ == '__main__':
+    main()
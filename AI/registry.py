@@ -0,0 +1,250 @@
+"""Per-region / per-segment models, loaded on demand under a memory budget
+
+    models/registry/
+        routes.json              {"mumbai": "west", "pune": "west", "new delhi": "north", ...}
+        west/                    one artifact directory per model, as written by
+            CURRENT                  python train.py --models-dir models/registry/west
+            20261017-120000/
+        north/
+        ...
+
+A request is scored by the model named in its X-Model header, else by
+the model whose routes.json prefix is the longest match of its
+normalized location (locations.py), else by the shared fallback: the
+service's main model (model_store.py). Unknown names fall back too.
+
+Registry models are opened the first time a request needs one (a
+memory-mapped Artifact, so that is a few header reads) and kept in LRU
+order; when the arrays of the resident models add up to more than
+`budget_mb`, the least recently used are dropped. The fallback is never
+dropped and does not count against the budget. Each resident model
+checks its CURRENT at most every `reload_interval` seconds, when it is
+used, and swaps in a new version the way the main model does, so one
+process can host hundreds of small models without loading all of them
+at startup or watching all of them. routes.json is re-read, and names
+that had no model are looked for again, on the same interval.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from locations import normalize_location
+from metrics import LatencyHistogram
+from model_store import Artifact, current_version
+
+MAX_MISSING = 10000  # names remembered as having no model (header values are arbitrary)
+
+class _Entry:
+    """A resident registry model"""
+
+    __slots__ = ('name', 'artifact', 'model', 'tag', 'nbytes', 'checked')
+
+    def __init__(self, name, artifact):
+        self.name = name
+        self.artifact = artifact
+        self.model = artifact.model
+        self.tag = (name, artifact.version)  # part of decision cache keys
+        self.nbytes = artifact.nbytes
+        self.checked = time.monotonic()
+
+
+class ModelRegistry:
+    """Named models on top of the fallback ModelStore, selected per request"""
+
+    header = 'X-Model'
+
+    def __init__(self, root='', fallback=None, budget_mb=256, reload_interval=5.0, mmap_mode='r'):
+        self.root = root
+        self.fallback = fallback
+        self.budget = budget_mb * 1024 * 1024
+        self.reload_interval = reload_interval
+        self.mmap_mode = mmap_mode
+        self.enabled = bool(root) and os.path.isdir(root)
+        self.routes = self._read_routes() if self.enabled else {}
+        self._lengths = sorted({len(prefix) for prefix in self.routes}, reverse=True)
+        self.resident_bytes = 0
+        self.load_latency = LatencyHistogram()
+        self.counts = {'hits': 0, 'misses': 0, 'fallbacks': 0, 'unknown_names': 0, 'loads': 0,
+                       'load_errors': 0, 'reloads': 0, 'evictions': 0}
+        self._entries = OrderedDict()  # name -> _Entry, least recently used first
+        self._missing = set()          # names without a model, not looked for again until the next scan
+        self._scanned = time.monotonic()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()  # one load at a time, so concurrent misses load a model once
+
+    @classmethod
+    def from_env(cls, fallback):
+        """Configure from MODEL_REGISTRY_DIR (unset: off), MODEL_REGISTRY_BUDGET_MB and MODEL_RELOAD_INTERVAL"""
+        return cls(
+            root=os.environ.get('MODEL_REGISTRY_DIR', ''),
+            fallback=fallback,
+            budget_mb=float(os.environ.get('MODEL_REGISTRY_BUDGET_MB', 256)),
+            reload_interval=float(os.environ.get('MODEL_RELOAD_INTERVAL', 5.0))
+        )
+
+    def _read_routes(self):
+        try:
+            with open(os.path.join(self.root, 'routes.json')) as f:
+                routes = json.load(f)
+        except FileNotFoundError:
+            return {}
+        return {normalize_location(prefix): name for prefix, name in routes.items()}
+
+    def route(self, location):
+        """Model name for a location by longest routes.json prefix, None if no prefix matches"""
+        if not self._lengths:
+            return None
+        location = normalize_location(location)
+        for length in self._lengths:
+            name = self.routes.get(location[:length])
+            if name is not None:
+                return name
+        return None
+
+    def select(self, name=None, location=None):
+        """(model, cache tag) for a request: the named or routed model, else (fallback.model, None)"""
+        if self.enabled:
+            if self.reload_interval and time.monotonic() - self._scanned > self.reload_interval:
+                self.rescan()
+            name = name or self.route(location)
+            if name:
+                entry = self.get(name)
+                if entry is not None:
+                    return entry.model, entry.tag
+        self.counts['fallbacks'] += 1
+        return self.fallback.model, None
+
+    def partition(self, name, locations):
+        """select() for a batch: [(model, row indices)], the indices None when one model takes every row"""
+        if not self.enabled or name or not self._lengths:
+            return [(self.select(name)[0], None)]
+        routed = {}
+        groups = {}
+        for i, location in enumerate(locations):
+            try:
+                route = routed[location]
+            except KeyError:
+                route = routed[location] = self.route(location)
+            except TypeError:
+                route = self.route(location)
+            groups.setdefault(route, []).append(i)
+        selected = {}
+        for route, rows in groups.items():
+            model, tag = self.select(route)
+            selected.setdefault(tag, (model, []))[1].extend(rows)
+        if len(selected) == 1:
+            return [(next(iter(selected.values()))[0], None)]
+        return [(model, np.array(sorted(rows), dtype=np.intp)) for model, rows in selected.values()]
+
+    def get(self, name):
+        """The resident entry for a model name, loading it if needed; None if there is no such model"""
+        entry = self._entries.get(name)
+        if entry is not None:
+            if self.reload_interval and time.monotonic() - entry.checked > self.reload_interval:
+                entry = self._refresh(entry)
+            with self._lock:
+                if name in self._entries:
+                    self._entries.move_to_end(name)
+            self.counts['hits'] += 1
+            return entry
+        if name in self._missing:
+            return None
+        return self._load(name)
+
+    def _load(self, name):
+        if not isinstance(name, str) or name.startswith('.') or os.sep in name:
+            self.counts['unknown_names'] += 1
+            return None
+        with self._load_lock:
+            entry = self._entries.get(name)  # loaded while this request waited
+            if entry is not None:
+                self.counts['hits'] += 1
+                return entry
+            self.counts['misses'] += 1
+            path = os.path.join(self.root, name)
+            try:
+                version = current_version(path)
+            except OSError:  # e.g. routes.json itself
+                version = None
+            if version is None:
+                self.counts['unknown_names'] += 1
+                if len(self._missing) >= MAX_MISSING:
+                    self._missing.clear()
+                self._missing.add(name)
+                return None
+            start = time.perf_counter()
+            try:
+                entry = _Entry(name, Artifact(os.path.join(path, version), self.mmap_mode))
+            except Exception as e:
+                self.counts['load_errors'] += 1
+                print(f"⚠️ Registry model {name} failed to load: {e}", file=sys.stderr)
+                return None
+            self.load_latency.observe(time.perf_counter() - start)
+            self.counts['loads'] += 1
+            self._admit(entry)
+            return entry
+
+    def _refresh(self, entry):
+        """Swap in a new version of a resident model if its CURRENT changed"""
+        entry.checked = time.monotonic()
+        path = os.path.join(self.root, entry.name)
+        version = current_version(path)
+        if version is None or version == entry.artifact.version:
+            return entry
+        try:
+            fresh = _Entry(entry.name, Artifact(os.path.join(path, version), self.mmap_mode))
+        except Exception as e:
+            self.counts['load_errors'] += 1
+            print(f"⚠️ Registry model {entry.name} reload failed, keeping {entry.artifact.version}: {e}",
+                  file=sys.stderr)
+            return entry
+        self.counts['reloads'] += 1
+        self._admit(fresh)
+        return fresh
+
+    def _admit(self, entry):
+        """Make entry resident (replacing an older version) and evict down to the budget"""
+        with self._lock:
+            old = self._entries.pop(entry.name, None)
+            if old is not None:
+                self.resident_bytes -= old.nbytes
+            self._entries[entry.name] = entry
+            self.resident_bytes += entry.nbytes
+            while self.resident_bytes > self.budget and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.resident_bytes -= evicted.nbytes
+                self.counts['evictions'] += 1
+
+    def rescan(self):
+        """Re-read routes.json and look for names that had no model again"""
+        self._scanned = time.monotonic()
+        try:
+            routes = self._read_routes()
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"⚠️ Registry routes.json unreadable, keeping the old routes: {e}", file=sys.stderr)
+        else:
+            self.routes, self._lengths = routes, sorted({len(prefix) for prefix in routes}, reverse=True)
+        self._missing.clear()
+
+    def stats(self):
+        lookups = self.counts['hits'] + self.counts['misses']
+        with self._lock:
+            resident = {name: {'version': entry.artifact.version, 'bytes': entry.nbytes}
+                        for name, entry in self._entries.items()}
+        return {
+            'enabled': self.enabled,
+            'root': self.root,
+            'routes': len(self.routes),
+            'budget_bytes': int(self.budget),
+            'resident_bytes': self.resident_bytes,
+            'resident_models': len(resident),
+            'hit_rate': round(self.counts['hits'] / lookups, 4) if lookups else 0.0,
+            'load': self.load_latency.summary(),
+            **self.counts,
+            'resident': resident
+        }
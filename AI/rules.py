@@ -0,0 +1,328 @@
+import operator
+import string
+import time
+import numpy as np
+
+# ============================================
+# RULE TABLE
+# ============================================
+#
+# Rules run group by group, in order. In a 'first' group only the first
+# matching rule applies (an if/elif chain); in an 'all' group every
+# matching rule applies. Conditions are (field, op, value) where value is
+# a THRESHOLDS key or a literal, or ('any', [conditions...]).
+#
+# Fields: amount, hour, late_night, has_description, suspicious_count,
+# safe_category, is_emergency, is_fraud (current decision) and the
+# velocity features, user_amount_percentile among them (velocity.py)
+#
+# Actions: 'fraud' sets the decision, 'score_min' / 'score_max' raise or
+# cap fraud_score, 'clamp' keeps it within [low, high] and 'reason' is
+# added to the response.
+
+RULE_GROUPS = [
+    ('amount', 'first'),
+    ('category', 'first'),
+    ('keywords', 'all'),
+    ('final', 'all'),
+]
+
+RULES = [
+    # RULE 1: EXTREME AMOUNT (> ₹2,00,000)
+    {'name': 'RULE 1', 'group': 'amount',
+     'when': [('amount', '>', 'EXTREME_AMOUNT')],
+     'fraud': True, 'score_min': 'FRAUD_CONFIDENCE_HIGH',
+     'reason': "🚨 EXTREME AMOUNT: ₹{amount:,.2f} (> ₹2,00,000)"},
+
+    # RULE 2: VERY HIGH AMOUNT (> ₹1,00,000) + LATE NIGHT
+    {'name': 'RULE 2', 'group': 'amount',
+     'when': [('amount', '>', 'VERY_HIGH_AMOUNT'), ('late_night', '==', True)],
+     'fraud': True, 'score_min': 'FRAUD_CONFIDENCE_MEDIUM',
+     'reason': "🚨 Very high amount (₹{amount:,.2f}) during late night"},
+
+    # RULE 3: HIGH AMOUNT (> ₹50,000) + SUSPICIOUS KEYWORDS
+    {'name': 'RULE 3', 'group': 'amount',
+     'when': [('amount', '>', 'HIGH_AMOUNT'), ('suspicious_count', '>', 0)],
+     'fraud': True, 'score_min': 'FRAUD_CONFIDENCE_MEDIUM',
+     'reason': "🚨 High amount + {suspicious_count} suspicious keyword(s)"},
+
+    # RULE 4: HIGH AMOUNT (> ₹50,000) + NO DESCRIPTION
+    {'name': 'RULE 4', 'group': 'amount',
+     'when': [('amount', '>', 'HIGH_AMOUNT'), ('has_description', '==', False)],
+     'fraud': True, 'score_min': 'FRAUD_CONFIDENCE_LOW',
+     'reason': "⚠️ High amount with no description"},
+
+    # RULE 5: MEDIUM AMOUNT (> ₹25,000) + LATE NIGHT + SUSPICIOUS
+    {'name': 'RULE 5', 'group': 'amount',
+     'when': [('amount', '>', 'MEDIUM_AMOUNT'), ('late_night', '==', True), ('suspicious_count', '>', 0)],
+     'fraud': True, 'score_min': 'FRAUD_CONFIDENCE_LOW',
+     'reason': "⚠️ Medium amount + late night + suspicious keywords"},
+
+    # RULE 11: UNUSUAL AMOUNT FOR THIS USER (> ₹10,000 and above their usual spend)
+    {'name': 'RULE 11', 'group': 'amount',
+     'when': [('amount', '>', 'LOW_AMOUNT'), ('user_amount_history', '>=', 'USER_AMOUNT_MIN_HISTORY'),
+              ('user_amount_percentile', '>=', 'USER_AMOUNT_PERCENTILE')],
+     'fraud': True, 'score_min': 'FRAUD_CONFIDENCE_LOW',
+     'reason': "⚠️ Unusual amount for this user: ₹{amount:,.2f}, above {user_amount_percentile:.1%} of their past payments"},
+
+    # RULE 6: HEALTHCARE OVERRIDE (with limits)
+    {'name': 'RULE 6', 'group': 'category',
+     'when': [('any', [('safe_category', '==', 'healthcare'), ('is_emergency', '==', True)]),
+              ('amount', '<=', 'HEALTHCARE_MAX_SAFE')],
+     'fraud': False, 'score_max': 0.1,
+     'reason': "✅ Genuine healthcare expense (₹{amount:,.2f})"},
+    {'name': 'RULE 6 (over limit)', 'group': 'category',
+     'when': [('any', [('safe_category', '==', 'healthcare'), ('is_emergency', '==', True)])],
+     'fraud': True, 'score_min': 0.7,
+     'reason': "🚨 Healthcare claim but amount too high: ₹{amount:,.2f}"},
+
+    # RULE 7: TRANSPORT OVERRIDE (Uber/Ola safe at any time)
+    {'name': 'RULE 7', 'group': 'category',
+     'when': [('safe_category', '==', 'transport'), ('amount', '<=', 'TRANSPORT_MAX_SAFE')],
+     'fraud': False, 'score_max': 0.1,
+     'reason': "✅ Transport expense (cab/uber)"},
+    {'name': 'RULE 7 (over limit)', 'group': 'category',
+     'when': [('safe_category', '==', 'transport')],
+     'reason': "⚠️ Transport expense with unusually high amount"},
+
+    # RULE 8: FOOD DELIVERY OVERRIDE
+    {'name': 'RULE 8', 'group': 'category',
+     'when': [('safe_category', '==', 'food'), ('amount', '<=', 'FOOD_MAX_SAFE')],
+     'fraud': False, 'score_max': 0.1,
+     'reason': "✅ Food delivery expense"},
+
+    # RULE 9: BILLS OVERRIDE
+    {'name': 'RULE 9', 'group': 'category',
+     'when': [('safe_category', '==', 'bills'), ('amount', '<=', 'BILLS_MAX_SAFE')],
+     'fraud': False, 'score_max': 0.15,
+     'reason': "✅ Bill payment"},
+
+    # RULE 10: SUSPICIOUS KEYWORDS (even with safe categories)
+    {'name': 'RULE 10', 'group': 'keywords',
+     'when': [('suspicious_count', '>=', 2)],
+     'fraud': True, 'score_min': 0.8,
+     'reason': "🚨 Multiple suspicious keywords detected"},
+
+    # FINAL SAFETY CHECKS
+    # Cap confidence between 0 and 1
+    {'name': 'Cap confidence', 'group': 'final',
+     'when': [],
+     'clamp': (0, 1)},
+    # Very small amounts (< ₹1000) are almost never fraud
+    {'name': 'Small amount', 'group': 'final',
+     'when': [('amount', '<', 1000), ('is_fraud', '==', False)],
+     'score_max': 0.1},
+]
+
+OPS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+# ============================================
+# ENGINE
+# ============================================
+
+class CompiledRule:
+    """One rule of the table with its conditions compiled to predicates"""
+
+    def __init__(self, spec, thresholds):
+        self.name = spec['name']
+        self.group = spec['group']
+        self.fraud = spec.get('fraud')
+        self.score_min = self._resolve(spec.get('score_min'), thresholds)
+        self.score_max = self._resolve(spec.get('score_max'), thresholds)
+        self.clamp = spec.get('clamp')
+        self.reason = spec.get('reason')
+        self.reason_fields = [field for _, field, _, _ in string.Formatter().parse(self.reason or '') if field]
+        self.fields = set(self.reason_fields)  # every transaction field the rule reads
+        self.conditions = [self._compile(cond, thresholds) for cond in spec['when']]
+
+        # Stats: evaluations, hits, nanoseconds spent
+        self.evaluations = 0
+        self.hits = 0
+        self.cost_ns = 0
+
+    @property
+    def has_effect(self):
+        return (self.fraud is not None or self.score_min is not None or self.score_max is not None
+                or self.clamp is not None or self.reason is not None)
+
+    @staticmethod
+    def _resolve(value, thresholds):
+        return thresholds[value] if isinstance(value, str) else value
+
+    def _compile(self, condition, thresholds):
+        """Condition -> predicate that works on a scalar dict or a dict of arrays"""
+        if condition[0] == 'any':
+            predicates = [self._compile(c, thresholds) for c in condition[1]]
+
+            def any_of(tx):
+                result = predicates[0](tx)
+                for predicate in predicates[1:]:
+                    result = result | predicate(tx)
+                return result
+            return any_of
+
+        field, op, value = condition
+        self.fields.add(field)
+        op = OPS[op]
+        if isinstance(value, str) and value in thresholds:
+            value = thresholds[value]
+        return lambda tx: op(tx[field], value)
+
+    def matches(self, tx):
+        """Scalar match; stops at the first false condition"""
+        for predicate in self.conditions:
+            if not predicate(tx):
+                return False
+        return True
+
+    def mask(self, arrays, candidates):
+        """Vectorized match restricted to `candidates`; stops once no row is left"""
+        mask = candidates
+        for predicate in self.conditions:
+            if not mask.any():
+                break
+            mask = mask & predicate(arrays)
+        return mask
+
+
+class RuleEngine:
+    """Compiled, declarative replacement for the RULE 1-10 if/elif chain
+
+    The rule table is compiled once against THRESHOLDS. `evaluate` runs it
+    for one transaction and `evaluate_batch` for arrays of transactions,
+    with the same first-match semantics: once a rule of a 'first' group
+    fires (or, in batch mode, once every row has matched), the rest of the
+    group is skipped. Rules that could never change the result are dropped
+    at compile time. Per-rule hit counts and evaluation cost are kept for
+    `stats()`; counters are updated without a lock, so they are approximate
+    under concurrent requests.
+    """
+
+    def __init__(self, rules, thresholds, groups=RULE_GROUPS):
+        self.rules_spec = rules
+        self.groups_spec = groups
+        self.compile(thresholds)
+
+    def compile(self, thresholds):
+        """(Re)compile the rule table, e.g. after THRESHOLDS were tuned"""
+        self.thresholds = dict(thresholds)
+        self.late_night_end = thresholds['LATE_NIGHT_END']
+        self.evening_start = thresholds['EVENING_START']
+        modes = dict(self.groups_spec)
+        compiled = [CompiledRule(spec, thresholds) for spec in self.rules_spec]
+        # A no-op rule still ends a 'first' group when it matches, so only drop it elsewhere
+        self.rules = [rule for rule in compiled if rule.has_effect or modes[rule.group] == 'first']
+        self.groups = [(name, mode, [rule for rule in self.rules if rule.group == name])
+                       for name, mode in self.groups_spec]
+        self.fields = set().union(*(rule.fields for rule in self.rules))
+
+    def evaluate(self, tx, reasons):
+        """Apply the rules to one transaction
+
+        `tx` holds amount, hour, has_description, suspicious_count,
+        safe_category, is_emergency and the current is_fraud / fraud_score,
+        which are updated in place. Reasons are appended to `reasons`.
+        Returns the rules that fired, in order.
+        """
+        tx['late_night'] = tx['hour'] < self.late_night_end or tx['hour'] > self.evening_start
+        fired = []
+        for _, mode, rules in self.groups:
+            for rule in rules:
+                start = time.perf_counter_ns()
+                matched = rule.matches(tx)
+                if matched:
+                    self._apply(rule, tx, reasons)
+                    fired.append(rule)
+                    rule.hits += 1
+                rule.evaluations += 1
+                rule.cost_ns += time.perf_counter_ns() - start
+                if matched and mode == 'first':
+                    break
+        return fired
+
+    @staticmethod
+    def _apply(rule, tx, reasons):
+        if rule.fraud is not None:
+            tx['is_fraud'] = rule.fraud
+        if rule.score_min is not None:
+            tx['fraud_score'] = max(tx['fraud_score'], rule.score_min)
+        if rule.score_max is not None:
+            tx['fraud_score'] = min(tx['fraud_score'], rule.score_max)
+        if rule.clamp is not None:
+            low, high = rule.clamp
+            tx['fraud_score'] = max(low, min(high, tx['fraud_score']))
+        if rule.reason is not None:
+            reasons.append(rule.reason.format_map(tx))
+
+    def evaluate_batch(self, arrays, reasons):
+        """Apply the rules to arrays of transactions
+
+        `arrays` holds the same fields as `evaluate` as NumPy arrays;
+        is_fraud and fraud_score are replaced with the updated arrays.
+        `reasons` is a list of per-transaction reason lists, or None to
+        skip building them.
+
+        Every threshold may also be a (k, 1) column of candidate values
+        (sweep.py): k configurations are then evaluated at once, and the
+        late_night, is_fraud and fraud_score results have shape (k, n).
+        """
+        hour = arrays['hour']
+        arrays['late_night'] = (hour < self.late_night_end) | (hour > self.evening_start)
+        shape = arrays['late_night'].shape
+        for _, mode, rules in self.groups:
+            remaining = np.ones(shape, dtype=bool)
+            for rule in rules:
+                if not remaining.any():
+                    break  # every row already matched an earlier rule of this group
+                start = time.perf_counter_ns()
+                evaluated = np.count_nonzero(remaining)
+                mask = rule.mask(arrays, remaining)
+                hits = np.count_nonzero(mask)
+                if hits:
+                    self._apply_batch(rule, arrays, mask, reasons)
+                    if mode == 'first':
+                        remaining &= ~mask
+                rule.evaluations += evaluated
+                rule.hits += hits
+                rule.cost_ns += time.perf_counter_ns() - start
+        return arrays
+
+    @staticmethod
+    def _apply_batch(rule, arrays, mask, reasons):
+        if rule.fraud is not None:
+            arrays['is_fraud'] = np.where(mask, rule.fraud, arrays['is_fraud'])
+        score = arrays['fraud_score']
+        if rule.score_min is not None:
+            score = np.where(mask, np.maximum(score, rule.score_min), score)
+        if rule.score_max is not None:
+            score = np.where(mask, np.minimum(score, rule.score_max), score)
+        if rule.clamp is not None:
+            score = np.where(mask, np.clip(score, *rule.clamp), score)
+        arrays['fraud_score'] = score
+        if rule.reason is not None and reasons is not None:
+            columns = {field: arrays[field] for field in rule.reason_fields}
+            for i in np.flatnonzero(mask):
+                reasons[i].append(rule.reason.format_map({field: col[i] for field, col in columns.items()}))
+
+    def stats(self):
+        """Per-rule hit counts and evaluation cost"""
+        return [{
+            'rule': rule.name,
+            'group': rule.group,
+            'evaluations': rule.evaluations,
+            'hits': rule.hits,
+            'hit_rate': round(rule.hits / rule.evaluations, 4) if rule.evaluations else 0.0,
+            'total_ms': round(rule.cost_ns / 1e6, 3),
+            'avg_ns': round(rule.cost_ns / rule.evaluations) if rule.evaluations else 0
+        } for rule in self.rules]
+
+    def reset_stats(self):
+        for rule in self.rules:
+            rule.evaluations = rule.hits = rule.cost_ns = 0
@@ -0,0 +1,110 @@
+"""Production server: pre-forked workers sharing one copy of the model
+
+    python serve.py                                   # gunicorn, one worker per core, 4 threads each
+    python serve.py --workers 8 --threads 8 --max-concurrency 32
+    python serve.py --asgi                            # uvicorn workers, async /predict (asgi.py)
+    python serve.py --batch-window-ms 5 --batch-max 64  # coalesce concurrent model calls (batcher.py)
+
+The app is imported once in the master process (gunicorn's preload_app):
+the model artifact, the description analyzer and the keyword automaton are
+built there and every forked worker inherits them copy-on-write. Objects
+that exist at fork time are moved out of the garbage collector's reach
+(gc.freeze), so collections in the workers do not write to, and so copy,
+the shared pages. The master waits for the model's background load to
+finish before forking, so every worker starts ready. The decision log
+writer and the model reload watcher start lazily inside each worker.
+
+SIGTERM (or Ctrl+C) shuts down gracefully: workers stop accepting
+connections, finish requests in flight for up to --graceful-timeout
+seconds and flush the decision log before exiting.
+
+`app.py` run directly is still the single-process development server.
+"""
+import argparse
+import gc
+import os
+
+from gunicorn.app.base import BaseApplication
+
+class Server(BaseApplication):
+    def __init__(self, options, asgi=False):
+        self.options = options
+        self.asgi = asgi
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # With preload_app this runs once, in the master, before any fork
+        if self.asgi:
+            from asgi import application
+        else:
+            from app import app as application
+        from app import model_store
+        if model_store.wait():
+            print(f"✅ Model loaded successfully! (version {model_store.version})")
+        else:
+            print(f"⚠️ Error loading model: {model_store.load_error}")
+        gc.collect()
+        gc.freeze()
+        return application
+
+def worker_exit(server, worker):
+    from decision_log import decision_log
+    decision_log.flush()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run FraudGuard AI with pre-forked workers')
+    parser.add_argument('--bind', default=os.environ.get('BIND', '0.0.0.0:5001'),
+                        help='address to listen on (default 0.0.0.0:5001)')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WORKERS', os.cpu_count() or 1)),
+                        help='worker processes (default: one per core)')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('THREADS', 4)),
+                        help='request threads per worker, WSGI only (default 4)')
+    parser.add_argument('--max-concurrency', type=int, default=int(os.environ.get('MAX_CONCURRENT_REQUESTS', 0)),
+                        help='scoring requests per worker before answering 503 (default 0: unlimited)')
+    parser.add_argument('--graceful-timeout', type=int, default=30,
+                        help='seconds workers get to finish requests on shutdown (default 30)')
+    parser.add_argument('--timeout', type=int, default=30, help='kill workers silent for this long (default 30)')
+    parser.add_argument('--max-requests', type=int, default=0,
+                        help='recycle a worker after this many requests (default 0: never)')
+    parser.add_argument('--batch-window-ms', type=float, default=float(os.environ.get('MICRO_BATCH_WINDOW_MS', 2.0)),
+                        help='longest a request waits for others to share a model call (default 2)')
+    parser.add_argument('--batch-max', type=int, default=int(os.environ.get('MICRO_BATCH_MAX', 32)),
+                        help='most requests in one model call (default 32)')
+    parser.add_argument('--no-micro-batch', dest='micro_batch', action='store_false',
+                        help='score every request on its own')
+    parser.add_argument('--asgi', action='store_true', help='serve asgi.py with uvicorn workers')
+    args = parser.parse_args(argv)
+
+    # Read by limits.py and batcher.py when the app is imported in load()
+    os.environ['MAX_CONCURRENT_REQUESTS'] = str(args.max_concurrency)
+    os.environ['MICRO_BATCH_WINDOW_MS'] = str(args.batch_window_ms)
+    os.environ['MICRO_BATCH_MAX'] = str(args.batch_max)
+    if not args.micro_batch:
+        os.environ['MICRO_BATCH'] = '0'
+
+    options = {
+        'bind': args.bind,
+        'workers': args.workers,
+        'preload_app': True,
+        'graceful_timeout': args.graceful_timeout,
+        'timeout': args.timeout,
+        'max_requests': args.max_requests,
+        'max_requests_jitter': args.max_requests // 10,
+        'worker_exit': worker_exit
+    }
+    if args.asgi:
+        options['worker_class'] = 'uvicorn.workers.UvicornWorker'
+    else:
+        options['worker_class'] = 'gthread'
+        options['threads'] = args.threads
+
+    print(f"\n🚀 FraudGuard AI Service starting {args.workers} "
+          f"{'ASGI' if args.asgi else f'WSGI x {args.threads} thread'} workers on {args.bind}")
+    Server(options, asgi=args.asgi).run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+"""Per-user amount percentiles from compact, mergeable quantile sketches
+
+The amount rules use one set of cutoffs for everybody, but ₹60,000 is a
+normal payment for some users and an extreme one for others. So every
+user keeps a sketch of the amounts they paid before, and a transaction
+gets its amount's percentile against that history:
+
+    user_amount_percentile   share of the user's past amounts below this
+                             one (equal ones count half); 0.5 without history
+    user_amount_history      how many past amounts the sketch holds
+
+The sketch is a histogram over fixed logarithmic buckets (the DDSketch
+layout): bucket b holds the amounts in [GAMMA**(b-1), GAMMA**b), so any
+quantile read from it is within RELATIVE_ERROR of an amount actually
+paid, at any scale, for the price of BUCKETS 16-bit counters, 256 bytes
+per user whatever their history. When a bucket would overflow, every
+count of that user is halved, which keeps the shape and lets the oldest
+history fade. Two sketches of one user merge by adding their counts, so
+the stores of several workers (each sees only its own traffic, like
+velocity.py) can be combined into one.
+
+All sketches live in one 2-D array, a row per user, grown as users
+arrive up to `max_users`; past that, the least recently seen users are
+dropped a slice at a time. `snapshot()` / `restore()` write and read the
+whole array at once, so millions of users survive a restart in a few
+seconds, and `restore(merge=True)` folds in another worker's snapshot.
+
+The features are served with the velocity features (velocity.py) and,
+like them, describe the history *before* the transaction being scored,
+so replaying a history (velocity.replay, as train.py does) gives the
+features the service would have computed.
+"""
+import atexit
+import math
+import os
+import pickle
+import threading
+
+import numpy as np
+
+BUCKETS = 128
+MAX_AMOUNT = 1e7                               # ₹1 crore; larger amounts share the last bucket
+GAMMA = MAX_AMOUNT ** (1 / (BUCKETS - 2))      # ~1.14: bucket 0 holds amounts below ₹1
+RELATIVE_ERROR = (GAMMA - 1) / (GAMMA + 1)     # ~6.5%
+_LOG_GAMMA = math.log(GAMMA)
+_MAX_COUNT = np.iinfo(np.uint16).max
+
+AMOUNT_FEATURES = ['user_amount_percentile', 'user_amount_history']
+
+# The features of a user without history (or without a user_id)
+AMOUNT_DEFAULTS = {'user_amount_percentile': 0.5, 'user_amount_history': 0}
+
+def bucket(amount):
+    """Sketch bucket of an amount"""
+    if not amount >= 1:  # NaN too
+        return 0
+    if amount >= MAX_AMOUNT:  # infinity too
+        return BUCKETS - 1
+    return min(int(math.log(amount) / _LOG_GAMMA) + 1, BUCKETS - 1)
+
+def bucket_value(b):
+    """Representative amount of bucket b, within RELATIVE_ERROR of every amount in it"""
+    if b == 0:
+        return 0.0
+    return 2 * GAMMA ** b / (GAMMA + 1)
+
+def percentile(counts, amount):
+    """Share of the amounts in a sketch below `amount`, equal ones counting half; 0.5 if it is empty"""
+    total = int(counts.sum())
+    if not total:
+        return 0.5
+    b = bucket(amount)
+    return (int(counts[:b].sum()) + int(counts[b]) / 2) / total
+
+def quantile(counts, q):
+    """Amount at quantile q of a sketch, None if it is empty"""
+    total = int(counts.sum())
+    if not total:
+        return None
+    b = int(np.searchsorted(np.cumsum(counts, dtype=np.int64), q * total, side='left'))
+    return bucket_value(min(b, BUCKETS - 1))
+
+def merge(a, b):
+    """Sum of two sketches, halved until every count fits"""
+    total = a.astype(np.int64) + b
+    while total.max() > _MAX_COUNT:
+        total >>= 1
+    return total.astype(np.uint16)
+
+
+class AmountSketches:
+    """One amount sketch per user, in one array, bounded in users"""
+
+    def __init__(self, max_users=1000000, evict_fraction=0.01, snapshot_path=None, capacity=1024):
+        self.max_users = max_users
+        self.evict_fraction = evict_fraction
+        self.snapshot_path = snapshot_path
+        self.rows = {}                                     # user id -> its row in sketches
+        self.sketches = np.zeros((min(capacity, max_users), BUCKETS), dtype=np.uint16)  # a row per user
+        self.last_seen = np.zeros(len(self.sketches), dtype=np.int64)  # tick of each row's last use
+        self.free = []                                     # rows of evicted users
+        self.tick = 0
+        self.counts = {'observed': 0, 'without_user': 0, 'not_finite': 0, 'halvings': 0, 'evicted': 0}
+        self._lock = threading.Lock()
+        if snapshot_path:
+            atexit.register(self._snapshot_at_exit)
+
+    @classmethod
+    def from_env(cls):
+        """Configure from AMOUNT_SKETCH_MAX_USERS and AMOUNT_SKETCH_SNAPSHOT (restored if it exists)"""
+        store = cls(
+            max_users=int(os.environ.get('AMOUNT_SKETCH_MAX_USERS', 1000000)),
+            snapshot_path=os.environ.get('AMOUNT_SKETCH_SNAPSHOT') or None
+        )
+        if store.snapshot_path and os.path.exists(store.snapshot_path):
+            store.restore()
+        return store
+
+    def _row(self, user_id):
+        """The row of a user, making one (and room for it) if needed"""
+        row = self.rows.get(user_id)
+        if row is None:
+            if not self.free:
+                self._make_room()
+            row = self.rows[user_id] = self.free.pop()
+        self.tick += 1
+        self.last_seen[row] = self.tick
+        return row
+
+    def _make_room(self):
+        """Free some rows: grow the array, or once at max_users drop the least recently seen"""
+        used = len(self.rows)
+        if used < len(self.sketches):
+            self.free = [row for row in range(len(self.sketches) - 1, used - 1, -1)]
+            return
+        if len(self.sketches) < self.max_users:
+            size = min(2 * len(self.sketches), self.max_users)
+            self.sketches = np.concatenate([self.sketches, np.zeros((size - len(self.sketches), BUCKETS), np.uint16)])
+            self.last_seen = np.concatenate([self.last_seen, np.zeros(size - len(self.last_seen), np.int64)])
+            self.free = list(range(size - 1, used - 1, -1))
+            return
+        n = max(1, int(used * self.evict_fraction))
+        oldest = set(np.argpartition(self.last_seen, n - 1)[:n].tolist())
+        self.rows = {user_id: row for user_id, row in self.rows.items() if row not in oldest}
+        self.free = sorted(oldest, reverse=True)
+        self.sketches[self.free] = 0
+        self.counts['evicted'] += n
+
+    def observe(self, user_id, amount):
+        """Percentile features of amount against the user's history, then add it to the sketch
+
+        Without a user_id there is no history: the features are neutral
+        and nothing is recorded. A NaN or infinite amount gets its features
+        but is not recorded either, so it cannot skew the user's history.
+        """
+        if user_id is None:
+            with self._lock:
+                self.counts['without_user'] += 1
+            return dict(AMOUNT_DEFAULTS)
+        b = bucket(amount)
+        with self._lock:
+            self.counts['observed'] += 1
+            row = self._row(user_id)  # may grow self.sketches
+            counts = self.sketches[row]
+            total, below, at = int(counts.sum()), int(counts[:b].sum()), int(counts[b])  # as percentile()
+            features = {
+                'user_amount_percentile': (below + at / 2) / total if total else 0.5,
+                'user_amount_history': total
+            }
+            if not math.isfinite(amount):
+                self.counts['not_finite'] += 1
+                return features
+            if at == _MAX_COUNT:
+                counts >>= 1
+                at >>= 1
+                self.counts['halvings'] += 1
+            counts[b] = at + 1
+        return features
+
+    def sketch(self, user_id):
+        """A copy of the user's sketch, None if the user has none"""
+        with self._lock:
+            row = self.rows.get(user_id)
+            return None if row is None else self.sketches[row].copy()
+
+    def quantile(self, user_id, q):
+        """Amount at quantile q of the user's history, None without history"""
+        counts = self.sketch(user_id)
+        return None if counts is None else quantile(counts, q)
+
+    def merge(self, users, counts):
+        """Fold sketches in ({user: counts} as two parallel sequences), e.g. another worker's"""
+        with self._lock:
+            for user_id, sketch in zip(users, counts):
+                existing = user_id in self.rows
+                row = self._row(user_id)  # may grow self.sketches
+                self.sketches[row] = merge(self.sketches[row], sketch) if existing else sketch
+
+    def _state(self):
+        users = list(self.rows)
+        rows = np.fromiter(self.rows.values(), dtype=np.intp, count=len(users))
+        order = np.argsort(self.last_seen[rows], kind='stable')  # least recently seen first
+        return {'format': 1, 'buckets': BUCKETS, 'gamma': GAMMA,
+                'users': [users[i] for i in order.tolist()], 'counts': self.sketches[rows[order]]}
+
+    def snapshot(self, path=None):
+        """Write every sketch to path (default snapshot_path), atomically"""
+        path = path or self.snapshot_path
+        with self._lock:
+            state = pickle.dumps(self._state(), protocol=pickle.HIGHEST_PROTOCOL)
+        tmp = f'{path}.tmp-{os.getpid()}'
+        with open(tmp, 'wb') as f:
+            f.write(state)
+        os.replace(tmp, path)
+
+    def _snapshot_at_exit(self):
+        # Only processes that scored something, as in velocity.py
+        if self.counts['observed']:
+            self.snapshot()
+
+    def restore(self, path=None, merge=False):
+        """Load a snapshot, replacing the sketches or merged into them; one with other buckets is ignored"""
+        with open(path or self.snapshot_path, 'rb') as f:
+            state = pickle.load(f)
+        if state.get('format') != 1 or state.get('buckets') != BUCKETS or state.get('gamma') != GAMMA:
+            print("⚠️ Amount sketch snapshot ignored: bucket layout changed")
+            return False
+        users, counts = state['users'], state['counts']
+        if len(users) > self.max_users:  # keep the most recently seen
+            users, counts = users[-self.max_users:], counts[-self.max_users:]
+        if merge:
+            self.merge(users, counts)
+            return True
+        with self._lock:
+            capacity = max(len(users), min(1024, self.max_users))
+            self.sketches = np.zeros((capacity, BUCKETS), dtype=np.uint16)
+            self.sketches[:len(users)] = counts
+            self.last_seen = np.zeros(capacity, dtype=np.int64)
+            self.last_seen[:len(users)] = np.arange(1, len(users) + 1)
+            self.tick = len(users)
+            self.rows = dict(zip(users, range(len(users))))
+            self.free = list(range(capacity - 1, len(users) - 1, -1))
+        return True
+
+    def stats(self):
+        return {
+            'users': len(self.rows),
+            'max_users': self.max_users,
+            'bytes_per_user': BUCKETS * self.sketches.itemsize,
+            'sketch_bytes': int(self.sketches.nbytes),
+            'relative_error': round(RELATIVE_ERROR, 4),
+            **self.counts
+        }
+
+# Create global instance
+amount_sketches = AmountSketches.from_env()
@@ -0,0 +1,248 @@
+"""Threshold sweep: precision and recall of candidate THRESHOLDS on labeled data
+
+    python sweep.py labeled.jsonl --grid EXTREME_AMOUNT=150000,200000,300000 --grid LATE_NIGHT_END=4,5,6
+    python sweep.py labeled.csv --grid-file grid.json --label is_fraud --sort recall -o sweep.csv
+
+The grid is the cross product of the candidate values given per threshold
+(on the command line or as a JSON object of lists); thresholds left out
+keep their app.py value. The first configuration is always app.py's own.
+
+Everything that does not depend on THRESHOLDS is computed once: local
+hour, keyword hits, velocity features (replayed in time order, like
+train.py does) and the model's probabilities. Rules only compare numbers
+with constants, so transactions whose inputs sit the same way relative to
+every candidate threshold and rule constant are decided alike; they are
+collapsed into one weighted group. The rule table is then compiled once
+with every threshold as a column of candidate values and evaluated as one
+(configurations x groups) matrix. Decisions are exactly those of
+/predict/batch under each configuration.
+"""
+import argparse
+import contextlib
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+os.environ.setdefault('MODEL_LOAD', 'sync')
+
+with contextlib.redirect_stdout(sys.stderr):
+    from app import THRESHOLDS, keyword_matcher, model_store
+    from features import local_time_features
+    from model_store import Artifact, current_version
+    from rules import RULES, RuleEngine
+    from score import REQUIRED_FIELDS, detect_format, read_chunks
+    from velocity import replay
+
+TRUE_LABELS = {'1', 'true', 't', 'yes', 'y', 'fraud'}
+
+def _is_true(value):
+    if isinstance(value, str):
+        return value.strip().lower() in TRUE_LABELS
+    return bool(value)
+
+def load_dataset(path, label):
+    """Transactions and boolean labels; rows without the required fields or a label are skipped"""
+    transactions, labels, skipped = [], [], 0
+    for chunk in read_chunks(path, detect_format(path, 'jsonl'), 10000):
+        for _, row in chunk:
+            if label not in row or any(field not in row for field in REQUIRED_FIELDS):
+                skipped += 1
+                continue
+            try:
+                transactions.append({
+                    'amount': float(row['amount']),
+                    'location': row['location'],
+                    'time': float(row['time']),
+                    'description': row.get('description') or '',
+                    'user_id': row.get('user_id') or None
+                })
+            except (TypeError, ValueError):
+                skipped += 1
+                continue
+            labels.append(_is_true(row[label]))
+    return transactions, np.array(labels, dtype=bool), skipped
+
+def rule_inputs(transactions, model):
+    """The rule engine's input arrays, everything that does not depend on THRESHOLDS"""
+    amounts = [t['amount'] for t in transactions]
+    locations = [t['location'] for t in transactions]
+    times = [t['time'] for t in transactions]
+    descriptions = [t['description'].strip() for t in transactions]
+    amount = np.array(amounts, dtype=np.float64)
+    hour, day_of_week = local_time_features(times)
+    hits = [keyword_matcher.scan(d) for d in descriptions]
+    velocity = replay([t['user_id'] for t in transactions], locations, amounts, times)
+
+    original_fraud = np.zeros(len(transactions), dtype=bool)
+    original_confidence = np.full(len(transactions), 0.3)
+    if model is not None:
+        codes = [model.lookup_location(loc) for loc in locations]
+        location_code = np.array([model.unknown_location_code if c is None else c for c in codes], dtype=np.intp)
+        probabilities = model.predict_proba(amount, location_code, hour, day_of_week,
+                                            (day_of_week >= 5).astype(np.int64), velocity)
+        original_fraud = model.classes.take(np.argmax(probabilities, axis=1)) == 1
+        original_confidence = np.where(original_fraud, probabilities[:, 1], probabilities[:, 0])
+
+    return {
+        'amount': amount,
+        'hour': hour,
+        'has_description': np.array([bool(d) for d in descriptions]),
+        'suspicious_count': np.array([k.count('suspicious') for k in hits], dtype=np.int64),
+        'safe_category': np.array([k.category('safe') for k in hits], dtype=object),
+        'is_emergency': np.array([k.any('emergency') for k in hits], dtype=bool),
+        'is_fraud': original_fraud,
+        'fraud_score': original_confidence,
+        **velocity
+    }
+
+def expand_grid(grid, base=THRESHOLDS):
+    """List of full THRESHOLDS dicts: base first, then the cross product of the grid"""
+    for name in grid:
+        if name not in base:
+            raise KeyError(f"Unknown threshold: {name}")
+    names = list(grid)
+    configs = [dict(base)]
+    for values in itertools.product(*(grid[name] for name in names)):
+        configs.append({**base, **dict(zip(names, values))})
+    return configs
+
+def _constants(configs, rules=RULES):
+    """Every number a rule compares with or clamps to: candidate thresholds and rule literals"""
+    def numbers(values):
+        return {float(v) for v in values if isinstance(v, (int, float)) and not isinstance(v, bool)}
+
+    def literals(conditions):
+        for condition in conditions:
+            if condition[0] == 'any':
+                yield from literals(condition[1])
+            else:
+                yield condition[2]
+
+    constants = numbers(value for config in configs for value in config.values())
+    for spec in rules:
+        constants |= numbers(literals(spec['when']))
+        constants |= numbers([spec.get('score_min'), spec.get('score_max'), *(spec.get('clamp') or ())])
+    return np.array(sorted(constants))
+
+def group_rows(inputs, labels, fields, constants):
+    """Collapse transactions the rules cannot tell apart: (group inputs, fraud per group, legit per group)
+
+    A float field only matters by where it sits among the constants (equal
+    to one, or between two neighbours); every other field must match exactly.
+    """
+    codes = []
+    for name in fields:
+        values = inputs[name]
+        if values.dtype.kind == 'f':
+            codes.append(np.searchsorted(constants, values, 'left') + np.searchsorted(constants, values, 'right'))
+        else:
+            index = {}
+            codes.append(np.array([index.setdefault(value, len(index)) for value in values.tolist()]))
+    _, first, inverse = np.unique(np.stack(codes, axis=1), axis=0, return_index=True, return_inverse=True)
+    inverse = inverse.ravel()
+    fraud = np.bincount(inverse, weights=labels, minlength=len(first)).astype(np.int64)
+    legit = np.bincount(inverse, minlength=len(first)) - fraud
+    return {name: values[first] for name, values in inputs.items()}, fraud, legit
+
+def sweep(inputs, labels, configs, cells=2_000_000):
+    """Confusion matrix per configuration, from one rule table compiled over all of them"""
+    k = len(configs)
+    columns = {name: np.array([config[name] for config in configs]).reshape(k, 1) for name in configs[0]}
+    engine = RuleEngine(RULES, columns)
+    fields = sorted(engine.fields - {'late_night'} | {'hour'})
+    groups, fraud, legit = group_rows(inputs, labels, fields, _constants(configs))
+    tp = np.zeros(k, dtype=np.int64)
+    fp = np.zeros(k, dtype=np.int64)
+    step = max(1, cells // k)
+    for start in range(0, len(fraud), step):
+        rows = slice(start, start + step)
+        arrays = engine.evaluate_batch({name: values[rows] for name, values in groups.items()}, None)
+        flagged = np.broadcast_to(arrays['is_fraud'], (k, len(fraud[rows]))).astype(np.int64)
+        tp += flagged @ fraud[rows]
+        fp += flagged @ legit[rows]
+    return {'tp': tp, 'fp': fp, 'fn': fraud.sum() - tp, 'tn': legit.sum() - fp, 'groups': len(fraud)}
+
+def summarize(configs, counts, grid):
+    results = []
+    for i, config in enumerate(configs):
+        tp, fp, fn, tn = (int(counts[name][i]) for name in ('tp', 'fp', 'fn', 'tn'))
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        results.append({
+            'config': 'current' if i == 0 else i,
+            **{name: config[name] for name in grid},
+            'tp': tp, 'fp': fp, 'fn': fn, 'tn': tn,
+            'precision': round(precision, 4),
+            'recall': round(recall, 4),
+            'f1': round(2 * precision * recall / (precision + recall), 4) if precision + recall else 0.0,
+            'flagged_rate': round((tp + fp) / max(tp + fp + fn + tn, 1), 4)
+        })
+    return results
+
+def parse_grid(specs, grid_file):
+    grid = {}
+    if grid_file:
+        with open(grid_file) as f:
+            grid.update(json.load(f))
+    for spec in specs or []:
+        name, _, values = spec.partition('=')
+        grid[name.strip()] = [json.loads(value) for value in values.split(',')]
+    return grid
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Evaluate a grid of THRESHOLDS on a labeled transactions file')
+    parser.add_argument('input', help='labeled transactions (.jsonl or .csv)')
+    parser.add_argument('--label', default='is_fraud', help='ground-truth column (default is_fraud)')
+    parser.add_argument('--grid', action='append', metavar='NAME=V1,V2,...', help='candidate values of one threshold')
+    parser.add_argument('--grid-file', help='JSON object mapping threshold names to lists of values')
+    parser.add_argument('--models-dir', help='artifact directory (default: the one app.py serves)')
+    parser.add_argument('--sort', default='f1', choices=['f1', 'precision', 'recall'], help='ranking (default f1)')
+    parser.add_argument('--top', type=int, default=10, help='configurations to print (default 10)')
+    parser.add_argument('-o', '--output', help='write every configuration to a .csv or .json file')
+    args = parser.parse_args(argv)
+
+    grid = parse_grid(args.grid, args.grid_file)
+    configs = expand_grid(grid)
+    if args.models_dir:
+        version = current_version(args.models_dir)
+        model = Artifact(f'{args.models_dir}/{version}').model if version else None
+    else:
+        model = model_store.model
+
+    start = time.perf_counter()
+    transactions, labels, skipped = load_dataset(args.input, args.label)
+    inputs = rule_inputs(transactions, model)
+    prepared = time.perf_counter()
+    counts = sweep(inputs, labels, configs)
+    results = summarize(configs, counts, grid)
+    done = time.perf_counter()
+
+    print(f"📊 {len(transactions)} transactions ({int(labels.sum())} fraud, {skipped} skipped) "
+          f"in {counts['groups']} distinct groups, {len(configs)} configurations: "
+          f"inputs {prepared - start:.2f}s, sweep {done - prepared:.2f}s")
+    if model is None:
+        print("⚠️ No model loaded: rules only, starting from the default confidence")
+
+    columns = ['config', *grid, 'precision', 'recall', 'f1', 'flagged_rate', 'tp', 'fp', 'fn', 'tn']
+    ranked = [results[0]] + sorted(results[1:], key=lambda r: r[args.sort], reverse=True)[:args.top]
+    print('  '.join(f'{c:>12}' for c in columns))
+    for result in ranked:
+        print('  '.join(f'{result[c]!s:>12}' for c in columns))
+
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            if detect_format(args.output, 'json') == 'csv':
+                writer = csv.DictWriter(f, fieldnames=columns)
+                writer.writeheader()
+                writer.writerows(results)
+            else:
+                json.dump({'grid': grid, 'transactions': len(transactions), 'results': results}, f, indent=2)
+        print(f"✅ Wrote {len(results)} configurations to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""/predict/batch decides exactly like /predict called once per transaction: python -m pytest test_batch.py"""
+import json
+import math
+
+import numpy as np
+import pytest
+
+import app
+from columnar import COLUMNAR_CONTENT_TYPE, decode_columns, encode_columns
+from velocity import VelocityStore
+
+HOUR = 3600 * 1000
+START = 1700000000000  # a Tuesday, 22:13 UTC
+
+TRANSACTIONS = [
+    {'amount': 1200.0, 'time': START, 'location': 'Mumbai', 'description': 'Dinner at a restaurant', 'user_id': 'a'},
+    {'amount': 250000.0, 'time': START + HOUR, 'location': 'Delhi', 'description': '', 'user_id': 'a'},
+    {'amount': 75000.0, 'time': START + 2 * HOUR, 'location': 'Atlantis',
+     'description': 'URGENT verify account to claim prize', 'user_id': 'b'},
+    {'amount': math.nan, 'time': START + 3 * HOUR, 'location': 'Mumbai', 'description': 'Cab fare', 'user_id': 'a'},
+    {'amount': math.inf, 'time': START + 4 * HOUR, 'location': 'Pune', 'description': 'Apollo hospital', 'user_id': 'b'},
+    {'amount': -math.inf, 'time': START + 5 * HOUR, 'location': 'Mumbai', 'description': 'Refund'},
+    {'amount': 1e300, 'time': START + 6 * HOUR, 'location': '', 'description': 'Electricity bill', 'user_id': 'a'},
+    {'amount': -50.0, 'time': START + 7 * HOUR, 'location': 'Delhi', 'description': 'Swiggy order'},
+    {'amount': 0.0, 'time': START + 3 * 24 * HOUR, 'location': 'Mumbai', 'description': 'Netflix', 'user_id': 'b'},
+    {'amount': 60000.0, 'time': START + 4 * 24 * HOUR, 'location': 'Chennai',
+     'description': 'wire transfer to unknown', 'user_id': 'a'},
+]
+
+COMPARED = ('fraud', 'confidence', 'original_prediction', 'degraded')
+
+
+@pytest.fixture(params=['table', 'velocity'])
+def model(request, monkeypatch):
+    """The served model, with fresh velocity and amount histories and no cached decisions"""
+    monkeypatch.setattr(app.decision_cache, 'max_entries', 0)
+    if request.param == 'velocity':
+        request.getfixturevalue('velocity_model')
+    return request.param
+
+
+def fresh_history(monkeypatch):
+    monkeypatch.setattr(app, 'velocity_store', VelocityStore())
+
+
+def post_json(path, payload):
+    # json.dumps writes NaN and Infinity, which the service parses like any JSON client would send them
+    return app.app.test_client().post(path, data=json.dumps(payload), content_type='application/json')
+
+
+def singles(monkeypatch, transactions):
+    fresh_history(monkeypatch)
+    responses = [post_json('/predict', transaction) for transaction in transactions]
+    assert all(response.status_code == 200 for response in responses)
+    return [response.get_json() for response in responses]
+
+
+def test_batch_matches_single_requests(model, monkeypatch):
+    expected = singles(monkeypatch, TRANSACTIONS)
+
+    fresh_history(monkeypatch)
+    response = post_json('/predict/batch', TRANSACTIONS)
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert len(results) == len(TRANSACTIONS)
+    for i, (result, single) in enumerate(zip(results, expected)):
+        assert {key: result[key] for key in COMPARED} == {key: single[key] for key in COMPARED}, i
+        assert result['description_analysis']['reasons'] == single['description_analysis']['reasons'], i
+
+
+def test_bad_amounts_degrade_only_their_rows(model, monkeypatch):
+    results = singles(monkeypatch, TRANSACTIONS)
+    served = app.model_store.model
+    rejected = served.rejects([t['amount'] for t in TRANSACTIONS])
+    assert [result['degraded'] for result in results] == rejected.tolist()
+    assert rejected[[4, 5, 6]].all() and not rejected[[0, 1, 2, 7, 8, 9]].any()
+
+
+def test_columnar_batch_matches_single_requests(model, monkeypatch):
+    expected = singles(monkeypatch, TRANSACTIONS)
+
+    fresh_history(monkeypatch)
+    body = encode_columns({
+        'amount': np.array([t['amount'] for t in TRANSACTIONS]),
+        'time': np.array([t['time'] for t in TRANSACTIONS], dtype=np.float64),
+        'location': [t['location'] for t in TRANSACTIONS],
+        'description': [t['description'] for t in TRANSACTIONS],
+        'user_id': [t.get('user_id') for t in TRANSACTIONS]
+    })
+    response = app.app.test_client().post('/predict/batch', data=body, content_type=COLUMNAR_CONTENT_TYPE)
+    assert response.status_code == 200
+    rows, columns = decode_columns(response.get_data())
+    assert rows == len(TRANSACTIONS)
+    for i, single in enumerate(expected):
+        assert bool(columns['fraud'][i]) == single['fraud'], i
+        assert columns['confidence'][i] == single['confidence'], i
+        assert bool(columns['original_fraud'][i]) == single['original_prediction']['fraud'], i
+        assert columns['original_confidence'][i] == single['original_prediction']['confidence'], i
+        assert bool(columns['degraded'][i]) == single['degraded'], i
+
+
+@pytest.mark.parametrize('time', [math.nan, math.inf, -1e20, 1e20], ids=['nan', 'inf', 'before', 'after'])
+def test_bad_times_are_rejected_by_both(time):
+    bad = {**TRANSACTIONS[0], 'time': time}
+    response = post_json('/predict', bad)
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'time out of range'
+
+    response = post_json('/predict/batch', [TRANSACTIONS[0], bad])
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'time out of range', 'index': 1}
+
+    body = encode_columns({'amount': np.array([1.0, 2.0]), 'time': np.array([float(START), time]),
+                           'location': ['Mumbai', 'Delhi']})
+    response = app.app.test_client().post('/predict/batch', data=body, content_type=COLUMNAR_CONTENT_TYPE)
+    assert response.status_code == 400
+    assert 'time out of range (row 1)' in response.get_json()['error']
@@ -0,0 +1,119 @@
+"""Packed columnar bodies round-trip, and malformed ones are a ValueError: python -m pytest test_columnar.py"""
+import json
+import struct
+
+import numpy as np
+import pytest
+
+import app
+from columnar import COLUMNAR_CONTENT_TYPE, MAGIC, decode_columns, encode_columns
+
+COLUMNS = {
+    'amount': np.array([1200.0, np.nan, -np.inf, 1e300]),
+    'time': np.array([1700000000000, 1, 2, 3], dtype='<i8'),
+    'small': np.array([1.5, 2.5, -3.0, 0.0], dtype='<f4'),
+    'count': np.array([0, -1, 2 ** 31 - 1, 7], dtype='<i4'),
+    'flag': np.array([0, 1, 255, 1], dtype='|u1'),
+    'ok': np.array([True, False, True, True]),
+    'location': ['Mumbai', 'Zürich', '', 'नई दिल्ली'],
+    'user_id': ['a', None, 'b', None],
+}
+
+
+def split(body):
+    """(header dict, buffers) of a packed body"""
+    (length,) = struct.unpack_from('<I', body, 4)
+    return json.loads(body[8:8 + length]), body[8 + length + (-(8 + length) % 8):]
+
+
+def pack(header, buffers=b''):
+    """A body with any header at all, valid JSON or not"""
+    header = header if isinstance(header, bytes) else json.dumps(header).encode()
+    prefix = MAGIC + struct.pack('<I', len(header)) + header
+    return prefix + b'\0' * (-len(prefix) % 8) + buffers
+
+
+def edited(edit):
+    """The COLUMNS body with its header changed by `edit`"""
+    header, buffers = split(encode_columns(COLUMNS))
+    edit(header)
+    return pack(header, buffers)
+
+
+def test_round_trip():
+    rows, columns = decode_columns(encode_columns(COLUMNS))
+    assert rows == 4 and list(columns) == list(COLUMNS)
+    for name, values in COLUMNS.items():
+        if isinstance(values, np.ndarray):
+            assert columns[name].dtype == values.dtype, name
+            assert np.array_equal(columns[name], values, equal_nan=values.dtype.kind == 'f'), name
+        else:
+            assert columns[name] == [value or '' for value in values], name
+
+
+def test_round_trip_big_endian_and_empty():
+    rows, columns = decode_columns(encode_columns({'amount': np.array([1.0, 2.0], dtype='>f8'), 'location': ['', '']}))
+    assert rows == 2 and columns['amount'].tolist() == [1.0, 2.0] and columns['location'] == ['', '']
+    rows, columns = decode_columns(encode_columns({'amount': np.array([]), 'location': []}))
+    assert rows == 0 and len(columns['amount']) == 0 and columns['location'] == []
+
+
+def truncate(length):
+    body = encode_columns(COLUMNS)
+    return body[:length if length >= 0 else len(body) + length]
+
+
+MALFORMED = {
+    'empty': b'',
+    'magic': b'FGC2' + encode_columns(COLUMNS)[4:],
+    'header past end': truncate(20),
+    'header not json': pack(b'{"rows": 1, "columns": '),
+    'header not utf8': pack(b'\xff\xfe'),
+    'header a list': pack([1, 2]),
+    'header a string': pack('rows'),
+    'no rows': pack({'columns': {}}),
+    'no columns': pack({'rows': 0}),
+    'rows negative': edited(lambda h: h.update(rows=-1)),
+    'rows a string': edited(lambda h: h.update(rows='4')),
+    'rows a bool': edited(lambda h: h.update(rows=True)),
+    'rows too many': edited(lambda h: h.update(rows=10 ** 6)),
+    'columns a list': edited(lambda h: h.update(columns=list(h['columns']))),
+    'spec a string': edited(lambda h: h['columns'].update(amount='<f8')),
+    'spec a list': edited(lambda h: h['columns'].update(amount=['<f8', 0])),
+    'no dtype': edited(lambda h: h['columns']['amount'].pop('dtype')),
+    'no offset': edited(lambda h: h['columns']['amount'].pop('offset')),
+    'no data offset': edited(lambda h: h['columns']['location'].pop('data_offset')),
+    'dtype unknown': edited(lambda h: h['columns']['amount'].update(dtype='float128x')),
+    'dtype a dict': edited(lambda h: h['columns']['amount'].update(dtype={'names': 'x'})),
+    'dtype unicode': edited(lambda h: h['columns']['amount'].update(dtype='<U4')),
+    'offset negative': edited(lambda h: h['columns']['amount'].update(offset=-8)),
+    'offset a float': edited(lambda h: h['columns']['amount'].update(offset=8.0)),
+    'offset past end': edited(lambda h: h['columns']['amount'].update(offset=1 << 20)),
+    'string offset negative': edited(lambda h: h['columns']['location'].update(offset=-8)),
+    'string data past end': edited(lambda h: h['columns']['location'].update(data_length=1 << 20)),
+    'string data negative': edited(lambda h: h['columns']['location'].update(data_offset=-64)),
+    'string offsets wrong': edited(lambda h: h['columns']['location'].update(data_length=3)),
+    'truncated buffers': truncate(-40),
+}
+
+
+@pytest.mark.parametrize('body', MALFORMED.values(), ids=MALFORMED.keys())
+def test_malformed_bodies_are_value_errors(body):
+    with pytest.raises(ValueError):
+        decode_columns(body)
+
+
+def test_bad_utf8_is_a_value_error():
+    header, buffers = split(encode_columns({'location': ['ab']}))
+    start = header['columns']['location']['data_offset']
+    buffers = buffers[:start] + b'\xff\xfe' + buffers[start + 2:]
+    with pytest.raises(ValueError):
+        decode_columns(pack(header, buffers))
+
+
+@pytest.mark.parametrize('name', ['header a list', 'columns a list', 'spec a string', 'no offset',
+                                  'offset negative', 'string data negative', 'truncated buffers'])
+def test_batch_rejects_malformed_bodies(name):
+    response = app.app.test_client().post('/predict/batch', data=MALFORMED[name], content_type=COLUMNAR_CONTENT_TYPE)
+    assert response.status_code == 400
+    assert response.get_json()['error'].startswith('Bad columnar body')
@@ -0,0 +1,102 @@
+"""Stages that would overrun the scoring budget are skipped: python -m pytest test_deadline.py
+
+Delays are injected into the stages the way SCORING_DELAY_MS does; the
+first request with a generous budget teaches the policy what the
+delayed stage costs, the next one with a tight budget has to skip it.
+"""
+import pytest
+
+import app
+from deadline import parse_delays
+
+TRANSACTION = {
+    'amount': 1200.0,
+    'time': 1700000000000,
+    'location': 'Mumbai',
+    'description': 'Dinner at a restaurant'
+}
+
+RULES_ONLY = {'fraud': False, 'confidence': 0.3}
+
+
+@pytest.fixture
+def policy(monkeypatch):
+    """The app's deadline policy with fresh estimates and counters, and no cached decisions"""
+    policy = app.deadline_policy
+    monkeypatch.setattr(policy, 'estimates', {})
+    monkeypatch.setattr(policy, 'counts', dict.fromkeys(policy.counts, 0))
+    monkeypatch.setattr(app.decision_cache, 'max_entries', 0)
+    return policy
+
+
+def inject(monkeypatch, spec):
+    """Delay stages as SCORING_DELAY_MS=spec would"""
+    monkeypatch.setattr(app.deadline_policy, 'delays', parse_delays(spec))
+
+
+def post(path, payload, budget_ms=None):
+    headers = {} if budget_ms is None else {app.deadline_policy.header: str(budget_ms)}
+    response = app.app.test_client().post(path, json=payload, headers=headers)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_no_budget_never_degrades(policy, monkeypatch):
+    inject(monkeypatch, 'model=20,description=20')
+    response = post('/predict', TRANSACTION)
+    assert not response['degraded']
+    assert policy.counts['degraded'] == 0
+
+
+def test_delayed_model_is_skipped(policy, monkeypatch):
+    inject(monkeypatch, 'model=60')
+    assert not post('/predict', TRANSACTION, budget_ms=5000)['degraded']
+    assert policy.estimates['model'] >= 0.06
+
+    response = post('/predict', TRANSACTION, budget_ms=30)
+    assert response['degraded']
+    assert response['original_prediction'] == RULES_ONLY
+    assert response['description_analysis']['features']  # the description still fit
+    assert policy.counts['skipped.model'] == 1
+    assert policy.counts['degraded'] == policy.counts['degraded.deadline'] == 1
+
+
+def test_delayed_description_is_skipped(policy, monkeypatch):
+    inject(monkeypatch, 'description=60')
+    assert not post('/predict', TRANSACTION, budget_ms=5000)['degraded']
+
+    response = post('/predict', TRANSACTION, budget_ms=30)
+    assert response['degraded']
+    assert response['original_prediction'] == RULES_ONLY
+    assert response['description_analysis']['features'] == {}
+    assert 'skipped.model' not in policy.counts  # never tried once the description was skipped
+    assert policy.counts['skipped.description'] == 1
+    assert policy.counts['degraded.deadline'] == 1
+
+
+def test_delayed_batch_model_is_skipped(policy, monkeypatch):
+    batch = [TRANSACTION, {**TRANSACTION, 'amount': 250000.0}, {**TRANSACTION, 'description': ''}]
+    inject(monkeypatch, 'model=60')
+    full = post('/predict/batch', batch, budget_ms=5000)['results']
+    assert not any(result['degraded'] for result in full)
+
+    results = post('/predict/batch', batch, budget_ms=30)['results']
+    assert all(result['degraded'] for result in results)
+    assert all(result['original_prediction'] == RULES_ONLY for result in results)
+    assert results[1]['fraud']  # the extreme amount rule still decides
+    assert policy.counts['skipped.batch.model'] == 1
+    assert policy.counts['degraded.deadline'] == len(batch)
+
+
+def test_degraded_batch_matches_degraded_single(policy, monkeypatch):
+    # Rules-only decisions are the same whichever endpoint made them
+    batch = [TRANSACTION, {**TRANSACTION, 'amount': 75000.0, 'description': 'urgent verify account'}]
+    inject(monkeypatch, 'model=60')
+    post('/predict', TRANSACTION, budget_ms=5000)
+    post('/predict/batch', batch, budget_ms=5000)
+
+    results = post('/predict/batch', batch, budget_ms=30)['results']
+    singles = [post('/predict', transaction, budget_ms=30) for transaction in batch]
+    for result, single in zip(results, singles):
+        assert result['degraded'] and single['degraded']
+        assert (result['fraud'], result['confidence']) == (single['fraud'], single['confidence'])
@@ -0,0 +1,48 @@
+"""Repeated /predict requests are served from decision_cache: python -m pytest test_decision_cache.py"""
+from types import SimpleNamespace
+
+import app
+from velocity import AMOUNT_FEATURES, VELOCITY_FEATURES
+
+BASE_FEATURES = ['amount', 'location_code', 'hour', 'day_of_week', 'is_weekend']
+
+TRANSACTION = {
+    'amount': 1499.0,
+    'time': 1700000000000,
+    'location': 'Mumbai',
+    'description': 'Monthly broadband bill'
+}
+
+
+def _post(payload, times):
+    client = app.app.test_client()
+    before = dict(app.decision_cache.counts)
+    responses = [client.post('/predict', json=payload) for _ in range(times)]
+    assert all(response.status_code == 200 for response in responses)
+    counts = {name: app.decision_cache.counts[name] - before[name] for name in before}
+    return [response.get_json() for response in responses], counts
+
+
+def test_identical_requests_hit():
+    assert app.decision_cache.enabled
+    responses, counts = _post(TRANSACTION, 10)
+    assert counts['misses'] == 1
+    assert counts['hits'] == 9
+    assert counts['bypassed'] == 0
+    assert all(response == responses[0] for response in responses)
+
+
+def test_requests_with_a_user_bypass():
+    # A rule reads the user's amount history, which every transaction of the user changes
+    _, counts = _post({**TRANSACTION, 'user_id': 'u-42'}, 3)
+    assert counts['bypassed'] == 3
+    assert counts['hits'] == counts['misses'] == 0
+
+
+def test_velocity_models_bypass():
+    args = ('Monthly broadband bill', 1499.0, 'Mumbai', 10, 2)
+    assert app.decision_key(*args, None, SimpleNamespace(feature_names=BASE_FEATURES)) is not None
+    assert app.decision_key(*args, None, SimpleNamespace(feature_names=BASE_FEATURES + VELOCITY_FEATURES)) is None
+    # Without a user_id the user features are the no-history values, but a location's still change
+    assert app.decision_key(*args, None, SimpleNamespace(feature_names=BASE_FEATURES + AMOUNT_FEATURES)) is not None
+    assert app.decision_key(*args, 'u-42', SimpleNamespace(feature_names=BASE_FEATURES + AMOUNT_FEATURES)) is None
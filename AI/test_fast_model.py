@@ -0,0 +1,91 @@
+"""FastForest gives exactly what sklearn's predict_proba does: python -m pytest test_fast_model.py"""
+import contextlib
+import io
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from fast_model import FastForest
+from train import encode_locations, generate_training_data, train_in_memory
+from velocity import VELOCITY_DEFAULTS
+
+BASE_FEATURES = ['amount', 'location_code', 'hour', 'day_of_week', 'is_weekend']
+
+
+@pytest.fixture(scope='module', params=[False, True], ids=['base', 'velocity'])
+def trained(request):
+    """A small forest, flattened, and held-out transactions with unknown locations and NaN inputs"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        model, scaler, index, feature_names, _, _ = train_in_memory(3000, 10, {}, velocity=request.param)
+    model.n_jobs = 1  # accumulate trees in order, as FastForest does
+    fast = FastForest.from_model_data({'model': model, 'scaler': scaler, 'location_index': index,
+                                       'feature_names': feature_names})
+
+    X, _ = generate_training_data(400, seed=7, velocity=request.param)
+    X.loc[::7, 'location'] = 'Atlantis'
+    X.loc[3::11, 'location'] = ''
+    X.loc[5::13, 'amount'] = np.nan
+    for i, name in enumerate(name for name in feature_names if name not in BASE_FEATURES):
+        X.loc[i::9, name] = np.nan  # a NaN in each velocity column, with the amount known
+    return SimpleNamespace(fast=fast, model=model, scaler=scaler, index=index, feature_names=feature_names, X=X)
+
+
+def sklearn_proba(trained, X):
+    features = encode_locations(X, trained.index)[trained.feature_names]
+    return trained.model.predict_proba(trained.scaler.transform(features))
+
+
+def velocity_of(trained, X):
+    return {name: X[name].to_numpy() for name in trained.feature_names if name not in BASE_FEATURES}
+
+
+def test_predict_proba_one_matches_sklearn(trained):
+    fast, X = trained.fast, trained.X
+    expected = sklearn_proba(trained, X)
+    velocity = velocity_of(trained, X)
+    for i, row in enumerate(X.itertuples(index=False)):
+        got = fast.predict_proba_one(row.amount, fast.location_code(row.location), row.hour, row.day_of_week,
+                                     row.is_weekend, {name: values[i] for name, values in velocity.items()})
+        assert np.array_equal(got, expected[i]), i
+
+
+def test_predict_proba_matches_sklearn(trained):
+    fast, X = trained.fast, trained.X
+    codes = [fast.location_code(location) for location in X['location']]
+    got = fast.predict_proba(X['amount'], codes, X['hour'], X['day_of_week'], X['is_weekend'], velocity_of(trained, X))
+    assert np.array_equal(got, sklearn_proba(trained, X))
+
+
+def test_unknown_locations_share_the_unknown_code(trained):
+    fast = trained.fast
+    assert fast.lookup_location('Atlantis') is None
+    assert fast.location_code('Atlantis') == fast.location_code('') == fast.unknown_location_code
+    assert trained.index.values[fast.unknown_location_code] == trained.index.encode(['Atlantis'])[0]
+
+
+@pytest.mark.parametrize('bad', [np.inf, -np.inf, 1e300], ids=['inf', '-inf', 'float32-overflow'])
+def test_infinite_amounts_are_rejected_like_sklearn(trained, bad):
+    fast, X = trained.fast, trained.X.iloc[:2].copy()
+    X['amount'] = [1.0, bad]
+    with pytest.raises(ValueError), np.errstate(over='ignore'):
+        sklearn_proba(trained, X)
+    codes = [fast.unknown_location_code] * 2
+    with pytest.raises(ValueError):
+        fast.predict_proba(X['amount'], codes, X['hour'], X['day_of_week'], X['is_weekend'], velocity_of(trained, X))
+    with pytest.raises(ValueError):
+        fast.predict_proba_one(bad, codes[0], 12, 0, 0)
+
+
+def test_missing_velocity_features_get_their_no_history_values(trained):
+    fast, X = trained.fast, trained.X.iloc[:50].copy()
+    X['amount'] = X['amount'].fillna(100.0)
+    for name in velocity_of(trained, X):
+        X[name] = VELOCITY_DEFAULTS[name]
+    expected = sklearn_proba(trained, X)
+    codes = [fast.location_code(location) for location in X['location']]
+    assert np.array_equal(fast.predict_proba(X['amount'], codes, X['hour'], X['day_of_week'], X['is_weekend']),
+                          expected)
+    for i, row in enumerate(X.itertuples(index=False)):
+        got = fast.predict_proba_one(row.amount, codes[i], row.hour, row.day_of_week, row.is_weekend, {})
+        assert np.array_equal(got, expected[i]), i
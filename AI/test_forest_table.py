@@ -0,0 +1,79 @@
+"""The compiled lookup table is exact on its whole grid: python -m pytest test_forest_table.py"""
+import contextlib
+import io
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from fast_model import FastForest
+from forest_table import DAYS, HOURS, compile_forest_table, verify_forest_table
+from model_store import Artifact, current_version, save_artifact
+from train import train_in_memory
+
+
+def train(velocity):
+    with contextlib.redirect_stdout(io.StringIO()):
+        model, scaler, index, feature_names, _, _ = train_in_memory(3000, 10, {}, velocity=velocity)
+    return SimpleNamespace(model=model, scaler=scaler, index=index, feature_names=feature_names)
+
+
+@pytest.fixture(scope='module')
+def trained():
+    """A small forest without velocity features and the table compiled from it"""
+    trained = train(velocity=False)
+    trained.table = compile_forest_table(trained.model, trained.scaler, trained.index, trained.feature_names)
+    return trained
+
+
+def grid(table, samples_per_combo, seed=0):
+    """Every (location id, hour, day_of_week) combination, with random amounts and NaN"""
+    combos = np.repeat(np.arange(len(table.locations.values) * HOURS * DAYS), samples_per_combo)
+    location, rest = np.divmod(combos, HOURS * DAYS)
+    hour, day = np.divmod(rest, DAYS)
+    amount = np.random.default_rng(seed).exponential(20000, len(combos))
+    amount[::samples_per_combo] = np.nan
+    return amount, location, hour, day, (day >= 5).astype(np.intp)
+
+
+def test_table_matches_predict_proba(trained):
+    assert trained.table.scores_missing
+    assert verify_forest_table(trained.table, trained.model, trained.scaler, trained.feature_names) == 0
+
+
+def test_table_matches_the_forest_on_the_grid(trained):
+    forest = FastForest.from_model_data({'model': trained.model, 'scaler': trained.scaler,
+                                         'location_index': trained.index, 'feature_names': trained.feature_names})
+    amount, location, hour, day, weekend = grid(trained.table, 5)
+    expected = forest.predict_proba(amount, location, hour, day, weekend)
+    assert np.array_equal(trained.table.predict_proba(amount, location, hour, day, weekend), expected)
+    for i in range(0, len(amount), 97):
+        assert np.array_equal(trained.table.predict_proba_one(amount[i], location[i], hour[i], day[i]), expected[i])
+
+
+def test_saved_table_loads_the_same(trained, tmp_path):
+    model_data = {'model': trained.model, 'scaler': trained.scaler, 'location_index': trained.index,
+                  'feature_names': trained.feature_names}
+    save_artifact(str(tmp_path), model_data, trained.table)
+    table = Artifact(str(tmp_path / current_version(str(tmp_path)))).table
+    amount, location, hour, day, weekend = grid(trained.table, 3, seed=1)
+    assert table.scores_missing
+    assert np.array_equal(table.predict_proba(amount, location, hour, day, weekend),
+                          trained.table.predict_proba(amount, location, hour, day, weekend))
+
+
+def test_velocity_forests_do_not_compile():
+    # The default feature set: such forests are served by FastForest, never by a table
+    trained = train(velocity=True)
+    with pytest.raises(ValueError):
+        compile_forest_table(trained.model, trained.scaler, trained.index, trained.feature_names)
+
+
+@pytest.mark.parametrize('bad', [np.inf, -np.inf, 1e300], ids=['inf', '-inf', 'float32-overflow'])
+def test_infinite_amounts_are_rejected(trained, bad):
+    # As predict_proba does: 1e300 is finite, but infinite once scaled to float32
+    with pytest.raises(ValueError):
+        trained.table.predict_proba_one(bad, 0, 12, 3)
+    with pytest.raises(ValueError):
+        trained.table.predict_proba(np.array([1.0, bad]), [0, 0], [12, 12], [3, 3])
+    assert trained.table.rejects([1.0, bad, np.nan]).tolist() == [False, True, False]
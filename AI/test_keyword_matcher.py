@@ -0,0 +1,106 @@
+"""The keyword matcher finds what the `in` scans it replaced found: python -m pytest test_keyword_matcher.py"""
+import random
+
+import pytest
+
+import app
+from description_analyzer import analyzer
+from keyword_matcher import KeywordMatcher
+
+DESCRIPTIONS = [
+    '',
+    'Dinner at a restaurant',
+    'URGENT: verify now to claim your prize',
+    'verify',                                # prefix of 'verify now' only
+    'please VERIFY NOWHERE',                 # both, 'verify now' inside a longer word
+    'act now or transfer to unknown account',
+    'Max hospital, maximum care',            # 'max' inside 'maximum'
+    'Apollo pharmacy medicine for eye drops',
+    'fire at the firestation, call police & ambulance',
+    'hotel near the airport, prime location',
+    'otp shared with a stranger, hotpot dinner',   # 'otp' inside 'hotpot'
+    'gift cardgift card western unionwestern union',
+    'Bitcoin cryptocurrency wire overseas',
+    'Sony LIV subscription and spotify',
+    'uberuber olaola',                       # repeats and keywords back to back
+    'cabauto',                               # two keywords with no gap between them
+    'ÜBER café Zürich — प्रीमियम prime',
+    'bill billion billing million',          # 'bill' inside 'billion'
+    'gas station gasoline',
+    'click hereclick here, limited time, expires today, last chance',
+]
+
+
+def old_keywords(text, keywords):
+    """The scan app.py and description_analyzer.py did before the matcher"""
+    text = text.lower()
+    return [keyword for keyword in keywords if keyword in text]
+
+
+def old_category(text, categories):
+    text = text.lower()
+    for category, keywords in categories.items():
+        if any(keyword in text for keyword in keywords):
+            return category
+    return None
+
+
+def random_descriptions(count, seed=0):
+    """Text glued together from keyword fragments, so keywords overlap, nest and break off"""
+    rng = random.Random(seed)
+    keywords = (app.SUSPICIOUS_KEYWORDS + app.EMERGENCY_SERVICES + analyzer.legitimate_keywords
+                + [keyword for words in app.SAFE_KEYWORDS.values() for keyword in words])
+    pieces = []
+    for keyword in keywords:
+        pieces.append(keyword)
+        pieces.append(keyword[:rng.randint(1, len(keyword))])
+        pieces.append(keyword[rng.randint(0, len(keyword) - 1):])
+    pieces += [' ', ' ', '-', 'a', 'e', 'n', 'o', 's', 't']
+    for _ in range(count):
+        text = ''.join(rng.choice(pieces) for _ in range(rng.randint(1, 12)))
+        yield text.upper() if rng.random() < 0.2 else text
+
+
+def test_classic_overlaps():
+    # Keywords that are prefixes and suffixes of each other, found only through failure links
+    words = ['he', 'she', 'his', 'hers', 'ab', 'abc', 'b', 'bc', 'cab']
+    matcher = KeywordMatcher({'words': words})
+    for text in ['ushers', 'ahishers', 'abc', 'xabcab', 'shis', 'h', '', 'HERS abcAB']:
+        assert matcher.scan(text).keywords('words') == old_keywords(text, words), text
+
+
+def test_duplicate_keywords_count_like_the_list():
+    matcher = KeywordMatcher({'words': ['now', 'act now', 'now']})
+    hits = matcher.scan('act now')
+    assert hits.count('words') == len(old_keywords('act now', ['now', 'act now', 'now'])) == 3
+
+
+def check_app_groups(text):
+    hits = app.keyword_matcher.scan(text)
+    assert hits.keywords('suspicious') == old_keywords(text, app.SUSPICIOUS_KEYWORDS)
+    assert hits.category('safe') == old_category(text, app.SAFE_KEYWORDS)
+    assert hits.any('emergency') == bool(old_keywords(text, app.EMERGENCY_SERVICES))
+    for category, keywords in app.SAFE_KEYWORDS.items():
+        assert hits.keywords('safe', category) == old_keywords(text, keywords)
+
+
+def check_analyzer_features(text):
+    expected = (len(old_keywords(text, analyzer.fraud_keywords)),
+                len(old_keywords(text, analyzer.legitimate_keywords)),
+                old_category(text, analyzer.merchant_categories) or 'unknown')
+    for hits in (None, app.keyword_matcher.scan(text)):  # its own scan, and the app's shared one
+        features = analyzer.extract_features(text, hits)
+        assert (features['fraud_keyword_count'], features['legit_keyword_count'],
+                features['category']) == expected
+
+
+@pytest.mark.parametrize('text', DESCRIPTIONS)
+def test_descriptions_match_the_substring_scans(text):
+    check_app_groups(text)
+    check_analyzer_features(text)
+
+
+def test_keyword_fragments_match_the_substring_scans():
+    for text in random_descriptions(3000):
+        check_app_groups(text)
+        check_analyzer_features(text)
@@ -0,0 +1,24 @@
+"""A model that shows up after a failed first load is picked up: python -m pytest test_model_store.py"""
+import os
+import shutil
+import time
+
+from model_store import ModelStore
+
+
+def test_watcher_clears_the_first_load_error(tmp_path):
+    root = str(tmp_path / 'models')
+    store = ModelStore(root=root, reload_interval=0.05)
+    assert not store.initial_load()
+    assert store.stats()['load_error'].startswith('FileNotFoundError')
+
+    shutil.copytree(os.environ['MODEL_DIR'], root)  # train.py finishes after the service started
+    assert store.model is None  # starts the watcher
+    deadline = time.monotonic() + 10
+    while not store.counts['reloads'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    stats = store.stats()
+    assert store.model is not None
+    assert stats['load_error'] is None
+    assert (stats['reloads'], stats['reload_errors']) == (1, 0)
@@ -0,0 +1,155 @@
+"""The rule table decides like the RULE 1-10 if/elif chain it replaced: python -m pytest test_rules.py"""
+import itertools
+
+import numpy as np
+import pytest
+
+from app import THRESHOLDS
+from rules import RULES, RuleEngine
+from sketches import AMOUNT_DEFAULTS
+
+AMOUNTS = [-5.0, 0.0, 500.0, 999.99, 1000.0, 3000.0, 3000.01, 5000.0, 5000.01, 10000.0, 10000.01,
+           25000.0, 25000.5, 50000.0, 50001.0, 100000.0, 100000.01, 200000.0, 250000.0]
+HOURS = [0, 4, 5, 12, 22, 23]
+CATEGORIES = [None, 'healthcare', 'transport', 'food', 'bills', 'education']
+SUSPICIOUS = [0, 1, 2, 3]
+# (is_fraud, fraud_score) as the model left them
+CONFIDENCES = [(False, 0.3), (False, 0.05), (True, 0.55), (True, 0.97)]
+# (user_amount_history, user_amount_percentile): none yet, too short, at and around the threshold
+USER_HISTORY = [(AMOUNT_DEFAULTS['user_amount_history'], AMOUNT_DEFAULTS['user_amount_percentile']),
+                (19, 1.0), (20, 0.99), (20, 0.985), (500, 1.0)]
+
+
+def old_rules(tx):
+    """The chain app.py ran before rules.py, with RULE 11 where the table puts it"""
+    amount, hour, suspicious_count = tx['amount'], tx['hour'], tx['suspicious_count']
+    safe_category, is_emergency = tx['safe_category'], tx['is_emergency']
+    is_fraud, fraud_score = tx['is_fraud'], tx['fraud_score']
+    late_night = hour < THRESHOLDS['LATE_NIGHT_END'] or hour > THRESHOLDS['EVENING_START']
+    reasons = []
+
+    if amount > THRESHOLDS['EXTREME_AMOUNT']:
+        is_fraud = True
+        fraud_score = max(fraud_score, THRESHOLDS['FRAUD_CONFIDENCE_HIGH'])
+        reasons.append(f"🚨 EXTREME AMOUNT: ₹{amount:,.2f} (> ₹2,00,000)")
+    elif amount > THRESHOLDS['VERY_HIGH_AMOUNT'] and late_night:
+        is_fraud = True
+        fraud_score = max(fraud_score, THRESHOLDS['FRAUD_CONFIDENCE_MEDIUM'])
+        reasons.append(f"🚨 Very high amount (₹{amount:,.2f}) during late night")
+    elif amount > THRESHOLDS['HIGH_AMOUNT'] and suspicious_count > 0:
+        is_fraud = True
+        fraud_score = max(fraud_score, THRESHOLDS['FRAUD_CONFIDENCE_MEDIUM'])
+        reasons.append(f"🚨 High amount + {suspicious_count} suspicious keyword(s)")
+    elif amount > THRESHOLDS['HIGH_AMOUNT'] and not tx['has_description']:
+        is_fraud = True
+        fraud_score = max(fraud_score, THRESHOLDS['FRAUD_CONFIDENCE_LOW'])
+        reasons.append("⚠️ High amount with no description")
+    elif amount > THRESHOLDS['MEDIUM_AMOUNT'] and late_night and suspicious_count > 0:
+        is_fraud = True
+        fraud_score = max(fraud_score, THRESHOLDS['FRAUD_CONFIDENCE_LOW'])
+        reasons.append("⚠️ Medium amount + late night + suspicious keywords")
+    elif (amount > THRESHOLDS['LOW_AMOUNT']
+          and tx['user_amount_history'] >= THRESHOLDS['USER_AMOUNT_MIN_HISTORY']
+          and tx['user_amount_percentile'] >= THRESHOLDS['USER_AMOUNT_PERCENTILE']):
+        is_fraud = True
+        fraud_score = max(fraud_score, THRESHOLDS['FRAUD_CONFIDENCE_LOW'])
+        reasons.append(f"⚠️ Unusual amount for this user: ₹{amount:,.2f}, "
+                       f"above {tx['user_amount_percentile']:.1%} of their past payments")
+
+    if safe_category == 'healthcare' or is_emergency:
+        if amount <= THRESHOLDS['HEALTHCARE_MAX_SAFE']:
+            is_fraud = False
+            fraud_score = min(fraud_score, 0.1)
+            reasons.append(f"✅ Genuine healthcare expense (₹{amount:,.2f})")
+        else:
+            is_fraud = True
+            fraud_score = max(fraud_score, 0.7)
+            reasons.append(f"🚨 Healthcare claim but amount too high: ₹{amount:,.2f}")
+    elif safe_category == 'transport':
+        if amount <= THRESHOLDS['TRANSPORT_MAX_SAFE']:
+            is_fraud = False
+            fraud_score = min(fraud_score, 0.1)
+            reasons.append("✅ Transport expense (cab/uber)")
+        else:
+            reasons.append("⚠️ Transport expense with unusually high amount")
+    elif safe_category == 'food':
+        if amount <= THRESHOLDS['FOOD_MAX_SAFE']:
+            is_fraud = False
+            fraud_score = min(fraud_score, 0.1)
+            reasons.append("✅ Food delivery expense")
+    elif safe_category == 'bills':
+        if amount <= THRESHOLDS['BILLS_MAX_SAFE']:
+            is_fraud = False
+            fraud_score = min(fraud_score, 0.15)
+            reasons.append("✅ Bill payment")
+
+    if suspicious_count >= 2:
+        is_fraud = True
+        fraud_score = max(fraud_score, 0.8)
+        reasons.append("🚨 Multiple suspicious keywords detected")
+
+    fraud_score = max(0, min(1, fraud_score))
+    if amount < 1000 and not is_fraud:
+        fraud_score = min(fraud_score, 0.1)
+    return is_fraud, fraud_score, reasons
+
+
+def transactions():
+    """Every combination of the grids above"""
+    for (amount, hour, category, is_emergency, suspicious_count, has_description,
+         (is_fraud, fraud_score), (history, percentile)) in itertools.product(
+            AMOUNTS, HOURS, CATEGORIES, [False, True], SUSPICIOUS, [False, True], CONFIDENCES, USER_HISTORY):
+        yield {
+            'amount': amount,
+            'hour': hour,
+            'has_description': has_description,
+            'suspicious_count': suspicious_count,
+            'safe_category': category,
+            'is_emergency': is_emergency,
+            'is_fraud': is_fraud,
+            'fraud_score': fraud_score,
+            'user_amount_history': history,
+            'user_amount_percentile': percentile
+        }
+
+
+@pytest.fixture(scope='module')
+def scalar():
+    """The grid through `evaluate`: the transactions and their (is_fraud, fraud_score, reasons)"""
+    engine = RuleEngine(RULES, THRESHOLDS)
+    grid, results = [], []
+    for tx in transactions():
+        grid.append(dict(tx))
+        reasons = []
+        engine.evaluate(tx, reasons)
+        results.append((tx['is_fraud'], tx['fraud_score'], reasons))
+    return grid, results
+
+
+def test_table_matches_the_chain(scalar):
+    grid, results = scalar
+    for tx, result in zip(grid, results):
+        assert result == old_rules(tx), tx
+
+
+def test_batch_matches_scalar(scalar):
+    grid, results = scalar
+    arrays = {field: np.array([tx[field] for tx in grid]) for field in grid[0] if field != 'safe_category'}
+    arrays['safe_category'] = np.array([tx['safe_category'] for tx in grid], dtype=object)
+    reasons = [[] for _ in grid]
+    RuleEngine(RULES, THRESHOLDS).evaluate_batch(arrays, reasons)
+    assert arrays['is_fraud'].tolist() == [result[0] for result in results]
+    assert arrays['fraud_score'].tolist() == [result[1] for result in results]
+    assert reasons == [result[2] for result in results]
+
+
+def test_unusual_amount_for_user_fires():
+    # RULE 11 needs enough history, a high percentile and more than LOW_AMOUNT
+    engine = RuleEngine(RULES, THRESHOLDS)
+    base = {'amount': 20000.0, 'hour': 12, 'has_description': True, 'suspicious_count': 0, 'safe_category': None,
+            'is_emergency': False, 'is_fraud': False, 'fraud_score': 0.3}
+    fired = {}
+    for history, percentile in USER_HISTORY:
+        tx = {**base, 'user_amount_history': history, 'user_amount_percentile': percentile}
+        fired[history, percentile] = [rule.name for rule in engine.evaluate(tx, []) if rule.group == 'amount']
+    assert fired == {(0, 0.5): [], (19, 1.0): [], (20, 0.99): ['RULE 11'], (20, 0.985): [], (500, 1.0): ['RULE 11']}
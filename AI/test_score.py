@@ -0,0 +1,39 @@
+"""Bad rows of an offline scoring file get error records, in order: python -m pytest test_score.py"""
+import json
+
+import pytest
+
+from score import read_chunks, score_chunks
+
+GOOD = {'amount': 1200.0, 'time': 1700000000000, 'location': 'Mumbai', 'description': 'Dinner at a restaurant'}
+
+LINES = [
+    json.dumps(GOOD),
+    '{"amount": 1200.0, "time": 1700000000000, "location": ',   # cut off mid-row
+    '',                                                          # blank lines are skipped
+    'not json at all',
+    json.dumps([GOOD]),
+    json.dumps({**GOOD, 'amount': 250000.0}),
+    json.dumps({'amount': 1.0, 'location': 'Mumbai'}),
+    '{"amount": NaN, "time": 1700000000000, "location": "Pune"}',
+    json.dumps(GOOD)[:-1] + ',}',
+]
+
+ERRORS = {1: 'Malformed JSON', 2: 'Malformed JSON', 3: 'Transaction must be a JSON object',
+          5: 'Missing required field: time', 7: 'Malformed JSON'}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 100])
+def test_malformed_lines_get_error_records(tmp_path, chunk_size):
+    path = tmp_path / 'transactions.jsonl'
+    path.write_text('\n'.join(LINES) + '\n', encoding='utf-8')
+    records = [record for chunk in score_chunks(read_chunks(str(path), 'jsonl', chunk_size), 1)
+               for record in chunk]
+
+    assert [record['index'] for record in records] == list(range(8))
+    for record in records:
+        if record['index'] in ERRORS:
+            assert record['error'].startswith(ERRORS[record['index']]), record
+        else:
+            assert 'error' not in record and 'fraud' in record, record
+    assert records[4]['fraud']  # the rows after a bad line are still scored
@@ -0,0 +1,56 @@
+"""Per-user amount sketches: python -m pytest test_sketches.py"""
+import json
+import math
+
+import numpy as np
+
+import app
+from sketches import BUCKETS, MAX_AMOUNT, AmountSketches, bucket, percentile
+
+TRANSACTION = {
+    'amount': math.inf,  # sent as 1e309, which JSON parsers read as infinity
+    'time': 1700000000000,
+    'location': 'Mumbai',
+    'description': 'Transfer'
+}
+
+
+def test_bucket_of_extreme_amounts():
+    assert bucket(math.nan) == bucket(-1.0) == bucket(0.5) == 0
+    assert bucket(MAX_AMOUNT) == bucket(1e300) == bucket(math.inf) == BUCKETS - 1
+
+
+def test_percentile_against_history():
+    store = AmountSketches(max_users=10)
+    for amount in (100, 200, 300, 400):
+        store.observe('u', amount)
+    features = store.observe('u', 250)
+    assert features['user_amount_history'] == 4
+    assert features['user_amount_percentile'] == 0.5
+    assert percentile(store.sketch('u'), 1e6) == 1.0
+    assert store.observe(None, 250) == {'user_amount_percentile': 0.5, 'user_amount_history': 0}
+
+
+def test_non_finite_amounts_are_not_recorded():
+    store = AmountSketches(max_users=10)
+    store.observe('u', 120.0)
+    before = store.sketch('u')
+    assert store.observe('u', math.inf)['user_amount_history'] == 1
+    assert store.observe('u', math.nan)['user_amount_history'] == 1
+    assert np.array_equal(store.sketch('u'), before)
+    assert store.stats()['not_finite'] == 2
+
+
+def test_infinite_amount_with_a_user_is_answered():
+    client = app.app.test_client()
+    payload = {**TRANSACTION, 'user_id': 'sketch-inf'}
+    response = client.post('/predict', data=json.dumps(payload).replace('Infinity', '1e309'),
+                           content_type='application/json')
+    assert response.status_code == 200
+    assert response.get_json()['degraded']
+
+    body = json.dumps([payload, {**payload, 'amount': 1200.0}]).replace('Infinity', '1e309')
+    response = client.post('/predict/batch', data=body, content_type='application/json')
+    assert response.status_code == 200
+    first, second = response.get_json()['results']
+    assert first['degraded'] and not second['degraded']
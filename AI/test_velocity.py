@@ -0,0 +1,39 @@
+"""Sliding-window velocity features: python -m pytest test_velocity.py"""
+import math
+
+import pytest
+
+from velocity import VELOCITY_DEFAULTS, VELOCITY_FEATURES, VelocityStore
+
+START = 1700000000000  # ms
+
+
+def test_features_describe_the_activity_before():
+    store = VelocityStore()
+    assert store.observe('u', 'Mumbai', 100.0, START) == VELOCITY_DEFAULTS
+    store.observe('u', 'Delhi', 250.0, START + 1000)
+    features = store.observe('u', 'Mumbai', 50.0, START + 2000)
+    assert features['user_count_1m'] == 2
+    assert features['user_amount_1m'] == 350.0
+    assert features['user_locations_1m'] == 2
+    assert features['location_count_1m'] == 1
+    assert features['user_amount_history'] == 2
+
+    # Past the 1m window, only the longer ones remember
+    features = store.observe('u', 'Mumbai', 50.0, START + 120000)
+    assert features['user_count_1m'] == 0
+    assert features['user_count_1h'] == 3
+
+
+@pytest.mark.parametrize('bad', [math.nan, math.inf, -math.inf])
+def test_non_finite_amounts_are_not_recorded(bad):
+    clean, store = VelocityStore(), VelocityStore()
+    for s in (clean, store):
+        s.observe('u', 'Mumbai', 100.0, START)
+    store.observe('u', 'Mumbai', bad, START + 1000)
+
+    expected = clean.observe('u', 'Mumbai', 200.0, START + 2000)
+    got = store.observe('u', 'Mumbai', 200.0, START + 2000)
+    assert got == expected
+    assert all(math.isfinite(got[name]) for name in VELOCITY_FEATURES)
+    assert store.counts['not_finite'] == 1
@@ -2,101 +2,525 @@ import numpy as np
 import pandas as pd
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler, LabelEncoder
-import pickle
+from sklearn.preprocessing import StandardScaler
+import argparse
+import contextlib
+import itertools
+import json
 import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
+from fast_model import FastForest
+from features import local_time_features
+from forest_table import TABLE_FEATURES, TABLE_MAX_LOCATIONS, compile_forest_table, verify_forest_table
+from locations import ENCODINGS, LocationIndex, count_locations
+from model_store import save_artifact
+from velocity import VELOCITY_FEATURES, replay
+
+# Locations with different risk profiles
+LOCATIONS = ['NY', 'LA', 'CHI', 'HOU', 'PHX', 'PHL', 'SA', 'SD', 'DAL', 'SJ']
+LOCATION_RISK = {'NY': 0.3, 'LA': 0.4, 'CHI': 0.2, 'HOU': 0.3, 'PHX': 0.2,
+                 'PHL': 0.3, 'SA': 0.2, 'SD': 0.1, 'DAL': 0.2, 'SJ': 0.1}
+
+def synthetic_locations(n_locations):
+    """LOCATIONS plus a long tail of made-up ones up to n_locations, with their fraud risk"""
+    names = LOCATIONS + [f'TOWN-{i:06d}' for i in range(len(LOCATIONS), n_locations)]
+    tail_risk = np.random.default_rng(7).uniform(0.0, 0.4, len(names) - len(LOCATIONS))
+    risk = np.concatenate([[LOCATION_RISK[name] for name in LOCATIONS], tail_risk])
+    return np.array(names), risk
 
 # Generate synthetic training data
-def generate_training_data(n_samples=10000):
-    np.random.seed(42)
-    
+def generate_training_data(n_samples=10000, seed=42, end_time=None, velocity=True, n_locations=len(LOCATIONS)):
+    """Synthetic transactions and fraud labels, fully vectorized
+
+    Pass the same end_time to get consistent chunks of one larger data set
+    (each with its own seed). The `location` column holds the raw names;
+    encode_locations() turns it into the model's location_code once a
+    LocationIndex is fitted. Past the ten LOCATIONS, n_locations adds a
+    long tail of towns whose traffic falls off with their rank, so most
+    of them are rare. With velocity, every transaction belongs to a
+    simulated user with a usual spend of their own, some users fire off
+    bursts of transactions, 1% of transactions are account takeovers
+    paying far more than the user usually does, and the velocity features
+    (velocity.py, the amount percentile included) are added as columns,
+    replayed in time order the way the service computes them.
+    """
+    rng = np.random.default_rng(seed)
+
     # Generate features
-    amounts = np.random.exponential(100, n_samples)
+    amounts = rng.exponential(100, n_samples)
     amounts = np.clip(amounts, 1, 10000)
-    
-    # Locations with different risk profiles
-    locations = ['NY', 'LA', 'CHI', 'HOU', 'PHX', 'PHL', 'SA', 'SD', 'DAL', 'SJ']
-    location_risk = {'NY': 0.3, 'LA': 0.4, 'CHI': 0.2, 'HOU': 0.3, 'PHX': 0.2,
-                     'PHL': 0.3, 'SA': 0.2, 'SD': 0.1, 'DAL': 0.2, 'SJ': 0.1}
-    
+
     # Times (in milliseconds since epoch, normalized)
-    current_time = datetime.now().timestamp() * 1000
-    times = np.random.uniform(current_time - 30*24*60*60*1000, current_time, n_samples)
-    
-    # Create location codes
-    location_encoder = LabelEncoder()
-    location_codes = location_encoder.fit_transform([np.random.choice(locations) for _ in range(n_samples)])
-    
+    if end_time is None:
+        end_time = datetime.now().timestamp() * 1000
+    times = rng.uniform(end_time - 30*24*60*60*1000, end_time, n_samples)
+
+    # Pick locations: the cities uniformly, or by rank with a long tail
+    names, risk = synthetic_locations(max(n_locations, len(LOCATIONS)))
+    if len(names) == len(LOCATIONS):
+        location_ids = rng.integers(len(names), size=n_samples)
+    else:
+        weights = 1.0 / np.arange(1, len(names) + 1)
+        location_ids = rng.choice(len(names), size=n_samples, p=weights / weights.sum())
+
+    # Users, ~40 transactions each over the month; 1% of transactions start a
+    # burst of 2-5 more by the same user within two minutes, anywhere
+    users = rng.integers(max(1, n_samples // 40), size=n_samples)
+    in_burst = np.zeros(n_samples, dtype=bool)
+    takeover = np.zeros(n_samples, dtype=bool)
+    if velocity:
+        sizes = rng.integers(3, 7, size=n_samples // 100)
+        burst = np.repeat(np.arange(len(sizes)), sizes)[:n_samples]
+        first = np.concatenate([[0], np.cumsum(sizes)[:-1]])[:len(sizes)]
+        users[:len(burst)] = users[first][burst]
+        times[:len(burst)] = times[first][burst] + rng.uniform(0, 120_000, len(burst))
+        in_burst[:len(burst)] = True
+        in_burst[first] = False
+
+        # Each user's usual spend scales their amounts; takeovers pay 5-20x that
+        spend = rng.lognormal(0, 0.75, users.max() + 1)
+        takeover = rng.random(n_samples) < 0.01
+        amounts = np.clip(amounts * spend[users] * np.where(takeover, rng.uniform(5, 20, n_samples), 1), 1, 10000)
+
+    hour, day_of_week = local_time_features(times)
+
     # Generate fraud labels based on rules
-    labels = []
-    for i in range(n_samples):
-        fraud_prob = 0.05  # base fraud rate
-        
-        # High amount increases fraud probability
-        if amounts[i] > 500:
-            fraud_prob += 0.2
-        if amounts[i] > 1000:
-            fraud_prob += 0.3
-            
-        # Location affects fraud probability
-        location = location_encoder.inverse_transform([location_codes[i]])[0]
-        fraud_prob += location_risk.get(location, 0.1)
-        
-        # Time features (late night transactions are riskier)
-        hour = datetime.fromtimestamp(times[i] / 1000).hour
-        if hour < 6 or hour > 23:
-            fraud_prob += 0.15
-            
-        labels.append(1 if np.random.random() < min(fraud_prob, 0.95) else 0)
-    
+    fraud_prob = np.full(n_samples, 0.05)  # base fraud rate
+
+    # High amount increases fraud probability
+    fraud_prob += 0.2 * (amounts > 500)
+    fraud_prob += 0.3 * (amounts > 1000)
+
+    # Location affects fraud probability
+    fraud_prob += risk[location_ids]
+
+    # Time features (late night transactions are riskier)
+    fraud_prob += 0.15 * ((hour < 6) | (hour > 23))
+
+    # Rapid follow-ups in a burst are mostly fraud
+    fraud_prob += 0.5 * in_burst
+
+    # So are payments far above what the user usually pays
+    fraud_prob += 0.5 * takeover
+
+    labels = (rng.random(n_samples) < np.minimum(fraud_prob, 0.95)).astype(np.int64)
+
     # Create feature matrix
     X = pd.DataFrame({
         'amount': amounts,
-        'location_code': location_codes,
-        'hour': [datetime.fromtimestamp(t / 1000).hour for t in times],
-        'day_of_week': [datetime.fromtimestamp(t / 1000).weekday() for t in times],
-        'is_weekend': [1 if datetime.fromtimestamp(t / 1000).weekday() >= 5 else 0 for t in times]
+        'location': names[location_ids],
+        'hour': hour,
+        'day_of_week': day_of_week,
+        'is_weekend': (day_of_week >= 5).astype(np.int64)
     })
-    
-    return X, np.array(labels), location_encoder
-
-print("Generating training data...")
-X, y, location_encoder = generate_training_data(20000)
-
-# Split the data
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-# Scale features
-scaler = StandardScaler()
-X_train_scaled = scaler.fit_transform(X_train)
-X_test_scaled = scaler.transform(X_test)
-
-print("Training Random Forest model...")
-# Train Random Forest model
-model = RandomForestClassifier(
-    n_estimators=100,
-    max_depth=10,
-    random_state=42,
-    n_jobs=-1
-)
-model.fit(X_train_scaled, y_train)
-
-# Evaluate model
-train_score = model.score(X_train_scaled, y_train)
-test_score = model.score(X_test_scaled, y_test)
-
-print(f"Training accuracy: {train_score:.3f}")
-print(f"Test accuracy: {test_score:.3f}")
-
-# Save model and preprocessors
-print("Saving model and preprocessors...")
-with open('model.pkl', 'wb') as f:
-    pickle.dump({
-        'model': model,
-        'scaler': scaler,
-        'location_encoder': location_encoder,
-        'feature_names': X.columns.tolist()
-    }, f)
-
-print("Model training complete!")
\ No newline at end of file
+    if velocity:
+        features = replay(users.tolist(), names[location_ids].tolist(), amounts.tolist(), times.tolist())
+        for name in VELOCITY_FEATURES:
+            X[name] = features[name]
+
+    return X, labels
+
+def encode_locations(X, location_index):
+    """X with its raw `location` column replaced by the encoded location_code, in the same place"""
+    X = X.rename(columns={'location': 'location_code'})
+    X['location_code'] = location_index.encode(X['location_code'].tolist())
+    return X
+
+# ============================================
+# PHASE TIMING AND MEMORY
+# ============================================
+
+def _reset_peak_rss():
+    """Restart the kernel's peak-RSS counter so each phase reports its own peak (Linux only)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+def _peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # peak since start
+
+@contextlib.contextmanager
+def phase(name, report):
+    """Time a training phase and record its wall time and peak RSS in report"""
+    _reset_peak_rss()
+    start = time.perf_counter()
+    yield
+    report[name] = {'wall_s': round(time.perf_counter() - start, 3), 'peak_rss_mb': round(_peak_rss_mb(), 1)}
+    print(f"⏱️ {name}: {report[name]['wall_s']:.2f}s, peak RSS {report[name]['peak_rss_mb']:.0f} MB")
+
+# ============================================
+# TRAINING
+# ============================================
+
+def new_model(n_estimators, max_depth=10, n_jobs=-1, **params):
+    return RandomForestClassifier(
+        n_estimators=n_estimators,
+        max_depth=max_depth,
+        random_state=42,
+        n_jobs=n_jobs,
+        **params
+    )
+
+def train_in_memory(n_samples, n_estimators, report, velocity=True, params=None, locations=None):
+    """Generate everything, split 80/20, scale and fit in one go
+
+    locations holds the LocationIndex.fit options (plus n_locations for
+    the generator); the index is fitted on the training rows only, so
+    target encoding never sees a test label.
+    """
+    locations = dict(locations or {})
+    with phase('generate', report):
+        print("Generating training data...")
+        X, y = generate_training_data(n_samples, velocity=velocity,
+                                      n_locations=locations.pop('n_locations', len(LOCATIONS)))
+
+        # Split the data
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+        location_index = LocationIndex.fit(X_train['location'].tolist(), y_train, **locations)
+        X_train, X_test = encode_locations(X_train, location_index), encode_locations(X_test, location_index)
+
+    with phase('scale', report):
+        # Scale features
+        scaler = StandardScaler()
+        X_train_scaled = scaler.fit_transform(X_train)
+        X_test_scaled = scaler.transform(X_test)
+
+    with phase('train', report):
+        print("Training Random Forest model...")
+        # Train Random Forest model
+        model = new_model(n_estimators, **(params or {}))
+        model.fit(X_train_scaled, y_train)
+
+    with phase('evaluate', report):
+        # Evaluate model
+        train_score = model.score(X_train_scaled, y_train)
+        test_score = model.score(X_test_scaled, y_test)
+
+    return model, scaler, location_index, X_train.columns.tolist(), train_score, test_score
+
+def train_chunked(n_samples, chunk_size, n_estimators, report, velocity=True, test_size=0.2, params=None,
+                  locations=None):
+    """Out-of-core training: the data set is never held in memory at once
+
+    Chunks are regenerated from their own seeds on every pass instead of
+    being stored: one pass counts locations for the LocationIndex, one fits
+    the scaler incrementally, one grows the forest with warm_start (each
+    chunk trains its share of the trees on its own rows), one scores the
+    model. The last test_size of every chunk is held out for testing. With
+    more chunks than trees, each chunk still gets one tree, so the forest
+    grows to one tree per chunk.
+    """
+    locations = dict(locations or {})
+    n_locations = locations.pop('n_locations', len(LOCATIONS))
+    end_time = datetime.now().timestamp() * 1000
+    n_chunks = -(-n_samples // chunk_size)
+    location_index = None
+
+    def chunks():
+        for i in range(n_chunks):
+            size = min(chunk_size, n_samples - i * chunk_size)
+            X, y = generate_training_data(size, seed=(42, i), end_time=end_time, velocity=velocity,
+                                          n_locations=n_locations)
+            if location_index is not None:
+                X = encode_locations(X, location_index)
+            split = int(size * (1 - test_size))
+            yield X[:split], y[:split], X[split:], y[split:]
+
+    print(f"Training on {n_samples} samples in {n_chunks} chunks of up to {chunk_size}...")
+    with phase('locations', report):
+        counts = {}
+        for X_train, y_train, _, _ in chunks():
+            count_locations(X_train['location'].tolist(), y_train, counts)
+        location_index = LocationIndex.from_counts(counts, **locations)
+
+    with phase('scale', report):
+        scaler = StandardScaler()
+        for X_train, _, _, _ in chunks():
+            scaler.partial_fit(X_train)
+
+    with phase('train', report):
+        model = new_model(0, warm_start=True, **(params or {}))
+        for i, (X_train, y_train, _, _) in enumerate(chunks()):
+            trees = max(1, n_estimators * (i + 1) // n_chunks - n_estimators * i // n_chunks)
+            model.n_estimators += trees
+            model.fit(scaler.transform(X_train), y_train)
+
+    with phase('evaluate', report):
+        correct = {'train': 0, 'test': 0}
+        total = {'train': 0, 'test': 0}
+        for X_train, y_train, X_test, y_test in chunks():
+            for split, X, y in (('train', X_train, y_train), ('test', X_test, y_test)):
+                if len(y):
+                    correct[split] += int((model.predict(scaler.transform(X)) == y).sum())
+                    total[split] += len(y)
+
+    feature_names = X_train.columns.tolist()
+    return (model, scaler, location_index, feature_names,
+            correct['train'] / max(total['train'], 1), correct['test'] / max(total['test'], 1))
+
+# ============================================
+# HYPERPARAMETER SEARCH
+# ============================================
+
+# Candidate values per RandomForestClassifier parameter; the search tries their cross product
+SEARCH_GRID = {
+    'max_depth': [6, 8, 10, 14],
+    'min_samples_leaf': [1, 5, 20],
+    'max_features': ['sqrt', 0.5]
+}
+
+_search_data = {}  # per pool worker: the memory-mapped arrays and the preprocessors
+
+def _init_search_worker(data_dir, scaler, location_index, feature_names):
+    for name in ('X_fit', 'y_fit', 'X_val', 'y_val'):
+        _search_data[name] = np.load(os.path.join(data_dir, f'{name}.npy'), mmap_mode='r')
+    _search_data.update(scaler=scaler, location_index=location_index, feature_names=feature_names)
+
+def evaluate_candidate(params, max_trees, step, deadline, patience=2, min_delta=0.001, latency_rows=500):
+    """Grow one configuration step trees at a time until the validation score plateaus
+
+    Returns its best validation accuracy, the number of trees it took, and
+    the single-row latency and size of that forest as the service would
+    run it (FastForest).
+    """
+    data = _search_data
+    if time.time() >= deadline:
+        return {'params': params, 'status': 'skipped'}
+    start = time.perf_counter()
+    model = new_model(0, warm_start=True, n_jobs=1, **params)
+    history, best, best_trees, stale, status = [], -1.0, 0, 0, 'max_trees'
+    while model.n_estimators < max_trees:
+        model.n_estimators = min(model.n_estimators + step, max_trees)
+        model.fit(data['X_fit'], data['y_fit'])
+        score = float(model.score(data['X_val'], data['y_val']))
+        history.append([model.n_estimators, round(score, 4)])
+        if score > best + min_delta:
+            best, best_trees, stale = score, model.n_estimators, 0
+        else:
+            stale += 1
+            if stale >= patience:
+                status = 'plateau'
+                break
+        if time.time() >= deadline:
+            status = 'budget'
+            break
+    fit_seconds = time.perf_counter() - start
+
+    # The trees past the best score only cost latency: keep the first best_trees
+    model.estimators_ = model.estimators_[:best_trees]
+    model.n_estimators = best_trees
+    forest = FastForest.from_model_data({'model': model, 'scaler': data['scaler'],
+                                         'location_index': data['location_index'],
+                                         'feature_names': data['feature_names']})
+    # Best of a few passes per row, so time slices lost to the other workers don't count
+    rows = np.array(data['X_val'][:latency_rows])
+    times = np.empty((3, len(rows)))
+    for attempt in range(3):
+        for i, row in enumerate(rows):
+            t0 = time.perf_counter()
+            forest.predict_proba_scaled(row)
+            times[attempt, i] = time.perf_counter() - t0
+    times = times.min(axis=0)
+    return {
+        'params': params,
+        'status': status,
+        'trees': best_trees,
+        'val_accuracy': round(best, 4),
+        'fit_s': round(fit_seconds, 2),
+        'latency_p50_us': round(float(np.percentile(times, 50)) * 1e6, 1),
+        'latency_p99_us': round(float(np.percentile(times, 99)) * 1e6, 1),
+        'size_bytes': int(sum(array.nbytes for array in forest.arrays().values())),
+        'depth': int(forest.depth),
+        'history': history
+    }
+
+def pick_candidate(results, tolerance):
+    """The fastest candidate whose accuracy is within tolerance of the best one"""
+    done = [r for r in results if r['status'] != 'skipped']
+    if not done:
+        return None
+    best = max(r['val_accuracy'] for r in done)
+    good = [r for r in done if r['val_accuracy'] >= best - tolerance]
+    return min(good, key=lambda r: (r['latency_p50_us'], r['size_bytes']))
+
+def search(n_samples, max_trees, report, velocity=True, grid=None, step=10, budget=300.0, jobs=None,
+           tolerance=0.005, locations=None):
+    """Evaluate the grid in a process pool, within budget seconds; (chosen candidate, all results)
+
+    The rows train_in_memory holds out for testing stay out: a quarter of
+    the rest is the validation set. The scaled arrays are written once to
+    .npy files that every worker memory-maps read-only, so they are shared
+    through the page cache instead of being pickled to each process.
+    """
+    grid = grid or SEARCH_GRID
+    candidates = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+    locations = dict(locations or {})
+    with phase('search.generate', report):
+        X, y = generate_training_data(n_samples, velocity=velocity,
+                                      n_locations=locations.pop('n_locations', len(LOCATIONS)))
+        X_train, _, y_train, _ = train_test_split(X, y, test_size=0.2, random_state=42)
+        X_fit, X_val, y_fit, y_val = train_test_split(X_train, y_train, test_size=0.25, random_state=42)
+        location_index = LocationIndex.fit(X_fit['location'].tolist(), y_fit, **locations)
+        X_fit, X_val = encode_locations(X_fit, location_index), encode_locations(X_val, location_index)
+        scaler = StandardScaler().fit(X_fit)
+
+    results = []
+    deadline = time.time() + budget
+    print(f"Searching {len(candidates)} configurations, up to {max_trees} trees in steps of {step}, "
+          f"{budget:g}s budget...")
+    with phase('search', report), tempfile.TemporaryDirectory() as data_dir:
+        arrays = {'X_fit': scaler.transform(X_fit), 'y_fit': y_fit,
+                  'X_val': scaler.transform(X_val), 'y_val': y_val}
+        for name, array in arrays.items():
+            # float32 is what the trees are fitted on, so sklearn uses the mapping without a copy
+            np.save(os.path.join(data_dir, f'{name}.npy'),
+                    array.astype(np.float32) if name.startswith('X') else array)
+        with ProcessPoolExecutor(jobs, initializer=_init_search_worker,
+                                 initargs=(data_dir, scaler, location_index, X_fit.columns.tolist())) as pool:
+            futures = [pool.submit(evaluate_candidate, params, max_trees, step, deadline) for params in candidates]
+            for future in as_completed(futures):
+                r = future.result()
+                results.append(r)
+                if r['status'] == 'skipped':
+                    print(f"   {r['params']}: skipped, budget spent")
+                else:
+                    print(f"   {r['params']}: accuracy {r['val_accuracy']:.4f} with {r['trees']} trees "
+                          f"({r['status']}), p50 {r['latency_p50_us']:.0f} µs, {r['size_bytes'] / 1e6:.2f} MB")
+
+    chosen = pick_candidate(results, tolerance)
+    if chosen is None:
+        print("⚠️ Budget spent before any configuration was evaluated: keeping the defaults")
+        return None, results
+    print(f"🏁 Chosen: {chosen['params']} with {chosen['trees']} trees "
+          f"(accuracy {chosen['val_accuracy']:.4f}, p50 {chosen['latency_p50_us']:.0f} µs)")
+    return chosen, results
+
+def parse_search_grid(specs):
+    """SEARCH_GRID with --search-grid NAME=V1,V2 applied; values are JSON (null for None) or plain strings"""
+    def value(text):
+        try:
+            return json.loads(text)
+        except ValueError:
+            return text
+
+    grid = dict(SEARCH_GRID)
+    for spec in specs or []:
+        name, _, values = spec.partition('=')
+        grid[name.strip()] = [value(v) for v in values.split(',')]
+    return grid
+
+def build_forest_table(model, scaler, location_index, feature_names, report):
+    """Compile the forest into an exact lookup table for serving; velocity
+    features are continuous, and the table grows with every location, so
+    those forests are served by walking the trees"""
+    if set(feature_names) != TABLE_FEATURES:
+        print("Lookup table skipped: the forest uses velocity features")
+        return None
+    if len(location_index.values) > TABLE_MAX_LOCATIONS:
+        print(f"Lookup table skipped: {len(location_index)} locations (at most {TABLE_MAX_LOCATIONS} compile)")
+        return None
+    with phase('compile', report):
+        print("Compiling forest lookup table...")
+        forest_table = compile_forest_table(model, scaler, location_index, feature_names)
+        mismatches = verify_forest_table(forest_table, model, scaler, feature_names)
+        if mismatches:
+            raise RuntimeError(f"Lookup table differs from predict_proba on {mismatches} rows")
+        print(f"Lookup table: {len(forest_table.breaks)} breakpoints, {forest_table.nbytes / 1e6:.1f} MB, exact on the full grid")
+    return forest_table
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train the fraud model and save a new artifact version')
+    parser.add_argument('--samples', type=int, default=20000, help='training samples (default 20000)')
+    parser.add_argument('--chunk-size', type=int, default=0,
+                        help='generate and train in chunks of this many samples (default 0: all in memory)')
+    parser.add_argument('--trees', type=int, default=100, help='trees in the forest (default 100)')
+    parser.add_argument('--models-dir', default='models', help='artifact directory (default models)')
+    parser.add_argument('--no-velocity', dest='velocity', action='store_false',
+                        help='leave out the velocity and user amount features; the forest then compiles to a lookup table')
+    parser.add_argument('--search', action='store_true',
+                        help='pick max_depth, min_samples_leaf, ... and the number of trees (up to --trees) first')
+    parser.add_argument('--search-grid', action='append', metavar='NAME=V1,V2,...',
+                        help='candidate values of a RandomForestClassifier parameter (default SEARCH_GRID)')
+    parser.add_argument('--search-step', type=int, default=10, help='trees added per search step (default 10)')
+    parser.add_argument('--budget', type=float, default=300, help='wall-clock seconds for the search (default 300)')
+    parser.add_argument('--jobs', type=int, default=None, help='search processes (default: one per core)')
+    parser.add_argument('--tolerance', type=float, default=0.005,
+                        help='accuracy below the best a faster candidate may give up (default 0.005)')
+    parser.add_argument('--search-output', help='write every candidate\'s results to this JSON file')
+    parser.add_argument('--location-encoding', choices=ENCODINGS, default='target',
+                        help='location_code feature: smoothed fraud rate, traffic share, or plain id (default target)')
+    parser.add_argument('--min-location-count', type=int, default=20,
+                        help='locations seen less often share the unseen locations\' value (default 20)')
+    parser.add_argument('--location-smoothing', type=float, default=20.0,
+                        help='pseudo-transactions at the overall fraud rate per location (default 20)')
+    parser.add_argument('--locations', type=int, default=len(LOCATIONS),
+                        help='distinct locations in the synthetic data, a long tail past the 10 cities (default 10)')
+    args = parser.parse_args(argv)
+    locations = {'encoding': args.location_encoding, 'min_count': args.min_location_count,
+                 'smoothing': args.location_smoothing, 'n_locations': args.locations}
+
+    report = {}
+    start = time.perf_counter()
+    params, trees, searched = None, args.trees, None
+    if args.search:
+        chosen, results = search(args.samples, args.trees, report, args.velocity, parse_search_grid(args.search_grid),
+                                 args.search_step, args.budget, args.jobs, args.tolerance, locations)
+        if chosen is not None:
+            params, trees = chosen['params'], chosen['trees']
+            searched = {'candidates': len(results), 'chosen': {k: v for k, v in chosen.items() if k != 'history'}}
+        if args.search_output:
+            with open(args.search_output, 'w') as f:
+                json.dump({'chosen': chosen, 'results': results}, f, indent=2)
+            print(f"Search results saved to {args.search_output}")
+
+    if args.chunk_size and args.chunk_size < args.samples:
+        model, scaler, location_index, feature_names, train_score, test_score = train_chunked(
+            args.samples, args.chunk_size, trees, report, args.velocity, params=params, locations=locations)
+    else:
+        model, scaler, location_index, feature_names, train_score, test_score = train_in_memory(
+            args.samples, trees, report, args.velocity, params=params, locations=locations)
+
+    print(f"Training accuracy: {train_score:.3f}")
+    print(f"Test accuracy: {test_score:.3f}")
+    print(f"Locations: {len(location_index)} indexed, {location_index.encoding} encoding")
+
+    forest_table = build_forest_table(model, scaler, location_index, feature_names, report)
+
+    # Save model and preprocessors as a new versioned artifact; a running service picks it up
+    with phase('save', report):
+        print("Saving model and preprocessors...")
+        version = save_artifact(args.models_dir, {
+            'model': model,
+            'scaler': scaler,
+            'location_index': location_index,
+            'feature_names': feature_names
+        }, forest_table, metadata={
+            'samples': args.samples,
+            'locations': {**location_index.stats(), **locations},
+            'chunk_size': args.chunk_size,
+            'velocity': args.velocity,
+            'params': {'n_estimators': trees, 'max_depth': 10, **(params or {})},
+            'search': searched,
+            'train_accuracy': train_score,
+            'test_accuracy': test_score,
+            'phases': report
+        })
+        print(f"Saved {args.models_dir}/{version}")
+
+    print(f"Model training complete! ({time.perf_counter() - start:.1f}s)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+"""Per-user and per-location velocity features over sliding time windows
+
+Every key (a user id, or a location) keeps, per window, a ring of time
+buckets with running totals, so recording a transaction and reading the
+features are both O(1): moving the window forward only clears the
+buckets that fell out of it, never more than the ring holds. Windows
+slide in whole buckets, so a "1h" window covers between 55 and 60
+minutes of history. Distinct locations per user are counted with a
+reference count per location across the live buckets.
+
+The user's amount percentile against their own history (sketches.py) is
+served along with the windows, as two more features.
+
+Features always describe the activity *before* the transaction being
+scored, and time is the transaction's own timestamp, so replaying the
+same stream (train.py does) gives the same features as serving it. A
+transaction with a NaN or infinite amount gets its features but is not
+recorded: it would keep the user's amount sums at NaN for a whole window.
+
+The store lives in one process. Under serve.py each worker keeps its own
+view of the traffic it handled, so route by user to the same worker for
+exact per-user counts.
+"""
+import atexit
+import math
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from sketches import AMOUNT_DEFAULTS, AMOUNT_FEATURES, AmountSketches, amount_sketches
+
+# Window name -> (length in seconds, buckets in the ring)
+WINDOWS = {
+    '1m': (60, 12),
+    '1h': (3600, 12),
+    '24h': (86400, 24)
+}
+
+VELOCITY_FEATURES = [f'{kind}_{window}' for window in WINDOWS
+                     for kind in ('user_count', 'user_amount', 'user_locations', 'location_count')] + AMOUNT_FEATURES
+
+# Values of features that are missing, as observe() gives them for a transaction without history
+VELOCITY_DEFAULTS = {**{name: 0 for name in VELOCITY_FEATURES}, **AMOUNT_DEFAULTS}
+
+# Window name -> its feature names, in the order above
+_FEATURE_NAMES = {window: VELOCITY_FEATURES[4 * i:4 * i + 4] for i, window in enumerate(WINDOWS)}
+
+class SlidingWindow:
+    """Count, sum and (optionally) distinct keys over a ring of time buckets"""
+
+    __slots__ = ('bucket_seconds', 'counts', 'sums', 'members', 'refs', 'head', 'count', 'total')
+
+    def __init__(self, seconds, n_buckets, distinct=False):
+        self.bucket_seconds = seconds / n_buckets
+        self.counts = [0] * n_buckets
+        self.sums = [0.0] * n_buckets
+        self.members = [None] * n_buckets if distinct else None  # set of keys per bucket, made on demand
+        self.refs = {} if distinct else None  # key -> number of live buckets holding it
+        self.head = None                      # absolute index of the newest bucket
+        self.count = 0
+        self.total = 0.0
+
+    def _advance(self, bucket):
+        """Make `bucket` the newest one, clearing the ones that slid out"""
+        head = self.head
+        if head is not None and bucket <= head:
+            return
+        n = len(self.counts)
+        if head is None or bucket - head >= n:
+            # The whole ring slid out (the usual case for a quiet key): start over
+            if self.count:
+                self.counts = [0] * n
+                self.sums = [0.0] * n
+                if self.members is not None:
+                    self.members = [None] * n
+                    self.refs = {}
+            self.count = 0
+            self.total = 0.0
+        else:
+            for b in range(head + 1, bucket + 1):
+                slot = b % n
+                if not self.counts[slot]:
+                    continue
+                self.count -= self.counts[slot]
+                self.total -= self.sums[slot]
+                self.counts[slot] = 0
+                self.sums[slot] = 0.0
+                if self.members is not None:
+                    for key in self.members[slot]:
+                        self.refs[key] -= 1
+                        if not self.refs[key]:
+                            del self.refs[key]
+                    self.members[slot] = None
+            if not self.count:
+                self.total = 0.0  # no float residue once the window is empty
+        self.head = bucket
+
+    def add(self, seconds, amount, key=None):
+        bucket = int(seconds // self.bucket_seconds)
+        self._advance(bucket)
+        if self.head - bucket >= len(self.counts):
+            return  # older than the window
+        slot = bucket % len(self.counts)
+        self.counts[slot] += 1
+        self.sums[slot] += amount
+        self.count += 1
+        self.total += amount
+        if self.members is not None:
+            members = self.members[slot]
+            if members is None:
+                members = self.members[slot] = set()
+            if key not in members:
+                members.add(key)
+                self.refs[key] = self.refs.get(key, 0) + 1
+
+    def read(self, seconds):
+        """(count, sum, distinct keys) of the window ending at `seconds`"""
+        self._advance(int(seconds // self.bucket_seconds))
+        return self.count, self.total, len(self.refs) if self.refs is not None else 0
+
+
+class KeyWindows:
+    """All windows of one key, plus when it was last seen"""
+
+    __slots__ = ('windows', 'last_seen')
+
+    def __init__(self, distinct=False):
+        self.windows = {name: SlidingWindow(seconds, n, distinct) for name, (seconds, n) in WINDOWS.items()}
+        self.last_seen = 0.0
+
+
+class VelocityStore:
+    """Sliding-window counters keyed by user and by location
+
+    Memory is bounded: at most `max_keys` users and `max_keys` locations
+    are kept (least recently seen go first), and keys idle for longer than
+    the longest window are dropped, since all their windows are empty.
+    `snapshot()` / `restore()` persist the state across restarts. The
+    amount sketches are a store of their own, with their own bounds and
+    snapshot.
+    """
+
+    def __init__(self, max_keys=100000, idle_seconds=None, snapshot_path=None, sketches=None):
+        self.max_keys = max_keys
+        self.sketches = AmountSketches(max_users=max_keys) if sketches is None else sketches
+        self.idle_seconds = idle_seconds or max(seconds for seconds, _ in WINDOWS.values())
+        self.snapshot_path = snapshot_path
+        self.users = OrderedDict()
+        self.locations = OrderedDict()
+        self.now = 0.0
+        self.counts = {'observed': 0, 'not_finite': 0, 'evicted_idle': 0, 'evicted_lru': 0}
+        self._lock = threading.Lock()
+        if snapshot_path:
+            atexit.register(self._snapshot_at_exit)
+
+    @classmethod
+    def from_env(cls):
+        """Configure from VELOCITY_MAX_KEYS and VELOCITY_SNAPSHOT (restored if it exists)"""
+        store = cls(
+            max_keys=int(os.environ.get('VELOCITY_MAX_KEYS', 100000)),
+            snapshot_path=os.environ.get('VELOCITY_SNAPSHOT') or None,
+            sketches=amount_sketches
+        )
+        if store.snapshot_path and os.path.exists(store.snapshot_path):
+            store.restore()
+        return store
+
+    def _get(self, table, key, distinct):
+        entry = table.get(key)
+        if entry is None:
+            entry = table[key] = KeyWindows(distinct)
+            if len(table) > self.max_keys:
+                table.popitem(last=False)
+                self.counts['evicted_lru'] += 1
+        else:
+            table.move_to_end(key)
+        entry.last_seen = self.now
+        return entry
+
+    def _evict_idle(self, table):
+        # Least recently seen keys sit at the front
+        while table:
+            entry = next(iter(table.values()))
+            if self.now - entry.last_seen <= self.idle_seconds:
+                break
+            table.popitem(last=False)
+            self.counts['evicted_idle'] += 1
+
+    def observe(self, user_id, location, amount, timestamp):
+        """Features of the activity before this transaction, then record it
+
+        timestamp is in milliseconds, like /predict's `time`; without a
+        user_id the user features are 0 (the amount percentile 0.5) and
+        only the location is recorded. A NaN or infinite amount is not
+        recorded at all.
+        """
+        seconds = timestamp / 1000
+        record = math.isfinite(amount)
+        features = {}
+        with self._lock:
+            self.now = max(self.now, seconds)
+            self.counts['observed'] += 1
+            if not record:
+                self.counts['not_finite'] += 1
+
+            user = self._get(self.users, user_id, True) if user_id is not None else None
+            place = self._get(self.locations, location, False)
+            for name, window in place.windows.items():
+                if user is not None:
+                    user_window = user.windows[name]
+                    count, total, distinct = user_window.read(seconds)
+                    if record:
+                        user_window.add(seconds, amount, location)
+                else:
+                    count, total, distinct = 0, 0.0, 0
+                user_count, user_amount, user_locations, location_count = _FEATURE_NAMES[name]
+                features[user_count] = count
+                features[user_amount] = total
+                features[user_locations] = distinct
+                features[location_count] = window.read(seconds)[0]
+                if record:
+                    window.add(seconds, amount)
+
+            self._evict_idle(self.users)
+            self._evict_idle(self.locations)
+        features.update(self.sketches.observe(user_id, amount))
+        return features
+
+    def snapshot(self, path=None):
+        """Write the whole store to path (default snapshot_path), atomically"""
+        path = path or self.snapshot_path
+        with self._lock:
+            state = pickle.dumps({'format': 1, 'windows': WINDOWS, 'now': self.now,
+                                  'users': self.users, 'locations': self.locations})
+        tmp = f'{path}.tmp-{os.getpid()}'
+        with open(tmp, 'wb') as f:
+            f.write(state)
+        os.replace(tmp, path)
+
+    def _snapshot_at_exit(self):
+        # Only processes that scored something: a pre-fork master exiting after its
+        # workers must not overwrite their snapshots with its empty state
+        if self.counts['observed']:
+            self.snapshot()
+
+    def restore(self, path=None):
+        """Load a snapshot; one taken with different WINDOWS is ignored"""
+        with open(path or self.snapshot_path, 'rb') as f:
+            state = pickle.load(f)
+        if state.get('format') != 1 or state.get('windows') != WINDOWS:
+            print("⚠️ Velocity snapshot ignored: window configuration changed")
+            return False
+        with self._lock:
+            self.now = state['now']
+            self.users = state['users']
+            self.locations = state['locations']
+        return True
+
+    def stats(self):
+        return {
+            'users': len(self.users),
+            'locations': len(self.locations),
+            'max_keys': self.max_keys,
+            **self.counts,
+            'amount_sketches': self.sketches.stats()
+        }
+
+def replay(user_ids, locations, amounts, timestamps):
+    """Velocity features of every transaction of a history, as arrays in input order
+
+    Transactions are fed to a fresh store in time order, the way the
+    service would have seen them.
+    """
+    n = len(timestamps)
+    store = VelocityStore(max_keys=n + 1)
+    features = {name: np.zeros(n) for name in VELOCITY_FEATURES}
+    for i in np.argsort(timestamps, kind='stable'):
+        for name, value in store.observe(user_ids[i], locations[i], amounts[i], timestamps[i]).items():
+            features[name][i] = value
+    return features
+
+# Create global instance
+velocity_store = VelocityStore.from_env()
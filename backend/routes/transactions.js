@@ -45,7 +45,8 @@ router.post('/', [
                 amount: parseFloat(amount),
                 location,
                 time: new Date(time).getTime(),
-                description
+                description,
+                user_id: String(req.user._id)
             });
             
             console.log('AI Response:', aiResponse.data);